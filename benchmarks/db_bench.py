@@ -0,0 +1,425 @@
+# benchmarks/db_bench.py
+"""Нагрузочный тест слоя БД (database/database.py) на синтетических данных.
+
+Скрипт строит синтетическую базу заданного масштаба (генерация детерминирована
+по --seed; готовая база сохраняется в --data-dir, по умолчанию во временном
+каталоге, и переиспользуется следующими прогонами), затем вызывает каждую публичную функцию database.py с заданной параллельностью
+и печатает JSON с задержками p50/p95/p99 и числом операций в секунду:
+
+    python -m benchmarks.db_bench --scale small --concurrency 8 --output before.json
+    python -m benchmarks.db_bench --scale small --concurrency 8 --compare before.json
+
+Масштабы: small - 1 тыс. учеников и 100 тыс. ответов, large - 100 тыс. учеников
+и 10 млн ответов. Замеры идут на прогретых кэшах, как в работающем боте:
+перед ними загружаются индекс задач и рейтинг, аналитика по классу догоняет
+лог, расписание напоминаний заполняется, а для функций рассылки создается
+задание. log_user_action меряется вместе с очередью записи, а время ее
+дозаписи выводится отдельно (action_queue_drain_seconds). Тяжелые операции
+(создание рассылки, импорт пачки задач, загрузки при старте) выполняются не
+больше OPS_LIMITS раз.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import aiosqlite
+
+from database import database as db
+from database.migrations import name_search_key
+from database.reminders import reminder_scheduler
+from database.stats import rebuild_user_section_stats, rebuild_user_activity
+
+SCALES = {
+    'small': {'students': 1_000, 'answers': 100_000, 'sections': 10, 'tasks_per_section': 100},
+    'large': {'students': 100_000, 'answers': 10_000_000, 'sections': 20, 'tasks_per_section': 500},
+}
+
+# Первый telegram_id синтетических учеников; новые ученики из add_user идут после них
+TELEGRAM_ID_BASE = 10_000_000
+ACTION_TYPES = ('answered',) * 8 + ('hint_used', 'viewed_solution')
+INSERT_CHUNK = 100_000
+# Операции, которые пишут строку на каждого ученика или читают всю таблицу, - столько вызовов максимум
+OPS_LIMITS = {
+    'load_task_index': 20,
+    'load_leaderboard': 20,
+    'sync_reminders (startup)': 20,
+    'create_broadcast_job': 20,
+    'add_tasks_bulk': 50,
+    'regrade_answers': 200,
+    'regrade_answers (check)': 200,
+}
+BULK_TASKS = 20  # задач в одной пачке add_tasks_bulk
+REMINDER_BATCH = 50  # учеников в одной пачке напоминаний
+
+
+def _percentile(latencies, p):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- Синтетическая база ---
+
+def _answer_rows(rng, scale, task_ids):
+    start = datetime(2024, 1, 1)
+    step = 365 * 24 * 3600 / scale['answers']  # ответы равномерно за год, по возрастанию времени
+    for i in range(scale['answers']):
+        action_type = rng.choice(ACTION_TYPES)
+        is_correct = rng.random() < 0.6 if action_type == 'answered' else (False if action_type == 'viewed_solution' else None)
+        yield (
+            rng.randrange(scale['students']) + 1,
+            rng.choice(task_ids),
+            str(rng.randrange(100)) if action_type == 'answered' else None,
+            is_correct,
+            (start + timedelta(seconds=i * step)).strftime('%Y-%m-%d %H:%M:%S'),
+            action_type,
+        )
+
+
+def _fill(path, scale, seed):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    students = (
+        (TELEGRAM_ID_BASE + i, name, name_search_key(name), '2024-01-01 00:00:00')
+        for i in range(scale['students'])
+        for name in [f"{rng.choice(('Иван', 'Мария', 'Петр', 'Анна', 'Олег'))} Ученик{i}"]
+    )
+    conn.executemany(
+        "INSERT INTO users (telegram_id, full_name, name_search, registration_date) VALUES (?, ?, ?, ?)", students
+    )
+    conn.executemany("INSERT INTO sections (name) VALUES (?)", [(f"Раздел {i + 1}",) for i in range(scale['sections'])])
+    task_ids = []
+    for section_id in range(1, scale['sections'] + 1):
+        for _ in range(scale['tasks_per_section']):
+            task_type = rng.choice(('multiple_choice', 'text_input'))
+            cursor = conn.execute(
+                "INSERT INTO tasks (section_id, task_type, photo_file_id, hint_text, solution_data, solution_type) "
+                "VALUES (?, ?, 'photo', 'Подсказка', 'Решение', 'text')",
+                (section_id, task_type)
+            )
+            task_id = cursor.lastrowid
+            task_ids.append(task_id)
+            if task_type == 'multiple_choice':
+                conn.executemany(
+                    "INSERT INTO task_choices (task_id, choice_text, is_correct) VALUES (?, ?, ?)",
+                    [(task_id, str(i), i == 0) for i in range(4)]
+                )
+            else:
+                conn.execute("INSERT INTO task_text_answers (task_id, correct_answer) VALUES (?, 1.5)", (task_id,))
+    conn.commit()
+
+    rows = _answer_rows(rng, scale, task_ids)
+    while True:
+        chunk = [row for _, row in zip(range(INSERT_CHUNK), rows)]
+        if not chunk:
+            break
+        conn.executemany(
+            "INSERT INTO user_answers (user_id, task_id, answer_given, is_correct, timestamp, action_type) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            chunk
+        )
+        conn.commit()
+    conn.close()
+
+
+async def build_database(path, scale, seed):
+    """Создает схему штатными create_tables/миграциями, заливает данные и пересобирает сводки."""
+    tmp_path = path + ".building"
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(tmp_path + suffix):
+            os.remove(tmp_path + suffix)
+    db.DB_NAME = tmp_path
+    await db.create_tables()
+    _fill(tmp_path, scale, seed)
+    async with aiosqlite.connect(tmp_path) as conn:
+        await rebuild_user_section_stats(conn)
+        await rebuild_user_activity(conn)
+        await conn.commit()
+        await conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        await conn.execute("ANALYZE")
+        await conn.commit()
+    os.replace(tmp_path, path)
+
+
+async def prepare_database(data_dir, scale_name, scale, seed, rebuild=False):
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(
+        data_dir,
+        f"bench_{scale_name}_{scale['students']}u_{scale['answers']}a_{scale['sections']}x{scale['tasks_per_section']}_s{seed}.db"
+    )
+    build_seconds = None
+    if rebuild or not os.path.exists(path):
+        started = time.perf_counter()
+        await build_database(path, scale, seed)
+        build_seconds = round(time.perf_counter() - started, 2)
+    # Каждый прогон работает с копией, чтобы записи предыдущего не влияли на следующий
+    run_path = path + ".run"
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(run_path + suffix):
+            os.remove(run_path + suffix)
+    with sqlite3.connect(path) as src, sqlite3.connect(run_path) as dst:
+        src.backup(dst)
+    return run_path, build_seconds
+
+
+# --- Операции ---
+
+async def setup(scale):
+    """Готовит состояние, в котором работает бот. Возвращает (id задания рассылки, {этап: секунды})."""
+    timings = {}
+    started = time.perf_counter()
+    await db.load_task_index()
+    await db.load_leaderboard()
+    timings['load_seconds'] = round(time.perf_counter() - started, 3)
+    started = time.perf_counter()
+    while await db.refresh_cohort_stats():
+        pass
+    timings['cohort_catch_up_seconds'] = round(time.perf_counter() - started, 3)
+    await db.sync_reminders()
+    job_id, _ = await db.create_broadcast_job(1, 1, 1, None)
+    return job_id, timings
+
+
+def operations(scale, job_id):
+    """Имя -> фабрика корутины от генератора случайных чисел. Аргументы - как у обработчиков бота.
+    job_id - задание рассылки из setup() для функций рассылки."""
+    students = scale['students']
+    sections = scale['sections']
+    tasks = sections * scale['tasks_per_section']
+    new_users = itertools.count(TELEGRAM_ID_BASE + students)
+
+    def student(rng):
+        return TELEGRAM_ID_BASE + rng.randrange(students)
+
+    def task(rng):
+        return rng.randrange(tasks) + 1
+
+    def section(rng):
+        return rng.randrange(sections) + 1
+
+    def some_students(rng, count=REMINDER_BATCH):
+        return [student(rng) for _ in range(count)]
+
+    async def answer(rng):
+        await db.log_user_action(student(rng), task(rng), 'answered', answer_given='1', is_correct=rng.random() < 0.6)
+
+    def new_task(section_key, section_value):
+        return {
+            section_key: section_value, 'type': 'multiple_choice', 'photo': 'photo', 'hint': 'Подсказка',
+            'solution_data': 'Решение', 'solution_type': 'text',
+            'correct_choice': '1', 'incorrect_choices': ['2', '3', '4'],
+        }
+
+    def bulk_tasks(rng):
+        batch = []
+        for _ in range(BULK_TASKS):
+            item = new_task('section', f"Раздел {section(rng)}")
+            if rng.random() < 0.5:
+                item.update(type='text_input', text_answer=1.5)
+            batch.append(item)
+        return batch
+
+    async def full_reminder_sync():
+        reminder_scheduler.synced_until = None  # как при старте: все, кому еще может прийти напоминание
+        await db.sync_reminders()
+
+    def broadcast_results(rng):
+        # Изредка "заблокировал бота" - unblock_user ниже снимает эти пометки
+        return [(telegram_id, 'blocked' if rng.random() < 0.05 else 'sent') for telegram_id in some_students(rng)]
+
+    def reminder_results(rng):
+        return [(rng.randrange(students) + 1, '2024-01-01 00:00:00', 1) for _ in range(REMINDER_BATCH)]
+
+    return {
+        'get_user': lambda rng: db.get_user(student(rng)),
+        'get_identity': lambda rng: db.get_identity(student(rng)),
+        'add_user': lambda rng: db.add_user(next(new_users), "Новый Ученик"),
+        'get_sections_catalog': lambda rng: db.get_sections_catalog(),
+        'get_sections': lambda rng: db.get_sections(),
+        'get_random_task_by_section': lambda rng: db.get_random_task_by_section(section(rng)),
+        'get_user_progress': lambda rng: db.get_user_progress(student(rng)),
+        'get_next_task': lambda rng: db.get_next_task(section(rng), student(rng)),
+        'get_task': lambda rng: db.get_task(task(rng)),
+        'get_task_choices': lambda rng: db.get_task_choices(task(rng)),
+        'get_task_text_answer': lambda rng: db.get_task_text_answer(task(rng)),
+        'get_task_hint': lambda rng: db.get_task_hint(task(rng)),
+        'get_task_solution': lambda rng: db.get_task_solution(task(rng)),
+        'get_choice_is_correct': lambda rng: db.get_choice_is_correct(task(rng), rng.randrange(tasks * 4) + 1),
+        'take_next_task': lambda rng: db.take_next_task(section(rng), student(rng)),
+        'log_user_action': answer,
+        'get_user_statistics': lambda rng: db.get_user_statistics(student(rng)),
+        'get_student_last_answers': lambda rng: db.get_student_last_answers(student(rng)),
+        'get_students_page (new)': lambda rng: db.get_students_page('new'),
+        'get_students_page (active)': lambda rng: db.get_students_page('active'),
+        'get_students_page (accuracy)': lambda rng: db.get_students_page('accuracy'),
+        'get_students_page (next page)': lambda rng: db.get_students_page('active', after_id=rng.randrange(students) + 1),
+        'get_students_page (search)': lambda rng: db.get_students_page('new', query=rng.choice(('иван', 'мар', 'ученик1'))),
+        'get_all_user_ids': lambda rng: db.get_all_user_ids(),
+        'load_task_index': lambda rng: db.load_task_index(),
+        'add_new_task': lambda rng: db.add_new_task(new_task('section_id', section(rng))),
+        'add_tasks_bulk': lambda rng: db.add_tasks_bulk(bulk_tasks(rng)),
+        'load_leaderboard': lambda rng: db.load_leaderboard(),
+        'get_leaderboard': lambda rng: db.get_leaderboard(student(rng)),
+        'get_leaderboard (section)': lambda rng: db.get_leaderboard(student(rng), section(rng)),
+        'refresh_cohort_stats': lambda rng: db.refresh_cohort_stats(),
+        'get_cohort_sections': lambda rng: db.get_cohort_sections(),
+        'get_cohort_tasks': lambda rng: db.get_cohort_tasks(),
+        'get_cohort_tasks (section)': lambda rng: db.get_cohort_tasks(section(rng), hardest=False),
+        'regrade_answers (check)': lambda rng: db.regrade_answers([task(rng)], check_only=True),
+        'regrade_answers': lambda rng: db.regrade_answers([task(rng)]),
+        'sync_reminders': lambda rng: db.sync_reminders(),
+        'sync_reminders (startup)': lambda rng: full_reminder_sync(),
+        'get_reminder_recipients': lambda rng: db.get_reminder_recipients(some_students(rng)),
+        'save_reminder_results': lambda rng: db.save_reminder_results(reminder_results(rng), []),
+        'create_broadcast_job': lambda rng: db.create_broadcast_job(1, 1, 1, None),
+        'get_broadcast_job': lambda rng: db.get_broadcast_job(job_id),
+        'get_unfinished_broadcast_jobs': lambda rng: db.get_unfinished_broadcast_jobs(),
+        'get_broadcast_pending_recipients': lambda rng: db.get_broadcast_pending_recipients(job_id),
+        'get_broadcast_progress': lambda rng: db.get_broadcast_progress(job_id),
+        'save_broadcast_results': lambda rng: db.save_broadcast_results(job_id, broadcast_results(rng)),
+        'unblock_user': lambda rng: db.unblock_user(student(rng)),
+        'finish_broadcast_job': lambda rng: db.finish_broadcast_job(job_id),
+    }
+
+
+async def measure(name, factory, ops, concurrency, seed):
+    rng = random.Random(f"{seed}:{name}")
+    latencies = []
+    remaining = ops
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            await factory(rng)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "ops": len(latencies),
+        "seconds": round(elapsed, 3),
+        "ops_per_second": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 0.50), 3),
+        "p95_ms": round(_percentile(latencies, 0.95), 3),
+        "p99_ms": round(_percentile(latencies, 0.99), 3),
+    }
+
+
+async def run(args):
+    scale = dict(SCALES[args.scale])
+    for key in ('students', 'answers', 'sections', 'tasks_per_section'):
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+    path, build_seconds = await prepare_database(args.data_dir, args.scale, scale, args.seed, args.rebuild)
+
+    db.DB_NAME = path
+    await db.init_pool()
+    # База из --data-dir могла быть собрана до новых миграций - догоняем схему, как бот при старте
+    await db.create_tables()
+    job_id, setup_timings = await setup(scale)
+    await db.start_action_queue()
+    results = {}
+    try:
+        selected = operations(scale, job_id)
+        if args.only:
+            selected = {name: f for name, f in selected.items() if any(part in name for part in args.only)}
+        for name, factory in selected.items():
+            ops = min(args.ops, OPS_LIMITS.get(name, args.ops))
+            if args.warmup:
+                await measure(name, factory, min(args.warmup, ops), args.concurrency, args.seed + 1)
+            results[name] = await measure(name, factory, ops, args.concurrency, args.seed)
+    finally:
+        started = time.perf_counter()
+        await db.stop_action_queue()
+        drain_seconds = round(time.perf_counter() - started, 3)
+        await db.close_pool()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "scale": args.scale,
+            **scale,
+            "seed": args.seed,
+            "ops": args.ops,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "build_seconds": build_seconds,
+            **setup_timings,
+            "action_queue_drain_seconds": drain_seconds,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline):
+    """Отношение метрик текущего прогона к базовому: < 1 для задержек и > 1 для ops/s - стало лучше."""
+    diff = {}
+    for name, metrics in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old:
+            continue
+        diff[name] = {
+            key: round(metrics[key] / old[key], 3) if old[key] else None
+            for key in ("ops_per_second", "p50_ms", "p95_ms", "p99_ms")
+        }
+    return diff
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест слоя БД на синтетических данных")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--students", type=int, help="переопределить число учеников в масштабе")
+    parser.add_argument("--answers", type=int, help="переопределить число ответов в масштабе")
+    parser.add_argument("--sections", type=int, help="переопределить число разделов")
+    parser.add_argument("--tasks-per-section", dest="tasks_per_section", type=int, help="переопределить число задач в разделе")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--ops", type=int, default=2000, help="вызовов каждой функции")
+    parser.add_argument("--warmup", type=int, default=200, help="вызовов для прогрева перед замером")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--only", nargs="*", help="мерить только функции, в имени которых есть одна из подстрок")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "physics_bot_bench"),
+                        help="где хранить синтетические базы")
+    parser.add_argument("--rebuild", action="store_true", help="пересоздать синтетическую базу")
+    parser.add_argument("--output", help="записать JSON в файл, а не только вывести")
+    parser.add_argument("--compare", help="JSON прошлого прогона - добавить отношения метрик к нему")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        result["compare"] = {"baseline_commit": baseline.get("meta", {}).get("commit"), "ratios": compare(result, baseline)}
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
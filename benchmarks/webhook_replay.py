@@ -0,0 +1,87 @@
+# benchmarks/webhook_replay.py
+"""Проигрывает записанные апдейты на локальный webhook-эндпоинт бота.
+
+Апдейты записываются ботом в любом режиме, если задан RECORD_UPDATES_FILE
+(по одному JSON на строку). Затем бот запускается с BOT_MODE=webhook, пустым
+WEBHOOK_URL и любым WEBHOOK_SECRET, а этот скрипт шлет ему апдейты с тем же секретом:
+
+    python -m benchmarks.webhook_replay updates.jsonl --secret local --concurrency 20 --repeat 5
+
+Скрипт печатает задержку HTTP-ответа и пропускную способность. Время самой
+обработки апдейтов бот пишет в лог (UpdateTimingMiddleware) в обоих режимах -
+по этим строкам и сравниваются polling и webhook.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import aiohttp
+
+
+def load_updates(path, repeat):
+    with open(path, encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    # update_id должен расти, иначе повторные апдейты выглядят как дубликаты
+    result = []
+    for i in range(repeat * len(updates)):
+        update = dict(updates[i % len(updates)])
+        update["update_id"] = i + 1
+        result.append(update)
+    return result
+
+
+async def replay(url, secret, updates, concurrency):
+    queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(update)
+    latencies = []
+    errors = 0
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret}
+
+    async def worker(session):
+        nonlocal errors
+        while True:
+            try:
+                update = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            async with session.post(url, json=update, headers=headers) as response:
+                await response.read()
+                if response.status != 200:
+                    errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+
+    return {
+        "updates": len(updates),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "updates_per_second": round(len(updates) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(0.50), 2),
+        "p95_ms": round(percentile(0.95), 2),
+        "p99_ms": round(percentile(0.99), 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Проигрывание записанных апдейтов на webhook")
+    parser.add_argument("updates", help="файл с апдейтами, один JSON на строку")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", required=True, help="значение WEBHOOK_SECRET бота")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=1, help="сколько раз проиграть файл")
+    args = parser.parse_args()
+
+    result = asyncio.run(replay(args.url, args.secret, load_updates(args.updates, args.repeat), args.concurrency))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
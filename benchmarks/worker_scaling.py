@@ -0,0 +1,254 @@
+# benchmarks/worker_scaling.py
+"""Пропускная способность бота в зависимости от числа воркеров (BOT_WORKERS).
+
+Для каждого значения --workers скрипт запускает bot.py отдельным процессом в
+режиме webhook на копии синтетической базы из benchmarks/db_bench.py. Вместо
+api.telegram.org бот ходит в заглушку Bot API, поднятую этим же скриптом
+(TELEGRAM_API_URL), а апдейты - нажатия кнопок учениками - скрипт шлет на
+webhook-эндпоинт. Апдейт считается обработанным, когда бот ответил на
+callback-запрос (answerCallbackQuery), так что замер идет от отправки первого
+апдейта до обработки последнего, а не до HTTP-ответа фронта:
+
+    python -m benchmarks.worker_scaling --workers 1 2 4 --updates 5000
+
+1 воркер - обычный однопроцессный режим. Скрипт печатает JSON с апдейтами
+в секунду и ускорением относительно первого значения --workers. Заглушка Bot API
+работает в одном процессе и сама может стать пределом на тысячах апдейтов в секунду.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import aiohttp
+from aiohttp import web
+
+# config.py требует эти переменные уже при импорте database
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+os.environ.setdefault("ADMIN_ID", "1")
+
+from benchmarks.db_bench import SCALES, TELEGRAM_ID_BASE, prepare_database, _git_commit  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOT_ID = 123456
+WEBHOOK_SECRET = "bench"
+
+
+class FakeBotApi:
+    """Заглушка Bot API: на любой метод отвечает правдоподобным результатом и считает ответы на callback."""
+
+    def __init__(self):
+        self.calls = 0
+        self.answered = 0
+        self._target = None
+        self._done = asyncio.Event()
+
+    def expect(self, answered):
+        """Сбросить счетчик и ждать answered ответов на callback-запросы."""
+        self.answered = 0
+        self._target = answered
+        self._done.clear()
+
+    async def wait(self, timeout):
+        await asyncio.wait_for(self._done.wait(), timeout)
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        await request.read()
+        self.calls += 1
+        if method == "getMe":
+            result = {"id": BOT_ID, "is_bot": True, "first_name": "bench"}
+        elif method.startswith(("send", "edit")):
+            result = {"message_id": 1, "date": int(time.time()), "chat": {"id": 1, "type": "private"}}
+        else:
+            result = True
+        if method == "answerCallbackQuery":
+            self.answered += 1
+            if self._target is not None and self.answered >= self._target:
+                self._done.set()
+        return web.json_response({"ok": True, "result": result})
+
+
+def make_updates(count, scale, rng, first_id):
+    """Нажатия кнопок меню случайными учениками синтетической базы."""
+    actions = ["my_stats", "leaderboard", "solve_tasks", "main_menu", "next_task"]
+    updates = []
+    for i in range(count):
+        telegram_id = TELEGRAM_ID_BASE + rng.randrange(scale['students'])
+        if rng.random() < 0.4:
+            data = f"section_{rng.randint(1, scale['sections'])}"
+        else:
+            data = rng.choice(actions)
+        user = {"id": telegram_id, "is_bot": False, "first_name": "Ученик"}
+        updates.append({
+            "update_id": first_id + i,
+            "callback_query": {
+                "id": str(first_id + i),
+                "from": user,
+                "chat_instance": str(telegram_id),
+                "data": data,
+                "message": {
+                    "message_id": 1, "date": int(time.time()),
+                    "chat": {"id": telegram_id, "type": "private"},
+                    "from": {"id": BOT_ID, "is_bot": True, "first_name": "bench"},
+                    "text": "Меню",
+                },
+            },
+        })
+    return updates
+
+
+async def send(url, updates, concurrency):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET}
+    queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(update)
+
+    async def sender(session):
+        while not queue.empty():
+            update = queue.get_nowait()
+            async with session.post(url, json=update, headers=headers) as response:
+                await response.read()
+
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(sender(session) for _ in range(concurrency)))
+
+
+async def wait_listening(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"бот завершился с кодом {process.returncode}")
+            try:
+                async with session.get(url) as response:
+                    await response.read()
+                return
+            except aiohttp.ClientError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError("бот не начал принимать апдейты")
+
+
+async def run_one(args, workers, db_path, api, api_url, scale, rng):
+    work_dir = tempfile.mkdtemp(prefix=f"worker_scaling_{workers}_")
+    shutil.copy(db_path, os.path.join(work_dir, "physics_bot.db"))
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        BOT_MODE="webhook", WEBHOOK_URL="", WEBHOOK_HOST="127.0.0.1", WEBHOOK_PORT=str(args.port),
+        WEBHOOK_SECRET=WEBHOOK_SECRET,
+        BOT_WORKERS=str(workers), TELEGRAM_API_URL=api_url,
+        METRICS_PORT="0", TIMING_REPORT_INTERVAL="3600", COHORT_REFRESH_INTERVAL="0",
+    )
+    log = open(os.path.join(work_dir, "bot.log"), "w")
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "bot.py")], cwd=work_dir, env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{args.port}/webhook"
+    try:
+        await wait_listening(url, process)
+        # Прогрев: заодно дожидаемся, пока все воркеры поднимутся и прочитают индексы
+        warmup = make_updates(args.warmup, scale, rng, 1)
+        api.expect(len(warmup))
+        await send(url, warmup, args.concurrency)
+        await api.wait(args.timeout)
+
+        updates = make_updates(args.updates, scale, rng, len(warmup) + 1)
+        api.expect(len(updates))
+        calls_before = api.calls
+        started = time.perf_counter()
+        await send(url, updates, args.concurrency)
+        await api.wait(args.timeout)
+        elapsed = time.perf_counter() - started
+        return {
+            "workers": workers,
+            "updates": len(updates),
+            "seconds": round(elapsed, 3),
+            "updates_per_second": round(len(updates) / elapsed, 1),
+            "api_calls_per_update": round((api.calls - calls_before) / len(updates), 2),
+        }
+    finally:
+        process.terminate()
+        try:
+            process.wait(30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+        if process.returncode not in (0, -15) or args.keep:
+            print(f"лог бота: {work_dir}/bot.log", file=sys.stderr)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+async def run(args):
+    scale = dict(SCALES[args.scale])
+    path, build_seconds = await prepare_database(args.data_dir, args.scale, scale, args.seed)
+
+    api = FakeBotApi()
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.api_port).start()
+    api_url = f"http://127.0.0.1:{args.api_port}"
+
+    results = []
+    try:
+        for workers in args.workers:
+            rng = random.Random(args.seed)
+            results.append(await run_one(args, workers, path, api, api_url, scale, rng))
+    finally:
+        await runner.cleanup()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    base = results[0]["updates_per_second"] if results else 0
+    for result in results:
+        result["speedup"] = round(result["updates_per_second"] / base, 2) if base else None
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "scale": args.scale,
+            **scale,
+            "seed": args.seed,
+            "updates": args.updates,
+            "concurrency": args.concurrency,
+            "cpus": os.cpu_count(),
+            "python": platform.python_version(),
+            "build_seconds": build_seconds,
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пропускная способность бота в зависимости от числа воркеров")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--updates", type=int, default=5000, help="апдейтов в замере")
+    parser.add_argument("--warmup", type=int, default=500, help="апдейтов для прогрева")
+    parser.add_argument("--concurrency", type=int, default=64, help="одновременных HTTP-запросов к боту")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8181, help="порт webhook бота")
+    parser.add_argument("--api-port", type=int, default=8182, help="порт заглушки Bot API")
+    parser.add_argument("--timeout", type=float, default=300, help="сколько ждать обработки всех апдейтов, с")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "physics_bot_bench"),
+                        help="где хранить синтетические базы")
+    parser.add_argument("--keep", action="store_true", help="не удалять рабочие каталоги с логами бота")
+    parser.add_argument("--output", help="записать JSON в файл, а не только вывести")
+    args = parser.parse_args()
+
+    text = json.dumps(asyncio.run(run(args)), ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
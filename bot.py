@@ -1,32 +1,240 @@
 # bot.py
 import asyncio
 import logging
+import signal
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 
-from config import BOT_TOKEN
-from database.database import create_tables
+from config import (
+    BOT_TOKEN, BOT_MODE,
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT,
+    WEBHOOK_MAX_CONNECTIONS, WEBHOOK_CONCURRENCY,
+    TIMING_REPORT_INTERVAL, RECORD_UPDATES_FILE,
+    METRICS_HOST, METRICS_PORT,
+    BOT_WORKERS, WORKER_QUEUE_SIZE, LEADERBOARD_RELOAD_INTERVAL, TELEGRAM_API_URL,
+    ADMIN_ID, THROTTLE_RATE, THROTTLE_BURST, THROTTLE_ANSWER_RATE, THROTTLE_ANSWER_BURST
+)
+from database.database import (
+    create_tables, init_pool, close_pool, load_task_index, load_leaderboard,
+    start_action_queue, stop_action_queue,
+    start_cohort_refresher, stop_cohort_refresher
+)
+from database.fsm_storage import SQLiteStorage, FSMFlushMiddleware
+from middlewares.concurrency import ConcurrencyLimitMiddleware
+from middlewares.metrics import UpdateMetricsMiddleware, HandlerMetricsMiddleware, TelegramApiMetricsMiddleware
+from middlewares.throttling import ThrottlingMiddleware
+from middlewares.timing import UpdateTimingMiddleware
+from services.broadcast import resume_jobs, stop_jobs
+from services.metrics import start_metrics_server, stop_metrics_server
+from services.reminders import start_reminders, stop_reminders
+from services.workers import WorkerPool, serve_worker, poll_updates, create_front_app
 from handlers import user_handlers, admin_handlers # Пока только пользовательские
 
 # Включаем логирование, чтобы видеть в консоли, что происходит
 logging.basicConfig(level=logging.INFO)
 
-async def main():
-    # Инициализация бота и диспетчера
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage()) # FSM будет хранить состояния в памяти
+def create_bot():
+    # Свой Bot API сервер (или заглушка в benchmarks/worker_scaling.py) вместо api.telegram.org
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+    return Bot(token=BOT_TOKEN, session=session)
 
-    # Создаем таблицы в БД при старте
-    await create_tables()
+async def set_webhook(bot: Bot, dispatcher: Dispatcher):
+    if not WEBHOOK_URL:
+        # Локальный запуск: апдейты присылаем на эндпоинт сами (benchmarks/webhook_replay.py)
+        logging.info("WEBHOOK_URL не задан, webhook в Telegram не регистрируется")
+        return
+    await bot.set_webhook(
+        url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+        drop_pending_updates=True
+    )
+
+async def remove_webhook(bot: Bot):
+    if WEBHOOK_URL:
+        await bot.delete_webhook()
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """Принимает апдейты через aiohttp на WEBHOOK_HOST:WEBHOOK_PORT вместо long polling."""
+    dp.update.outer_middleware(ConcurrencyLimitMiddleware(WEBHOOK_CONCURRENCY))
+    dp.startup.register(set_webhook)
+    dp.shutdown.register(remove_webhook)
+
+    app = web.Application()
+    # Запросы без правильного X-Telegram-Bot-Api-Secret-Token отклоняются
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    # startup/shutdown диспетчера привязываются к жизненному циклу приложения
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    logging.info("Webhook-сервер слушает %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await bot.session.close()
+
+def setup_dispatcher(dp: Dispatcher, bot: Bot, storage: SQLiteStorage, mode=BOT_MODE, background=True):
+    """Middleware, роутеры и хуки запуска/остановки. background=False - без фоновых задач
+    (рассылки, аналитика, напоминания), их в многопроцессном режиме запускает только один воркер."""
+    # Замер времени обработки апдейтов - чтобы сравнивать режимы polling и webhook
+    dp.update.outer_middleware(UpdateTimingMiddleware(mode, TIMING_REPORT_INTERVAL, RECORD_UPDATES_FILE))
+    # Метрики: апдейт целиком с числом обращений к БД и API, каждый запрос к Telegram API
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    bot.session.middleware(TelegramApiMetricsMiddleware())
+    # Изменения FSM за один апдейт пишутся в БД одной транзакцией
+    dp.update.outer_middleware(FSMFlushMiddleware(storage))
+    # Спам кнопками отсекается до фильтров и обработчиков, не доходя до БД
+    if THROTTLE_RATE > 0:
+        answer_limit = (THROTTLE_ANSWER_RATE, THROTTLE_ANSWER_BURST)
+        throttling = ThrottlingMiddleware(
+            THROTTLE_RATE, THROTTLE_BURST,
+            limits={"choice": answer_limit, "hint": answer_limit, "solution": answer_limit},
+            exempt=(ADMIN_ID,)
+        )
+        dp.message.outer_middleware(throttling)
+        dp.callback_query.outer_middleware(throttling)
 
     # Регистрируем роутеры (обработчики)
     dp.include_router(admin_handlers.router)  # Пока не используем, но оставим для структуры
     dp.include_router(user_handlers.router)
     # Позже добавим роутер для админа
+    # Метрики по обработчикам: выбранный обработчик известен только внутреннему middleware
+    for router in (admin_handlers.router, user_handlers.router):
+        router.message.middleware(HandlerMetricsMiddleware())
+        router.callback_query.middleware(HandlerMetricsMiddleware())
+
+    # Лог действий пишется в фоне; при остановке диспетчера очередь дописывается до конца
+    dp.startup.register(start_action_queue)
+    dp.shutdown.register(stop_action_queue)
+    # Рассылка идет в том процессе, который обработал команду админа, - останавливаем ее в любом,
+    # сохранив отправленное; продолжит ее после перезапуска процесс с фоновыми задачами
+    dp.shutdown.register(stop_jobs)
+    if background:
+        # Рассылки, прерванные перезапуском, продолжаются с того же места
+        dp.startup.register(resume_jobs)
+        # Аналитика по классу догоняет лог ответов в фоне
+        dp.startup.register(start_cohort_refresher)
+        dp.shutdown.register(stop_cohort_refresher)
+        # Напоминания неактивным ученикам по расписанию из кучи
+        dp.startup.register(start_reminders)
+        dp.shutdown.register(stop_reminders)
+
+async def main():
+    if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+        # Без секрета эндпоинт принял бы поддельные апдейты от кого угодно
+        raise SystemExit("Для BOT_MODE=webhook задайте WEBHOOK_SECRET")
+    if BOT_WORKERS > 1:
+        await run_front()
+        return
+
+    # Инициализация бота и диспетчера
+    bot = create_bot()
+    storage = SQLiteStorage()
+    dp = Dispatcher(storage=storage) # FSM хранит состояния в SQLite, они переживают перезапуск
+    setup_dispatcher(dp, bot, storage)
+
+    # Открываем пул соединений с БД один раз на весь процесс
+    await init_pool()
+
+    # Создаем таблицы в БД при старте
+    await create_tables()
+    # Индекс задач по разделам для быстрого случайного выбора
+    await load_task_index()
+    # Рейтинг учеников строится из сводки ответов и дальше обновляется в памяти
+    await load_leaderboard()
+
+    # Эндпоинт /metrics для Prometheus
+    await start_metrics_server(METRICS_HOST, METRICS_PORT)
 
     # Запускаем бота
-    await bot.delete_webhook(drop_pending_updates=True) # Пропускаем старые апдейты
-    await dp.start_polling(bot)
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(bot, dp)
+        else:
+            await bot.delete_webhook(drop_pending_updates=True) # Пропускаем старые апдейты
+            await dp.start_polling(bot)
+    finally:
+        await stop_action_queue()
+        await stop_cohort_refresher()
+        await stop_reminders()
+        await storage.close()
+        await close_pool()
+        await stop_metrics_server()
+
+async def run_front():
+    """Многопроцессный режим: этот процесс только принимает апдейты и раздает их
+    BOT_WORKERS воркерам по id пользователя (см. services/workers.py)."""
+    # Миграции - один раз до старта воркеров, чтобы они не шли в нескольких процессах сразу
+    await init_pool()
+    await create_tables()
+    await close_pool()
+
+    bot = create_bot()
+    # Диспетчер фронта апдейты не обрабатывает - он нужен, чтобы узнать типы апдейтов для Telegram
+    dp = Dispatcher()
+    dp.include_router(admin_handlers.router)
+    dp.include_router(user_handlers.router)
+
+    pool = WorkerPool(BOT_WORKERS, run_worker, WORKER_QUEUE_SIZE)
+    pool.start()
+    # По SIGTERM воркеры тоже останавливаются штатно: дообрабатывают очередь и дописывают лог
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    try:
+        if BOT_MODE == "webhook":
+            runner = web.AppRunner(create_front_app(pool.route, WEBHOOK_PATH, WEBHOOK_SECRET))
+            await runner.setup()
+            await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+            await set_webhook(bot, dp)
+            logging.info("Фронт слушает %s:%s%s, воркеров %d", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, BOT_WORKERS)
+            try:
+                await asyncio.Event().wait()
+            finally:
+                await remove_webhook(bot)
+                await runner.cleanup()
+        else:
+            await bot.delete_webhook(drop_pending_updates=True) # Пропускаем старые апдейты
+            await poll_updates(BOT_TOKEN, pool.route, dp.resolve_used_update_types(), TELEGRAM_API_URL)
+    except asyncio.CancelledError:
+        logging.info("Получен сигнал остановки")
+    finally:
+        await pool.stop()
+        await bot.session.close()
+
+async def worker_main(index, updates):
+    bot = create_bot()
+    storage = SQLiteStorage()
+    dp = Dispatcher(storage=storage)
+    setup_dispatcher(dp, bot, storage, mode=f"{BOT_MODE}/worker{index}", background=index == 0)
+
+    await init_pool()
+    await load_task_index()
+    # Ответы учеников других воркеров попадают в рейтинг при перечитывании
+    await load_leaderboard(reload_interval=LEADERBOARD_RELOAD_INTERVAL)
+    # Каждый воркер отдает свои метрики на своем порту: METRICS_PORT + номер воркера
+    await start_metrics_server(METRICS_HOST, METRICS_PORT + index if METRICS_PORT else 0)
+    try:
+        await serve_worker(dp, bot, updates, WEBHOOK_CONCURRENCY)
+    finally:
+        await stop_action_queue()
+        await stop_cohort_refresher()
+        await stop_reminders()
+        await storage.close()
+        await close_pool()
+        await stop_metrics_server()
+        await bot.session.close()
+
+def run_worker(index, updates):
+    """Точка входа процесса-воркера."""
+    # Ctrl+C получает вся группа процессов; воркер останавливает фронт, прислав None в очередь
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(worker_main(index, updates))
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -5,4 +5,82 @@ from dotenv import load_dotenv
 load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-ADMIN_ID = int(os.getenv("ADMIN_ID"))
\ No newline at end of file
+ADMIN_ID = int(os.getenv("ADMIN_ID"))
+
+# Настройки пула соединений с SQLite
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 4))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", 16384))  # размер страничного кэша на одно соединение
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", 128))  # сколько подготовленных запросов держит соединение
+
+# Выбор задачи: 1 - чаще показывать задачи, на которые отвечали реже
+TASK_PICK_WEIGHTED = os.getenv("TASK_PICK_WEIGHTED", "0") == "1"
+# 1 - давать ученику сначала невиданные, затем нерешенные задачи
+TASK_PICK_UNSEEN_FIRST = os.getenv("TASK_PICK_UNSEEN_FIRST", "1") == "1"
+PROGRESS_CACHE_SIZE = int(os.getenv("PROGRESS_CACHE_SIZE", 20000))  # у скольких учеников держать маски прогресса
+PROGRESS_IDLE_TTL = int(os.getenv("PROGRESS_IDLE_TTL", 3600))  # через сколько секунд простоя маски вытесняются
+# Заранее загруженная следующая задача: на скольких учеников держать слоты и сколько секунд слот живет
+PREFETCH_SLOTS = int(os.getenv("PREFETCH_SLOTS", 10000))
+PREFETCH_TTL = int(os.getenv("PREFETCH_TTL", 1800))
+TASK_CACHE_SIZE = int(os.getenv("TASK_CACHE_SIZE", 2048))  # сколько задач держать в кэше
+
+# Отложенная запись лога действий: пачка пишется каждые N событий или каждые T мс
+ACTION_QUEUE_BATCH = int(os.getenv("ACTION_QUEUE_BATCH", 200))
+ACTION_QUEUE_FLUSH_MS = int(os.getenv("ACTION_QUEUE_FLUSH_MS", 250))
+ACTION_QUEUE_MAX = int(os.getenv("ACTION_QUEUE_MAX", 10000))  # предел очереди, дальше обработчики ждут
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", 50000))  # сколько пользователей держать в памяти
+
+# FSM: сколько хранить неактивное состояние в БД и сколько держать его в памяти (секунды)
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", 7 * 24 * 3600))
+FSM_CACHE_TTL = int(os.getenv("FSM_CACHE_TTL", 1800))
+
+# Рассылка: общий предел сообщений в секунду и число параллельных отправителей
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", 25))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", 8))
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", 3))  # раз в сколько секунд обновлять статус
+
+# Режим получения апдейтов: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # публичный адрес, например https://bot.example.com; пусто - webhook не регистрируется
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # обязателен для webhook: 1-256 символов A-Z, a-z, 0-9, _ и -
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 40))  # сколько соединений Telegram открывает к нам
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", 64))  # сколько апдейтов обрабатывать одновременно
+
+# Замер задержки обработки апдейтов: период отчета в лог и (необязательно) файл для записи апдейтов
+TIMING_REPORT_INTERVAL = int(os.getenv("TIMING_REPORT_INTERVAL", 60))
+RECORD_UPDATES_FILE = os.getenv("RECORD_UPDATES_FILE")
+CATALOG_CHECK_INTERVAL = int(os.getenv("CATALOG_CHECK_INTERVAL", 30))  # раз в сколько секунд сверять версию каталога разделов
+# Метрики в формате Prometheus: адрес локального HTTP-эндпоинта /metrics; порт 0 - не поднимать
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))
+# Профилирование запросов к БД: включить (1/0) и порог медленного запроса для лога с планом (мс)
+DB_PROFILE = os.getenv("DB_PROFILE", "0") == "1"
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", 100))
+
+# Аналитика по классу: раз в сколько секунд догонять свертку лога и с какого числа учеников задача попадает в рейтинг трудности
+COHORT_REFRESH_INTERVAL = int(os.getenv("COHORT_REFRESH_INTERVAL", 60))
+COHORT_MIN_STUDENTS = int(os.getenv("COHORT_MIN_STUDENTS", 3))
+# Многопроцессный режим: число воркеров (0 или 1 - все в одном процессе) и предел очереди апдейтов одного воркера
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", 0))
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", 10000))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", 5000))  # сколько ждать записи, пока пишет другой процесс (мс)
+LEADERBOARD_RELOAD_INTERVAL = int(os.getenv("LEADERBOARD_RELOAD_INTERVAL", 30))  # раз в сколько секунд воркер перечитывает рейтинг
+# Адрес Bot API: свой сервер telegram-bot-api или заглушка для нагрузочных тестов; пусто - api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+# Троттлинг: нажатий в секунду и всплеск на пользователя и тип кнопки (THROTTLE_RATE=0 - выключить)
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", 2))
+THROTTLE_BURST = int(os.getenv("THROTTLE_BURST", 5))
+# Более строгий предел для кнопок, которые пишут в БД: ответ на задачу, подсказка, решение
+THROTTLE_ANSWER_RATE = float(os.getenv("THROTTLE_ANSWER_RATE", 1))
+THROTTLE_ANSWER_BURST = int(os.getenv("THROTTLE_ANSWER_BURST", 3))
+# Напоминания ученикам: через сколько дней без занятий напомнить (0 - выключить), слать ли до этого ежедневные
+# приглашения, как часто повторять и сколько раз; скорость отправки, размер пачки и период сверки расписания с БД
+REMINDER_INACTIVE_DAYS = int(os.getenv("REMINDER_INACTIVE_DAYS", 3))
+REMINDER_DAILY = os.getenv("REMINDER_DAILY", "1") == "1"
+REMINDER_REPEAT_DAYS = int(os.getenv("REMINDER_REPEAT_DAYS", 7))
+REMINDER_MAX_INACTIVE = int(os.getenv("REMINDER_MAX_INACTIVE", 3))
+REMINDER_RATE = float(os.getenv("REMINDER_RATE", 10))  # сообщений в секунду
+REMINDER_BATCH = int(os.getenv("REMINDER_BATCH", 200))
+REMINDER_SYNC_INTERVAL = int(os.getenv("REMINDER_SYNC_INTERVAL", 300))
\ No newline at end of file
@@ -0,0 +1,84 @@
+# database/action_queue.py
+import asyncio
+import logging
+
+_STOP = object()
+
+
+class ActionQueue:
+    """Очередь отложенной записи (write-behind) для событий log_user_action.
+
+    Обработчики только кладут событие в очередь и сразу отвечают пользователю.
+    Фоновая задача собирает события в пачки - по batch_size штук или раз в
+    flush_interval_ms - и передает каждую пачку в flush(batch), который пишет ее
+    одной транзакцией. Очередь ограничена max_size: когда диск не успевает,
+    put() ждет, а не копит события в памяти без предела.
+    """
+
+    def __init__(self, flush, batch_size, flush_interval_ms, max_size):
+        self._flush = flush
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue = asyncio.Queue(maxsize=max_size)
+        self._task = None
+        self.flushed_events = 0
+        self.flushed_batches = 0
+
+    @property
+    def running(self):
+        return self._task is not None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, event):
+        await self._queue.put(event)
+
+    async def stop(self):
+        """Дожидается записи всех накопленных событий и останавливает фоновую задачу."""
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._write(batch)
+
+    async def _write(self, batch):
+        try:
+            await self._flush(batch)
+            self.flushed_events += len(batch)
+            self.flushed_batches += 1
+        except Exception:
+            # Ошибку записи не пробрасываем, иначе остановится вся очередь
+            logging.exception("Не удалось записать пачку из %d событий: %r", len(batch), batch)
+
+    def stats(self):
+        return {
+            "pending": self._queue.qsize(),
+            "max_size": self._queue.maxsize,
+            "flushed_events": self.flushed_events,
+            "flushed_batches": self.flushed_batches,
+        }
@@ -0,0 +1,74 @@
+# database/catalog.py
+import time
+
+from config import CATALOG_CHECK_INTERVAL
+from keyboards.admin_keyboards import get_sections_keyboard_admin
+from keyboards.user_keyboards import get_sections_keyboard
+
+SECTIONS_QUERY = """
+    SELECT s.id, s.name, COUNT(t.id)
+    FROM sections s
+    LEFT JOIN tasks t ON t.section_id = s.id
+    GROUP BY s.id
+    ORDER BY s.id
+"""
+
+
+class SectionsCatalog:
+    """Разделы с числом задач и готовыми клавиатурами в памяти.
+
+    Разделы меняются редко, поэтому меню разделов строится без обращения к БД.
+    Каталог перечитывается после записи задач в этом процессе (invalidate) и когда
+    меняется meta.catalog_version - ее увеличивают триггеры на sections, tasks и
+    ключи ответов, так что замечены будут и правки руками, и записи других процессов.
+    Версия проверяется не чаще раза в check_interval секунд.
+    """
+
+    def __init__(self, check_interval=CATALOG_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.version = None
+        self.sections = []      # [(id, name, task_count), ...]
+        self.user_keyboard = None
+        self.admin_keyboard = None
+        self._names = {}
+        self._checked_at = 0.0
+
+    @property
+    def loaded(self):
+        return self.version is not None
+
+    def needs_check(self):
+        return not self.loaded or time.monotonic() - self._checked_at >= self.check_interval
+
+    async def refresh(self, db):
+        cursor = await db.execute("SELECT value FROM meta WHERE key = 'catalog_version'")
+        row = await cursor.fetchone()
+        version = row[0] if row else 0
+        self._checked_at = time.monotonic()
+        if version == self.version:
+            return
+
+        cursor = await db.execute(SECTIONS_QUERY)
+        self.sections = await cursor.fetchall()
+        self._names = {section_id: name for section_id, name, _ in self.sections}
+        # Ученикам показываем только разделы, в которых есть задачи
+        self.user_keyboard = get_sections_keyboard(
+            [(section_id, name) for section_id, name, count in self.sections if count > 0]
+        )
+        # Админу - все разделы с числом задач
+        self.admin_keyboard = get_sections_keyboard_admin(
+            [(section_id, f"{name} ({count})") for section_id, name, count in self.sections]
+        )
+        self.version = version
+
+    def invalidate(self):
+        self.version = None
+
+    def has_tasks(self):
+        return any(count > 0 for _, _, count in self.sections)
+
+    def name(self, section_id):
+        return self._names.get(section_id)
+
+
+sections_catalog = SectionsCatalog()
@@ -0,0 +1,241 @@
+# database/cohort.py
+"""Сводная аналитика по классу: сложность разделов и задач.
+
+Лог user_answers сворачивается в три таблицы:
+    user_task_attempts   - (задача, ученик): ответов, верных, подсказок, просмотров решения;
+    task_stats           - по задаче: учеников, точность, доля с подсказкой/решением, медиана попыток;
+    section_cohort_stats - то же по разделу.
+Свертка инкрементальная: в meta хранится id последней учтенной строки лога,
+и каждый проход обрабатывает только новые строки, пересчитывая задачи и
+разделы, которых они касаются. Проходы делает фоновый CohortRefresher,
+поэтому отчет в админке читается из маленьких таблиц за миллисекунды.
+
+Пересобрать свертку с нуля или догнать лог вручную:
+    python -m database.cohort --rebuild
+    python -m database.cohort
+"""
+import argparse
+import asyncio
+import logging
+
+import aiosqlite
+
+WATERMARK_KEY = 'cohort_answer_id'
+
+CREATE_USER_TASK_ATTEMPTS = """
+    CREATE TABLE IF NOT EXISTS user_task_attempts (
+        task_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,   -- ответов 'answered'
+        correct INTEGER NOT NULL DEFAULT 0,
+        hints INTEGER NOT NULL DEFAULT 0,
+        solutions INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (task_id, user_id)
+    ) WITHOUT ROWID
+"""
+
+CREATE_TASK_STATS = """
+    CREATE TABLE IF NOT EXISTS task_stats (
+        task_id INTEGER PRIMARY KEY,
+        section_id INTEGER,
+        students INTEGER NOT NULL,             -- учеников, что-либо делавших с задачей
+        answered INTEGER NOT NULL,
+        correct INTEGER NOT NULL,
+        accuracy REAL,                         -- correct / answered, NULL без ответов
+        hint_rate REAL NOT NULL,               -- доля учеников, открывших подсказку
+        solution_rate REAL NOT NULL,           -- доля учеников, смотревших решение
+        median_attempts REAL                   -- медиана ответов на ученика среди ответивших
+    )
+"""
+
+CREATE_SECTION_COHORT_STATS = """
+    CREATE TABLE IF NOT EXISTS section_cohort_stats (
+        section_id INTEGER PRIMARY KEY,
+        tasks INTEGER NOT NULL,                -- задач, с которыми кто-либо работал
+        students INTEGER NOT NULL,
+        answered INTEGER NOT NULL,
+        correct INTEGER NOT NULL,
+        accuracy REAL,
+        hint_rate REAL NOT NULL,               -- доля пар (ученик, задача) с подсказкой
+        solution_rate REAL NOT NULL,
+        median_attempts REAL
+    )
+"""
+
+# Дельты по (задача, ученик) из диапазона id лога: параметры (после id, до id включительно)
+APPLY_ANSWERS = """
+    INSERT INTO user_task_attempts (task_id, user_id, attempts, correct, hints, solutions)
+    SELECT task_id, user_id,
+           COUNT(CASE WHEN action_type = 'answered' THEN 1 END),
+           COUNT(CASE WHEN action_type = 'answered' AND is_correct = 1 THEN 1 END),
+           COUNT(CASE WHEN action_type = 'hint_used' THEN 1 END),
+           COUNT(CASE WHEN action_type = 'viewed_solution' THEN 1 END)
+    FROM user_answers
+    WHERE id > ? AND id <= ? AND task_id IS NOT NULL AND user_id IS NOT NULL
+    GROUP BY task_id, user_id
+    ON CONFLICT (task_id, user_id) DO UPDATE SET
+        attempts = attempts + excluded.attempts,
+        correct = correct + excluded.correct,
+        hints = hints + excluded.hints,
+        solutions = solutions + excluded.solutions
+"""
+
+# Пересчет строк task_stats для задач из временной таблицы cohort_touched
+REFRESH_TASKS = """
+    INSERT OR REPLACE INTO task_stats
+        (task_id, section_id, students, answered, correct, accuracy, hint_rate, solution_rate, median_attempts)
+    SELECT a.task_id, t.section_id, COUNT(*), SUM(a.attempts), SUM(a.correct),
+           CAST(SUM(a.correct) AS REAL) / NULLIF(SUM(a.attempts), 0),
+           AVG(a.hints > 0), AVG(a.solutions > 0), m.median
+    FROM user_task_attempts a
+    JOIN cohort_touched c ON c.task_id = a.task_id
+    LEFT JOIN tasks t ON t.id = a.task_id
+    LEFT JOIN (
+        SELECT task_id, AVG(attempts) AS median FROM (
+            SELECT a.task_id, a.attempts,
+                   ROW_NUMBER() OVER (PARTITION BY a.task_id ORDER BY a.attempts) AS rn,
+                   COUNT(*) OVER (PARTITION BY a.task_id) AS cnt
+            FROM user_task_attempts a JOIN cohort_touched c ON c.task_id = a.task_id
+            WHERE a.attempts > 0
+        )
+        WHERE rn IN ((cnt + 1) / 2, (cnt + 2) / 2)
+        GROUP BY task_id
+    ) m ON m.task_id = a.task_id
+    GROUP BY a.task_id
+"""
+
+# Пересчет разделов, в которых есть задачи из cohort_touched
+REFRESH_SECTIONS = """
+    INSERT OR REPLACE INTO section_cohort_stats
+        (section_id, tasks, students, answered, correct, accuracy, hint_rate, solution_rate, median_attempts)
+    SELECT s.section_id, s.tasks, s.students, s.answered, s.correct,
+           CAST(s.correct AS REAL) / NULLIF(s.answered, 0), s.hint_rate, s.solution_rate, m.median
+    FROM (
+        SELECT t.section_id, COUNT(DISTINCT a.task_id) AS tasks, COUNT(DISTINCT a.user_id) AS students,
+               SUM(a.attempts) AS answered, SUM(a.correct) AS correct,
+               AVG(a.hints > 0) AS hint_rate, AVG(a.solutions > 0) AS solution_rate
+        FROM tasks t
+        JOIN user_task_attempts a ON a.task_id = t.id
+        WHERE t.section_id IN (SELECT DISTINCT section_id FROM task_stats JOIN cohort_touched USING (task_id))
+        GROUP BY t.section_id
+    ) s
+    LEFT JOIN (
+        SELECT section_id, AVG(attempts) AS median FROM (
+            SELECT t.section_id, a.attempts,
+                   ROW_NUMBER() OVER (PARTITION BY t.section_id ORDER BY a.attempts) AS rn,
+                   COUNT(*) OVER (PARTITION BY t.section_id) AS cnt
+            FROM tasks t JOIN user_task_attempts a ON a.task_id = t.id
+            WHERE a.attempts > 0
+              AND t.section_id IN (SELECT DISTINCT section_id FROM task_stats JOIN cohort_touched USING (task_id))
+        )
+        WHERE rn IN ((cnt + 1) / 2, (cnt + 2) / 2)
+        GROUP BY section_id
+    ) m ON m.section_id = s.section_id
+"""
+
+
+async def apply_new_answers(db, batch_size=50000):
+    """Учитывает в свертке до batch_size новых строк лога одной транзакцией.
+    Возвращает число обработанных id (0 - свертка догнала лог)."""
+    # IMMEDIATE: два процесса не должны учесть один диапазон дважды
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = await db.execute("SELECT value FROM meta WHERE key = ?", (WATERMARK_KEY,))
+        row = await cursor.fetchone()
+        last_id = row[0] if row else 0
+        cursor = await db.execute("SELECT MAX(id) FROM user_answers")
+        max_id = (await cursor.fetchone())[0] or 0
+        upto = min(max_id, last_id + batch_size)
+        if upto <= last_id:
+            await db.rollback()
+            return 0
+
+        await db.execute(APPLY_ANSWERS, (last_id, upto))
+        await db.execute("CREATE TEMP TABLE IF NOT EXISTS cohort_touched (task_id INTEGER PRIMARY KEY)")
+        await db.execute("DELETE FROM cohort_touched")
+        await db.execute(
+            "INSERT INTO cohort_touched SELECT DISTINCT task_id FROM user_answers "
+            "WHERE id > ? AND id <= ? AND task_id IS NOT NULL",
+            (last_id, upto)
+        )
+        await db.execute(REFRESH_TASKS)
+        await db.execute(REFRESH_SECTIONS)
+        await db.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (WATERMARK_KEY, upto)
+        )
+        await db.commit()
+        return upto - last_id
+    except Exception:
+        await db.rollback()
+        raise
+
+
+async def reset_cohort_stats(db):
+    """Очищает свертку; следующий проход начнет с первой строки лога. Коммит - на вызывающем."""
+    await db.execute("DELETE FROM user_task_attempts")
+    await db.execute("DELETE FROM task_stats")
+    await db.execute("DELETE FROM section_cohort_stats")
+    await db.execute("DELETE FROM meta WHERE key = ?", (WATERMARK_KEY,))
+
+
+class CohortRefresher:
+    """Фоновая задача: раз в interval секунд догоняет свертку до конца лога.
+
+    Пока лог не догнан (например, при первом запуске на большой базе),
+    пачки идут одна за другой с короткой паузой, чтобы не занимать запись надолго.
+    """
+
+    def __init__(self, refresh, interval):
+        self.refresh = refresh
+        self.interval = interval
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                while await self.refresh():
+                    await asyncio.sleep(0.05)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning("Не удалось обновить аналитику по классу: %r", e)
+            await asyncio.sleep(self.interval)
+
+
+async def _main(db_name, rebuild):
+    async with aiosqlite.connect(db_name) as db:
+        if rebuild:
+            await reset_cohort_stats(db)
+            await db.commit()
+        processed = 0
+        while True:
+            step = await apply_new_answers(db)
+            if not step:
+                break
+            processed += step
+        print(f"Аналитика по классу обновлена, учтено строк лога (по id): {processed}.")
+
+
+if __name__ == "__main__":
+    from database.database import DB_NAME
+
+    parser = argparse.ArgumentParser(description="Сводная аналитика по разделам и задачам")
+    parser.add_argument("--db", default=DB_NAME, help="путь к файлу БД")
+    parser.add_argument("--rebuild", action="store_true", help="пересобрать свертку с начала лога")
+    args = parser.parse_args()
+    asyncio.run(_main(args.db, args.rebuild))
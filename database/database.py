@@ -1,10 +1,83 @@
 # darabase/database.py
+import logging
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
 import aiosqlite
 
+from config import (
+    TASK_PICK_WEIGHTED, TASK_PICK_UNSEEN_FIRST, ACTION_QUEUE_BATCH, ACTION_QUEUE_FLUSH_MS, ACTION_QUEUE_MAX,
+    COHORT_REFRESH_INTERVAL, COHORT_MIN_STUDENTS
+)
+from database.action_queue import ActionQueue
+from database.catalog import sections_catalog
+from database.cohort import CohortRefresher, apply_new_answers
+from database.identity import Identity, identity_map
+from database.leaderboard import leaderboard
+from database.migrations import apply_migrations, name_search_key
+from database.pool import ConnectionPool
+from database.prefetch import task_prefetcher
+from database.profiler import profiler
+from database.regrade import regrade_answers as _regrade_answers
+from database.reminders import reminder_scheduler, REMINDER_CANDIDATES, REMINDER_RECIPIENTS
+from database.progress import ProgressTracker, progress_tracker
+from database.stats import increment_user_section_stats, increment_user_activity
+from database.task_cache import task_cache, TASK_QUERY, build_task
+from database.task_index import task_index
+from services.metrics import metrics
+
 DB_NAME = 'physics_bot.db'
 
+# Общий пул соединений. Создается в main() через init_pool() и закрывается при остановке бота.
+_pool = None
+
+async def init_pool(size=None):
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool(DB_NAME) if size is None else ConnectionPool(DB_NAME, size)
+        await _pool.open()
+    return _pool
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+@asynccontextmanager
+async def connect():
+    """Выдает соединение из пула, а если пул не создан (скрипты, отладка) - открывает разовое.
+
+    Время от запроса соединения до его возврата идет в метрики как одно обращение к БД.
+    При DB_PROFILE=1 соединение обернуто профилировщиком запросов (database/profiler.py).
+    """
+    started = time.perf_counter()
+    error = False
+    try:
+        if _pool is None:
+            async with aiosqlite.connect(DB_NAME) as db:
+                yield profiler.wrap(db)
+        else:
+            async with _pool.acquire() as db:
+                yield profiler.wrap(db)
+    except Exception:
+        error = True
+        raise
+    finally:
+        metrics.observe_db(time.perf_counter() - started, error)
+
+@asynccontextmanager
+async def connect_readonly():
+    """Отдельное соединение только для чтения - для долгих выгрузок, мимо пула.
+
+    В режиме WAL такое чтение не блокирует запись ответов и не занимает соединения бота.
+    """
+    async with aiosqlite.connect(f"file:{DB_NAME}?mode=ro", uri=True) as db:
+        yield db
+
 async def create_tables():
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with connect() as db:
         # Таблица пользователей
         await db.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -69,112 +142,343 @@ async def create_tables():
             )
         ''')
         await db.commit()
+        # Индексы и все последующие изменения схемы - через версионные миграции
+        await apply_migrations(db)
 
 # --- Функции для работы с пользователями ---
 async def add_user(telegram_id, full_name):
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with connect() as db:
         cursor = await db.execute("SELECT telegram_id FROM users WHERE telegram_id = ?", (telegram_id,))
         if await cursor.fetchone() is None:
-            await db.execute("INSERT INTO users (telegram_id, full_name) VALUES (?, ?)", (telegram_id, full_name))
+            cursor = await db.execute(
+                "INSERT INTO users (telegram_id, full_name, name_search) VALUES (?, ?, ?)",
+                (telegram_id, full_name, name_search_key(full_name))
+            )
+            await db.execute(
+                "INSERT INTO user_activity (user_id, last_activity) VALUES (?, CURRENT_TIMESTAMP)", (cursor.lastrowid,)
+            )
             await db.commit()
+            identity_map.put(Identity(cursor.lastrowid, telegram_id, full_name, 'student'))
+            reminder_scheduler.touch(telegram_id)
+
+IDENTITY_QUERY = "SELECT id, telegram_id, full_name, role FROM users WHERE telegram_id = ?"
 
 async def get_user(telegram_id):
-     async with aiosqlite.connect(DB_NAME) as db:
+     async with connect() as db:
         cursor = await db.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
         return await cursor.fetchone()
 
+async def get_identity(telegram_id):
+    """Identity(id, telegram_id, full_name, role) из кэша в памяти; None, если пользователь не зарегистрирован."""
+    identity = identity_map.get(telegram_id)
+    if identity is not None:
+        return identity
+    async with connect() as db:
+        cursor = await db.execute(IDENTITY_QUERY, (telegram_id,))
+        row = await cursor.fetchone()
+    if row is None:
+        return None
+    identity = Identity(*row)
+    identity_map.put(identity)
+    return identity
+
 # --- Функции для работы с разделами и задачами ---
+async def get_sections_catalog():
+    """Каталог разделов с числом задач и готовыми клавиатурами; в БД ходит только за проверкой версии."""
+    if sections_catalog.needs_check():
+        async with connect() as db:
+            await sections_catalog.refresh(db)
+        # Задачи или ключи ответов изменил другой процесс (импорт, соседний воркер, правка руками,
+        # перепроверка) - перечитываем индекс задач и сбрасываем кэш задач
+        if task_index.loaded and task_index.version != sections_catalog.version:
+            await load_task_index()
+    return sections_catalog
+
 async def get_sections():
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute("SELECT id, name FROM sections")
-        return await cursor.fetchall()
+    catalog = await get_sections_catalog()
+    return [(section_id, name) for section_id, name, _ in catalog.sections]
 
-async def get_random_task_by_section(section_id):
-    async with aiosqlite.connect(DB_NAME) as db:
+async def load_leaderboard(reload_interval=None):
+    """Строит рейтинг учеников из сводки user_section_stats. Вызывается при старте бота;
+    reload_interval - перечитывать ли его потом периодически (секунды, 0 - нет)."""
+    if reload_interval is not None:
+        leaderboard.reload_interval = reload_interval
+    async with connect() as db:
+        await leaderboard.load(db)
+
+async def get_leaderboard(telegram_id, section_id=None, limit=10):
+    """Топ рейтинга (общего или по разделу) и место ученика.
+
+    Возвращает (top, me): top - [(место, имя, счет)], me - (место, счет, всего в рейтинге);
+    место None, если у ученика еще нет верных ответов.
+    """
+    if leaderboard.stale():
+        await load_leaderboard()  # ответы учеников других воркеров
+    index = leaderboard.overall if section_id is None else leaderboard.section(section_id)
+    top = index.top(limit)
+    names = {}
+    if top:
+        user_ids = [user_id for _, user_id, _ in top]
+        placeholders = ", ".join("?" * len(user_ids))
+        async with connect() as db:
+            cursor = await db.execute(f"SELECT id, full_name FROM users WHERE id IN ({placeholders})", user_ids)
+            names = dict(await cursor.fetchall())
+    identity = await get_identity(telegram_id)
+    me = (None, 0, index.total)
+    if identity:
+        me = (index.rank(identity.id), index.score(identity.id), index.total)
+    return [(rank, names.get(user_id) or "?", score) for rank, user_id, score in top], me
+
+async def load_task_index():
+    """Загружает индекс задач по разделам. Вызывается один раз при старте бота."""
+    async with connect() as db:
+        await task_index.load(db)
+        if TASK_PICK_WEIGHTED:
+            await task_index.load_attempts(db)
+    # Номера задач в разделах могли измениться - маски прогресса построим заново,
+    # а задачи с ключами ответов перечитаем из БД
+    progress_tracker.clear()
+    task_prefetcher.clear()
+    task_cache.invalidate()
+
+RANDOM_TASK_QUERY = "SELECT id, task_type, photo_file_id FROM tasks WHERE section_id = ? ORDER BY RANDOM() LIMIT 1"
+
+async def get_random_task_by_section(section_id, exclude_task_id=None):
+    await get_sections_catalog()  # не чаще раза в CATALOG_CHECK_INTERVAL сверяет версию задач
+    if task_index.loaded:
+        task = task_index.pick(section_id, weighted=TASK_PICK_WEIGHTED)
+        # Повторяем выбор, если выпала исключенная задача, а в разделе есть другие
+        for _ in range(8):
+            if task is None or task[0] != exclude_task_id or len(task_index.section_tasks(section_id)) < 2:
+                break
+            task = task_index.pick(section_id, weighted=TASK_PICK_WEIGHTED)
+        return task
+
+    # Индекс еще не загружен - идем в БД старым способом
+    async with connect() as db:
         # Выбираем случайную задачу из указанного раздела
-        cursor = await db.execute(
-            "SELECT id, task_type, photo_file_id FROM tasks WHERE section_id = ? ORDER BY RANDOM() LIMIT 1",
-            (section_id,)
-        )
+        cursor = await db.execute(RANDOM_TASK_QUERY, (section_id,))
         return await cursor.fetchone()
 
+PROGRESS_QUERY = """
+    SELECT task_id, MAX(is_correct) FROM user_answers
+    WHERE user_id = ? AND action_type = 'answered'
+    GROUP BY task_id
+"""
+
+async def get_user_progress(telegram_id):
+    """Маски прогресса ученика по разделам; при первом обращении строятся из user_answers."""
+    sections = progress_tracker.get(telegram_id)
+    if sections is not None:
+        return sections
+    sections = {}
+    identity = await get_identity(telegram_id)
+    if identity:
+        async with connect() as db:
+            cursor = await db.execute(PROGRESS_QUERY, (identity.id,))
+            async for task_id, solved in cursor:
+                position = task_index.position(task_id)
+                if position:
+                    ProgressTracker.mark(sections, position, solved == 1)
+    progress_tracker.put(telegram_id, sections)
+    return sections
+
+async def get_next_task(section_id, telegram_id, exclude_task_id=None):
+    """Следующая задача для ученика: сначала те, что он еще не видел, затем нерешенные.
+    exclude_task_id - задача, которую не выбирать (та, что сейчас на экране)."""
+    if not (TASK_PICK_UNSEEN_FIRST and task_index.loaded):
+        return await get_random_task_by_section(section_id, exclude_task_id)
+    await get_sections_catalog()  # не чаще раза в CATALOG_CHECK_INTERVAL сверяет версию задач
+    tasks = task_index.section_tasks(section_id)
+    if not tasks:
+        return None
+    sections = await get_user_progress(telegram_id)
+    exclude = task_index.position(exclude_task_id) if exclude_task_id else None
+    exclude = exclude[1] if exclude and exclude[0] == section_id else None
+    return tasks[ProgressTracker.pick(sections, section_id, len(tasks), exclude)]
+
+async def _load_next_task(section_id, telegram_id, exclude_task_id=None):
+    task = await get_next_task(section_id, telegram_id, exclude_task_id)
+    return await get_task(task[0]) if task else None
+
+async def take_next_task(section_id, telegram_id):
+    """Следующая задача целиком (CachedTask): заранее загруженная, если есть, иначе выбирается сейчас."""
+    task = await task_prefetcher.take(telegram_id, section_id)
+    # Задачу могли удалить, пока она ждала в слоте
+    if task is not None and task_index.loaded and task_index.position(task.id) is None:
+        task = None
+    return task or await _load_next_task(section_id, telegram_id)
+
+def prefetch_next_task(section_id, telegram_id, current_task_id):
+    """Пока ученик решает current_task_id, в фоне выбирает и загружает следующую задачу раздела."""
+    task_prefetcher.schedule(
+        telegram_id, section_id, lambda: _load_next_task(section_id, telegram_id, current_task_id)
+    )
+
+def drop_prefetched_task(telegram_id):
+    task_prefetcher.invalidate(telegram_id)
+
+async def get_task(task_id):
+    """Полная задача (CachedTask) из LRU-кэша; при промахе - одна выборка из БД."""
+    await get_sections_catalog()  # не чаще раза в CATALOG_CHECK_INTERVAL сверяет версию задач
+    task = task_cache.get(task_id)
+    if task is not None:
+        return task
+    async with connect() as db:
+        cursor = await db.execute(TASK_QUERY, (task_id,))
+        rows = await cursor.fetchall()
+    if not rows:
+        return None
+    task = build_task(rows)
+    task_cache.put(task)
+    return task
+
+def get_cache_stats():
+    """Счетчики попаданий и промахов кэшей - чтобы подбирать их размер."""
+    return {"tasks": task_cache.stats(), "identities": identity_map.stats(), "prefetch": task_prefetcher.stats(),
+            "progress": progress_tracker.stats()}
+
 async def get_task_choices(task_id):
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute(
-            "SELECT id, choice_text, is_correct FROM task_choices WHERE task_id = ?",
-            (task_id,)
-        )
-        return await cursor.fetchall()
+    task = await get_task(task_id)
+    return task.choices if task else []
+
+async def get_choice_is_correct(task_id, choice_id):
+    """Верен ли вариант ответа по текущему ключу задачи; None, если такого варианта нет."""
+    task = await get_task(task_id)
+    for current_id, _, is_correct in (task.choices if task else []):
+        if current_id == choice_id:
+            return bool(is_correct)
+    return None
 
 async def get_task_text_answer(task_id):
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute(
-            "SELECT correct_answer FROM task_text_answers WHERE task_id = ?",
-            (task_id,)
+    task = await get_task(task_id)
+    if task is None or task.text_answer is None:
+        return None
+    return (task.text_answer,)
+
+def _utc_timestamp(seconds=None):
+    # Тот же формат, что у CURRENT_TIMESTAMP в SQLite; seconds - время в epoch вместо текущего
+    moment = datetime.now(timezone.utc) if seconds is None else datetime.fromtimestamp(seconds, timezone.utc)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+async def write_user_actions(events):
+    """Записывает пачку событий (telegram_id, task_id, action_type, answer_given, is_correct, timestamp)
+    одной транзакцией. События незарегистрированных пользователей пропускаются."""
+    user_ids = {}
+    students = set()  # внутренние id учеников - только они попадают в рейтинг
+    missing = []
+    for telegram_id in {event[0] for event in events}:
+        identity = identity_map.get(telegram_id)
+        if identity is None:
+            missing.append(telegram_id)
+        else:
+            user_ids[telegram_id] = identity.id
+            if identity.role == 'student':
+                students.add(identity.id)
+    async with connect() as db:
+        if missing:
+            placeholders = ", ".join("?" * len(missing))
+            cursor = await db.execute(
+                f"SELECT id, telegram_id, full_name, role FROM users WHERE telegram_id IN ({placeholders})", missing
+            )
+            for row in await cursor.fetchall():
+                identity = Identity(*row)
+                identity_map.put(identity)
+                user_ids[identity.telegram_id] = identity.id
+                if identity.role == 'student':
+                    students.add(identity.id)
+        rows = [
+            (user_ids[telegram_id], task_id, answer_given, is_correct, timestamp, action_type)
+            for telegram_id, task_id, action_type, answer_given, is_correct, timestamp in events
+            if telegram_id in user_ids
+        ]
+        await db.executemany(
+            "INSERT INTO user_answers (user_id, task_id, answer_given, is_correct, timestamp, action_type) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
         )
-        return await cursor.fetchone()
+        # Сводная статистика обновляется в той же транзакции, что и лог
+        await increment_user_section_stats(db, rows)
+        await increment_user_activity(db, rows)
+        await db.commit()
+    if TASK_PICK_WEIGHTED:
+        for _, task_id, _, _, _, action_type in rows:
+            if action_type == 'answered':
+                task_index.record_attempt(task_id)
+    if leaderboard.loaded:
+        for user_id, task_id, _, is_correct, _, action_type in rows:
+            if action_type == 'answered' and is_correct and user_id in students:
+                position = task_index.position(task_id)
+                leaderboard.record(user_id, position[0] if position else None)
+
+# Отложенная запись лога действий: обработчики не ждут диска
+action_queue = ActionQueue(write_user_actions, ACTION_QUEUE_BATCH, ACTION_QUEUE_FLUSH_MS, ACTION_QUEUE_MAX)
+
+async def start_action_queue():
+    action_queue.start()
+
+async def stop_action_queue():
+    """Дописывает все накопленные события. Вызывается при остановке диспетчера."""
+    await action_queue.stop()
 
 async def log_user_action(user_id, task_id, action_type, answer_given=None, is_correct=None):
-    async with aiosqlite.connect(DB_NAME) as db:
-        user_db_id_cursor = await db.execute("SELECT id FROM users WHERE telegram_id = ?", (user_id,))
-        user_db_id = await user_db_id_cursor.fetchone()
-        if user_db_id:
-            await db.execute(
-                "INSERT INTO user_answers (user_id, task_id, answer_given, is_correct, action_type) VALUES (?, ?, ?, ?, ?)",
-                (user_db_id[0], task_id, answer_given, is_correct, action_type)
-            )
-            await db.commit()
+    event = (user_id, task_id, action_type, answer_given, is_correct, _utc_timestamp())
+    reminder_scheduler.touch(user_id)
+    if action_type == 'answered':
+        position = task_index.position(task_id)
+        if position:
+            progress_tracker.record(user_id, position, is_correct)
+    if action_queue.running:
+        await action_queue.put(event)
+    else:
+        # Очередь не запущена (скрипты, отладка) - пишем сразу
+        await write_user_actions([event])
 
 async def get_task_hint(task_id):
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute("SELECT hint_text FROM tasks WHERE id = ?", (task_id,))
-        return await cursor.fetchone()
+    task = await get_task(task_id)
+    return (task.hint_text,) if task else None
 
 async def get_task_solution(task_id):
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute("SELECT solution_data, solution_type FROM tasks WHERE id = ?", (task_id,))
-        return await cursor.fetchone()
+    task = await get_task(task_id)
+    return (task.solution_data, task.solution_type) if task else None
+
+# Сводка по разделам: одна строка на раздел, независимо от длины истории
+USER_STATISTICS_QUERY = """
+    SELECT s.name, st.answered, st.correct
+    FROM user_section_stats st
+    LEFT JOIN sections s ON s.id = st.section_id
+    WHERE st.user_id = ?
+"""
 
 async def get_user_statistics(telegram_id):
-    async with aiosqlite.connect(DB_NAME) as db:
-        # Находим внутренний ID пользователя
-        cursor = await db.execute("SELECT id FROM users WHERE telegram_id = ?", (telegram_id,))
-        user_id_tuple = await cursor.fetchone()
-        if not user_id_tuple:
-            return None
-        user_id = user_id_tuple[0]
-
-        # Общая статистика
-        cursor = await db.execute(
-            "SELECT COUNT(*), SUM(CASE WHEN is_correct = 1 THEN 1 ELSE 0 END) FROM user_answers WHERE user_id = ? AND action_type = 'answered'",
-            (user_id,)
-        )
-        total_answers, correct_answers = await cursor.fetchone()
-        total_answers = total_answers or 0
-        correct_answers = correct_answers or 0
-
-        # Статистика по разделам
-        cursor = await db.execute('''
-            SELECT s.name, COUNT(ua.id), SUM(CASE WHEN ua.is_correct = 1 THEN 1 ELSE 0 END)
-            FROM user_answers ua
-            JOIN tasks t ON ua.task_id = t.id
-            JOIN sections s ON t.section_id = s.id
-            WHERE ua.user_id = ? AND ua.action_type = 'answered'
-            GROUP BY s.name
-        ''', (user_id,))
-        sections_stats = await cursor.fetchall()
+    # Находим внутренний ID пользователя
+    identity = await get_identity(telegram_id)
+    if not identity:
+        return None
+    user_id = identity.id
+
+    async with connect() as db:
+        cursor = await db.execute(USER_STATISTICS_QUERY, (user_id,))
+        rows = await cursor.fetchall()
 
         return {
-            "total": total_answers,
-            "correct": correct_answers,
-            "sections": sections_stats
+            "total": sum(row[1] for row in rows),
+            "correct": sum(row[2] for row in rows),
+            "sections": [row for row in rows if row[0] is not None and row[1] > 0]
         }
 
 # database/database.py
 
+async def _catalog_version(db):
+    cursor = await db.execute("SELECT value FROM meta WHERE key = 'catalog_version'")
+    row = await cursor.fetchone()
+    return row[0] if row else 0
+
 async def add_new_task(task_data):
-    async with aiosqlite.connect(DB_NAME) as db:
+    async with connect() as db:
         try:
+            # IMMEDIATE: между чтением версии каталога и вставкой его не изменит другой процесс
+            await db.execute("BEGIN IMMEDIATE")
+            version_before = await _catalog_version(db)
             # 1. Вставляем основную информацию о задаче
             cursor = await db.execute(
                 "INSERT INTO tasks (section_id, task_type, photo_file_id, hint_text, solution_data, solution_type) VALUES (?, ?, ?, ?, ?, ?)",
@@ -203,55 +507,381 @@ async def add_new_task(task_data):
                         (task_id, choice, 0)
                     )
             elif task_data['type'] == 'text_input':
-                print(f"--- ПЫТАЮСЬ СОХРАНИТЬ ТЕКСТОВЫЙ ОТВЕТ для task_id {task_id}: {task_data['text_answer']} ---")
                 await db.execute(
                     "INSERT INTO task_text_answers (task_id, correct_answer) VALUES (?, ?)",
                     (task_id, task_data['text_answer'])
                 )
 
             # 3. Подтверждаем ВСЮ транзакцию ОДИН раз в конце
+            version_after = await _catalog_version(db)
             await db.commit()
+            # 4. Только после коммита задача становится доступной для выбора
+            task_cache.invalidate(task_id)
+            sections_catalog.invalidate()
+            if task_index.loaded:
+                task_index.add(task_data['section_id'], task_id, task_data['type'], task_data['photo'])
+                # Своя запись не должна вызывать полную перезагрузку индекса при сверке версии
+                task_index.advance(version_before, version_after)
 
-        except Exception as e:
-            print(f"Error adding task to DB: {e}")
+        except Exception:
+            logging.exception("Не удалось добавить задачу в раздел %s", task_data.get('section_id'))
             await db.rollback() # Откатываем изменения в случае ошибки
+            raise
+
+async def get_or_create_sections(db, names):
+    """Возвращает {название: id} для разделов, создавая недостающие. Коммит - на вызывающем."""
+    names = list(dict.fromkeys(names))
+    if not names:
+        return {}
+    placeholders = ", ".join("?" * len(names))
+    query = f"SELECT name, id FROM sections WHERE name IN ({placeholders})"
+    cursor = await db.execute(query, names)
+    section_ids = dict(await cursor.fetchall())
+    missing = [(name,) for name in names if name not in section_ids]
+    if missing:
+        await db.executemany("INSERT INTO sections (name) VALUES (?)", missing)
+        cursor = await db.execute(query, names)
+        section_ids = dict(await cursor.fetchall())
+    return section_ids
+
+async def add_tasks_bulk(tasks):
+    """Добавляет пачку задач одной транзакцией, возвращает их id.
+
+    tasks - словари в формате add_new_task, но с названием раздела в 'section'
+    вместо 'section_id'. id задач назначаются заранее по sqlite_sequence (BEGIN
+    IMMEDIATE не даст другому процессу занять их), поэтому варианты ответов вставляются
+    тем же executemany, а не построчно.
+    """
+    async with connect() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            version_before = await _catalog_version(db)
+            section_ids = await get_or_create_sections(db, [task['section'] for task in tasks])
+            # Как AUTOINCREMENT: следующий id берется из sqlite_sequence, чтобы не занять id
+            # удаленных задач, на которые еще ссылаются старые ответы и прогресс
+            cursor = await db.execute(
+                "SELECT MAX((SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'tasks'), "
+                "(SELECT COALESCE(MAX(id), 0) FROM tasks))"
+            )
+            first_id = (await cursor.fetchone())[0] + 1
+            task_rows, choice_rows, answer_rows = [], [], []
+            for task_id, task in enumerate(tasks, first_id):
+                task['section_id'] = section_ids[task['section']]
+                task_rows.append((task_id, task['section_id'], task['type'], task['photo'],
+                                  task['hint'], task['solution_data'], task['solution_type']))
+                if task['type'] == 'multiple_choice':
+                    choice_rows.append((task_id, task['correct_choice'], 1))
+                    choice_rows.extend((task_id, choice, 0) for choice in task['incorrect_choices'])
+                else:
+                    answer_rows.append((task_id, task['text_answer']))
+            await db.executemany(
+                "INSERT INTO tasks (id, section_id, task_type, photo_file_id, hint_text, solution_data, solution_type) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                task_rows
+            )
+            await db.executemany(
+                "INSERT INTO task_choices (task_id, choice_text, is_correct) VALUES (?, ?, ?)", choice_rows
+            )
+            await db.executemany(
+                "INSERT INTO task_text_answers (task_id, correct_answer) VALUES (?, ?)", answer_rows
+            )
+            version_after = await _catalog_version(db)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+    task_ids = list(range(first_id, first_id + len(tasks)))
+    for task_id in task_ids:
+        task_cache.invalidate(task_id)
+    sections_catalog.invalidate()
+    if task_index.loaded:
+        for task_id, task in enumerate(tasks, first_id):
+            task_index.add(task['section_id'], task_id, task['type'], task['photo'])
+        task_index.advance(version_before, version_after)
+    return task_ids
+
+# --- Аналитика по классу ---
+
+async def refresh_cohort_stats():
+    """Один проход свертки лога в аналитику; возвращает число учтенных id (0 - лог догнан)."""
+    async with connect() as db:
+        return await apply_new_answers(db)
+
+cohort_refresher = CohortRefresher(refresh_cohort_stats, COHORT_REFRESH_INTERVAL)
+
+async def start_cohort_refresher():
+    cohort_refresher.start()
+
+async def stop_cohort_refresher():
+    await cohort_refresher.stop()
+
+async def regrade_answers(task_ids=None, section_id=None, check_only=False):
+    """Перепроверяет лог ответов по текущим ключам задач (см. database/regrade.py)
+    и сбрасывает то, что в памяти зависит от оценок: рейтинг, прогресс, кэш задач."""
+    async with connect() as db:
+        report = await _regrade_answers(db, task_ids, section_id, check_only=check_only)
+    if not check_only:
+        # Варианты ответа с признаком верности лежат в кэше задач и в заготовленных задачах
+        task_cache.invalidate()
+        task_prefetcher.clear()
+        if report['changed']:
+            # Перепроверка подняла версию каталога: перечитываем индекс на ней, чтобы не делать
+            # этого второй раз при сверке; заодно сбрасываются маски прогресса
+            if task_index.loaded:
+                await load_task_index()
+            else:
+                progress_tracker.clear()
+            if leaderboard.loaded:
+                await load_leaderboard()
+    return report
+
+async def get_cohort_sections():
+    """[(section_id, name, tasks, students, answered, accuracy, hint_rate, solution_rate, median_attempts)]"""
+    async with connect() as db:
+        cursor = await db.execute(
+            """
+            SELECT cs.section_id, s.name, cs.tasks, cs.students, cs.answered, cs.accuracy,
+                   cs.hint_rate, cs.solution_rate, cs.median_attempts
+            FROM section_cohort_stats cs
+            LEFT JOIN sections s ON s.id = cs.section_id
+            ORDER BY cs.section_id
+            """
+        )
+        return await cursor.fetchall()
+
+# {section_filter} - пусто или "AND ts.section_id = ?", {order} - ASC (самые трудные) или DESC
+COHORT_TASKS_QUERY = """
+    SELECT ts.task_id, ts.section_id, ts.students, ts.accuracy,
+           ts.hint_rate, ts.solution_rate, ts.median_attempts
+    FROM task_stats ts
+    WHERE ts.students >= ? AND ts.accuracy IS NOT NULL {section_filter}
+    ORDER BY ts.accuracy {order}, ts.students DESC
+    LIMIT ?
+"""
+
+async def get_cohort_tasks(section_id=None, hardest=True, limit=5, min_students=COHORT_MIN_STUDENTS):
+    """Самые трудные (или легкие) задачи по точности среди тех, где ответили хотя бы min_students учеников.
+    [(task_id, section_id, students, accuracy, hint_rate, solution_rate, median_attempts)]"""
+    order = "ASC" if hardest else "DESC"
+    section_filter = "AND ts.section_id = ?" if section_id is not None else ""
+    params = (min_students, section_id, limit) if section_id is not None else (min_students, limit)
+    async with connect() as db:
+        cursor = await db.execute(COHORT_TASKS_QUERY.format(section_filter=section_filter, order=order), params)
+        return await cursor.fetchall()
 
 # database/database.py
 # ... (в конец файла)
 
 STUDENTS_PER_PAGE = 10
 
-async def get_all_students(page=1):
-    async with aiosqlite.connect(DB_NAME) as db:
-        offset = (page - 1) * STUDENTS_PER_PAGE
-        cursor = await db.execute(
-            "SELECT telegram_id, full_name FROM users WHERE role = 'student' ORDER BY registration_date DESC LIMIT ? OFFSET ?",
-            (STUDENTS_PER_PAGE, offset)
+# Порядки списка учеников: (FROM, ключ сортировки, по убыванию?).
+# CROSS JOIN фиксирует порядок обхода таблиц, чтобы SQLite шел по индексу ключа сортировки.
+STUDENT_SORTS = {
+    'new': ("users u CROSS JOIN user_activity a ON a.user_id = u.id", ("u.registration_date", "u.id"), True),
+    'active': ("user_activity a CROSS JOIN users u ON u.id = a.user_id", ("a.last_activity", "a.user_id"), True),
+    'accuracy': ("user_activity a CROSS JOIN users u ON u.id = a.user_id", ("a.accuracy", "a.user_id"), True),
+    'name': ("users u CROSS JOIN user_activity a ON a.user_id = u.id", ("u.name_search", "u.id"), False),
+}
+
+def students_page_query(sort='new', query=None, cursor_id=None, backwards=False, limit=STUDENTS_PER_PAGE):
+    """SQL и параметры страницы списка учеников (см. get_students_page); limit + 1 строк."""
+    from_clause, key, descending = STUDENT_SORTS[sort]
+    key_list = ", ".join(key)
+    # Унарный плюс не дает SQLite взять индекс по role вместо индекса ключа сортировки
+    conditions = ["u.role = 'student'" if sort == 'new' else "+u.role = 'student'"]
+    params = []
+    if query:
+        prefix = name_search_key(query)
+        conditions.append("u.name_search >= ? AND u.name_search < ?")
+        params += [prefix, prefix + "\U0010ffff"]
+
+    if cursor_id is not None:
+        # Ключ граничного ученика берем из БД, поэтому в callback_data хватает одного id
+        forward_op = "<" if descending else ">"
+        op = {"<": ">", ">": "<"}[forward_op] if backwards else forward_op
+        conditions.append(
+            f"({key_list}) {op} (SELECT {key_list} FROM {from_clause} WHERE u.id = ?)"
         )
-        return await cursor.fetchall()
+        params.append(cursor_id)
+
+    # Идем назад - сортируем в обратную сторону, а потом разворачиваем результат
+    order = "DESC" if descending != backwards else "ASC"
+    order_by = ", ".join(f"{column} {order}" for column in key)
+    sql = f"""
+        SELECT u.id, u.telegram_id, u.full_name, a.answered, a.accuracy, a.last_activity
+        FROM {from_clause}
+        WHERE {" AND ".join(conditions)}
+        ORDER BY {order_by}
+        LIMIT ?
+    """
+    return sql, params + [limit + 1]  # лишняя строка говорит, есть ли еще страница в эту сторону
+
+async def get_students_page(sort='new', after_id=None, before_id=None, query=None, limit=STUDENTS_PER_PAGE):
+    """Страница списка учеников с курсорной (keyset) пагинацией.
+
+    after_id / before_id - внутренний id последнего / первого ученика соседней страницы;
+    без них возвращается первая страница. query - поиск по началу имени.
+    Возвращает (строки, есть_предыдущая, есть_следующая), строка:
+    (id, telegram_id, full_name, answered, accuracy, last_activity).
+    """
+    backwards = before_id is not None
+    cursor_id = before_id if backwards else after_id
+    async with connect() as db:
+        cursor = await db.execute(*students_page_query(sort, query, cursor_id, backwards, limit))
+        rows = await cursor.fetchall()
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+        return rows, more, True
+    return rows, cursor_id is not None, more
+
+LAST_ANSWERS_QUERY = """
+    SELECT task_id, answer_given, is_correct, timestamp, action_type
+    FROM user_answers
+    WHERE user_id = ?
+    ORDER BY timestamp DESC
+    LIMIT ?
+"""
 
 async def get_student_last_answers(telegram_id, limit=10):
-    async with aiosqlite.connect(DB_NAME) as db:
+    identity = await get_identity(telegram_id)
+    if not identity:
+        return []
+
+    async with connect() as db:
+        cursor = await db.execute(LAST_ANSWERS_QUERY, (identity.id, limit))
+        return await cursor.fetchall()
+
+# Заблокировавшие бота пропускаются - им все равно ничего не доставить
+STUDENT_IDS_QUERY = "SELECT telegram_id FROM users WHERE role = 'student' AND is_blocked = 0"
+
+async def get_all_user_ids():
+    async with connect() as db:
+        cursor = await db.execute(STUDENT_IDS_QUERY)
+        return await cursor.fetchall()
+
+async def unblock_user(telegram_id):
+    """Снимает пометку "заблокировал бота": пользователь снова нам написал."""
+    async with connect() as db:
+        await db.execute("UPDATE users SET is_blocked = 0 WHERE telegram_id = ? AND is_blocked = 1", (telegram_id,))
+        await db.commit()
+
+# --- Напоминания ученикам ---
+
+# Лог пишется в фоне, и активность может попасть в БД позже сверки - сверки перекрываются
+REMINDER_SYNC_OVERLAP = 3600
+
+async def sync_reminders():
+    """Ставит в расписание напоминаний учеников, активных со времени прошлой сверки.
+    Первая сверка (при старте) берет всех, кому еще может прийти напоминание.
+    Обе идут по индексу на user_activity.last_activity. Возвращает число прочитанных учеников."""
+    now = time.time()
+    if reminder_scheduler.synced_until is None:
+        since = now - reminder_scheduler.horizon()
+    else:
+        since = reminder_scheduler.synced_until - REMINDER_SYNC_OVERLAP
+    async with connect() as db:
         cursor = await db.execute(
-            "SELECT id FROM users WHERE telegram_id = ?", (telegram_id,)
+            REMINDER_CANDIDATES.format(condition="a.last_activity >= ?"), (_utc_timestamp(since),)
+        )
+        rows = await cursor.fetchall()
+    for telegram_id, _, _, last_activity, sent in rows:
+        reminder_scheduler.schedule(telegram_id, last_activity, sent, now)
+    reminder_scheduler.synced_until = now
+    reminder_scheduler.loaded = True
+    return len(rows)
+
+async def get_reminder_recipients(telegram_ids):
+    """Актуальные данные для отправки напоминаний:
+    telegram_id -> (user_id, last_activity, last_activity в epoch, отправлено напоминаний).
+    Не ученики и заблокировавшие бота не возвращаются."""
+    if not telegram_ids:
+        return {}
+    placeholders = ", ".join("?" * len(telegram_ids))
+    async with connect() as db:
+        cursor = await db.execute(REMINDER_RECIPIENTS.format(placeholders=placeholders), list(telegram_ids))
+        return {row[0]: row[1:] for row in await cursor.fetchall()}
+
+async def save_reminder_results(sent, blocked):
+    """sent - [(user_id, last_activity, отправлено напоминаний)] для учеников, получивших напоминание;
+    blocked - telegram_id заблокировавших бота, они помечаются в users."""
+    now = _utc_timestamp()
+    async with connect() as db:
+        await db.executemany(
+            "INSERT INTO reminder_state (user_id, activity_at, sent, last_sent) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET activity_at = excluded.activity_at, sent = excluded.sent, "
+            "last_sent = excluded.last_sent",
+            [(user_id, activity_at, count, now) for user_id, activity_at, count in sent]
         )
-        user_id = await cursor.fetchone()
-        if not user_id:
-            return []
+        if blocked:
+            await db.executemany("UPDATE users SET is_blocked = 1 WHERE telegram_id = ?", [(t,) for t in blocked])
+        await db.commit()
 
+# --- Функции для рассылок ---
+
+async def create_broadcast_job(from_chat_id, message_id, admin_chat_id, status_message_id):
+    """Создает задание рассылки и список получателей. Возвращает (job_id, число получателей)."""
+    async with connect() as db:
         cursor = await db.execute(
-            """
-            SELECT task_id, answer_given, is_correct, timestamp, action_type
-            FROM user_answers
-            WHERE user_id = ?
-            ORDER BY timestamp DESC
-            LIMIT ?
-            """,
-            (user_id[0], limit)
+            "INSERT INTO broadcast_jobs (from_chat_id, message_id, admin_chat_id, status_message_id) VALUES (?, ?, ?, ?)",
+            (from_chat_id, message_id, admin_chat_id, status_message_id)
         )
-        return await cursor.fetchall()
+        job_id = cursor.lastrowid
+        cursor = await db.execute(
+            "INSERT INTO broadcast_recipients (job_id, telegram_id) "
+            "SELECT ?, telegram_id FROM users WHERE role = 'student' AND is_blocked = 0",
+            (job_id,)
+        )
+        total = cursor.rowcount
+        await db.commit()
+        return job_id, total
 
-async def get_all_user_ids():
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute("SELECT telegram_id FROM users WHERE role = 'student'")
-        return await cursor.fetchall()
\ No newline at end of file
+async def get_broadcast_job(job_id):
+    async with connect() as db:
+        cursor = await db.execute(
+            "SELECT id, from_chat_id, message_id, admin_chat_id, status_message_id, status FROM broadcast_jobs WHERE id = ?",
+            (job_id,)
+        )
+        return await cursor.fetchone()
+
+async def get_unfinished_broadcast_jobs():
+    async with connect() as db:
+        cursor = await db.execute("SELECT id FROM broadcast_jobs WHERE status = 'running'")
+        return [row[0] for row in await cursor.fetchall()]
+
+async def get_broadcast_pending_recipients(job_id):
+    async with connect() as db:
+        cursor = await db.execute(
+            "SELECT telegram_id FROM broadcast_recipients WHERE job_id = ? AND status = 'pending'", (job_id,)
+        )
+        return [row[0] for row in await cursor.fetchall()]
+
+async def get_broadcast_progress(job_id):
+    """Счетчики получателей задания по статусам: {'pending': ..., 'sent': ..., ...}."""
+    async with connect() as db:
+        cursor = await db.execute(
+            "SELECT status, COUNT(*) FROM broadcast_recipients WHERE job_id = ? GROUP BY status", (job_id,)
+        )
+        return dict(await cursor.fetchall())
+
+async def save_broadcast_results(job_id, results):
+    """Записывает пачку результатов доставки [(telegram_id, status), ...] одной транзакцией.
+    Получатели со статусом 'blocked' помечаются в users и не попадут в следующие рассылки."""
+    async with connect() as db:
+        await db.executemany(
+            "UPDATE broadcast_recipients SET status = ? WHERE job_id = ? AND telegram_id = ?",
+            [(status, job_id, telegram_id) for telegram_id, status in results]
+        )
+        blocked = [(telegram_id,) for telegram_id, status in results if status == 'blocked']
+        if blocked:
+            await db.executemany("UPDATE users SET is_blocked = 1 WHERE telegram_id = ?", blocked)
+        await db.commit()
+
+async def finish_broadcast_job(job_id):
+    async with connect() as db:
+        await db.execute(
+            "UPDATE broadcast_jobs SET status = 'done', finished_at = CURRENT_TIMESTAMP WHERE id = ?", (job_id,)
+        )
+        await db.commit()
\ No newline at end of file
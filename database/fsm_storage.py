@@ -0,0 +1,143 @@
+# database/fsm_storage.py
+import json
+import time
+from typing import Any, Mapping
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+
+from config import FSM_STATE_TTL, FSM_CACHE_TTL
+from database.database import connect
+
+# Как часто (в секундах) чистить простаивающие записи в памяти и просроченные в БД
+CLEANUP_INTERVAL = 300
+
+
+def _storage_key(key: StorageKey):
+    return ":".join(str(part) if part is not None else "" for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+    ))
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в локальной SQLite (таблица fsm_states) вместо MemoryStorage.
+
+    Состояния переживают перезапуск бота. Чтения обслуживаются из кэша в памяти,
+    изменения помечаются "грязными" и пишутся в БД одной транзакцией в flush(),
+    который вызывает FSMFlushMiddleware после обработки апдейта - так несколько
+    set_state/update_data внутри одного обработчика превращаются в одну запись.
+    Записи, к которым не обращались дольше cache_ttl, вытесняются из памяти,
+    а состояния старше state_ttl удаляются из БД.
+    """
+
+    def __init__(self, state_ttl=FSM_STATE_TTL, cache_ttl=FSM_CACHE_TTL):
+        self.state_ttl = state_ttl
+        self.cache_ttl = cache_ttl
+        self._cache = {}  # key -> [state, data, last_access]
+        self._dirty = set()
+        self._last_cleanup = time.monotonic()
+
+    async def _entry(self, key: StorageKey):
+        db_key = _storage_key(key)
+        entry = self._cache.get(db_key)
+        if entry is None:
+            async with connect() as db:
+                cursor = await db.execute(
+                    "SELECT state, data, updated_at FROM fsm_states WHERE key = ?", (db_key,)
+                )
+                row = await cursor.fetchone()
+            # Пока ждали БД, запись могла появиться в кэше - она новее
+            entry = self._cache.get(db_key)
+            if entry is None:
+                if row and row[2] >= time.time() - self.state_ttl:
+                    entry = [row[0], json.loads(row[1]), 0]
+                else:
+                    entry = [None, {}, 0]
+                self._cache[db_key] = entry
+        entry[2] = time.monotonic()
+        return db_key, entry
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        db_key, entry = await self._entry(key)
+        entry[0] = state.state if isinstance(state, State) else state
+        self._dirty.add(db_key)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        _, entry = await self._entry(key)
+        return entry[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        db_key, entry = await self._entry(key)
+        entry[1] = dict(data)
+        self._dirty.add(db_key)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, entry = await self._entry(key)
+        return entry[1].copy()
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> dict[str, Any]:
+        db_key, entry = await self._entry(key)
+        entry[1].update(data)
+        self._dirty.add(db_key)
+        return entry[1].copy()
+
+    async def flush(self):
+        """Пишет все измененные состояния одной транзакцией."""
+        if self._dirty:
+            keys, self._dirty = self._dirty, set()
+            now = time.time()
+            upserts, deletes = [], []
+            for db_key in keys:
+                entry = self._cache.get(db_key)
+                if entry is None:
+                    continue
+                state, data, _ = entry
+                if state is None and not data:
+                    deletes.append((db_key,))
+                else:
+                    upserts.append((db_key, state, json.dumps(data, ensure_ascii=False), now))
+            try:
+                async with connect() as db:
+                    if upserts:
+                        await db.executemany(
+                            "INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+                            "ON CONFLICT (key) DO UPDATE SET state = excluded.state, data = excluded.data, "
+                            "updated_at = excluded.updated_at",
+                            upserts
+                        )
+                    if deletes:
+                        await db.executemany("DELETE FROM fsm_states WHERE key = ?", deletes)
+                    await db.commit()
+            except Exception:
+                # Не потеряем изменения: запишем их при следующем flush()
+                self._dirty |= keys
+                raise
+
+        if time.monotonic() - self._last_cleanup > CLEANUP_INTERVAL:
+            await self._cleanup()
+
+    async def _cleanup(self):
+        self._last_cleanup = time.monotonic()
+        idle_since = self._last_cleanup - self.cache_ttl
+        for db_key in [k for k, entry in self._cache.items() if entry[2] < idle_since and k not in self._dirty]:
+            del self._cache[db_key]
+        async with connect() as db:
+            await db.execute("DELETE FROM fsm_states WHERE updated_at < ?", (time.time() - self.state_ttl,))
+            await db.commit()
+
+    async def close(self) -> None:
+        await self.flush()
+
+
+class FSMFlushMiddleware(BaseMiddleware):
+    """Сбрасывает изменения FSM в БД после обработки каждого апдейта."""
+
+    def __init__(self, storage: SQLiteStorage):
+        self.storage = storage
+
+    async def __call__(self, handler, event, data):
+        try:
+            return await handler(event, data)
+        finally:
+            await self.storage.flush()
@@ -0,0 +1,55 @@
+# database/identity.py
+from collections import OrderedDict, namedtuple
+
+from config import IDENTITY_CACHE_SIZE
+
+Identity = namedtuple("Identity", ["id", "telegram_id", "full_name", "role"])
+
+
+class IdentityMap:
+    """Соответствие telegram_id -> (внутренний id, имя, роль) в памяти процесса.
+
+    Почти каждый апдейт начинается с поиска пользователя по telegram_id,
+    а эти данные практически не меняются. Заполняется лениво при первом
+    обращении и в add_user; самые давно неиспользуемые записи вытесняются.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, telegram_id):
+        identity = self._items.get(telegram_id)
+        if identity is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(telegram_id)
+        self.hits += 1
+        return identity
+
+    def put(self, identity):
+        self._items[identity.telegram_id] = identity
+        self._items.move_to_end(identity.telegram_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, telegram_id=None):
+        if telegram_id is None:
+            self._items.clear()
+        else:
+            self._items.pop(telegram_id, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+identity_map = IdentityMap(IDENTITY_CACHE_SIZE)
@@ -0,0 +1,163 @@
+# database/leaderboard.py
+import time
+
+
+class RankIndex:
+    """Рейтинг учеников по целочисленному счету с поиском места и топа за O(log n).
+
+    Счет ученика - число верных ответов. Дерево Фенвика хранит, сколько учеников
+    набрали каждый счет, поэтому место ученика (1 + число учеников со счетом выше)
+    и k-й по величине счет находятся за O(log max_score). Ученики с одинаковым
+    счетом делят место, в топе они идут по возрастанию id.
+    Ученики с нулевым счетом в рейтинг не входят.
+    """
+
+    def __init__(self):
+        self._scores = {}    # user_id -> счет
+        self._buckets = {}   # счет -> множество user_id
+        self._tree = [0]     # дерево Фенвика по счетам 1..capacity (индекс 0 не используется)
+        self._capacity = 0
+        self.total = 0       # учеников со счетом > 0
+
+    def _grow(self, score):
+        capacity = max(score, 2 * self._capacity, 64)
+        self._tree = [0] * (capacity + 1)
+        self._capacity = capacity
+        for bucket_score, users in self._buckets.items():
+            self._update(bucket_score, len(users))
+
+    def _update(self, score, delta):
+        while score <= self._capacity:
+            self._tree[score] += delta
+            score += score & -score
+
+    def _count_upto(self, score):
+        """Число учеников со счетом от 1 до score."""
+        count = 0
+        score = min(score, self._capacity)
+        while score > 0:
+            count += self._tree[score]
+            score -= score & -score
+        return count
+
+    def _find(self, k):
+        """Наименьший счет s, при котором учеников со счетом <= s не меньше k (1 <= k <= total)."""
+        position = 0
+        step = 1 << self._capacity.bit_length()
+        while step:
+            following = position + step
+            if following <= self._capacity and self._tree[following] < k:
+                position = following
+                k -= self._tree[following]
+            step >>= 1
+        return position + 1
+
+    def set(self, user_id, score):
+        old = self._scores.get(user_id, 0)
+        if score == old:
+            return
+        if old > 0:
+            users = self._buckets[old]
+            users.discard(user_id)
+            if not users:
+                del self._buckets[old]
+            self._update(old, -1)
+            self.total -= 1
+        if score > 0:
+            if score > self._capacity:
+                self._grow(score)
+            self._buckets.setdefault(score, set()).add(user_id)
+            self._update(score, 1)
+            self._scores[user_id] = score
+            self.total += 1
+        else:
+            self._scores.pop(user_id, None)
+
+    def add(self, user_id, delta=1):
+        self.set(user_id, self._scores.get(user_id, 0) + delta)
+
+    def score(self, user_id):
+        return self._scores.get(user_id, 0)
+
+    def rank(self, user_id):
+        """Место ученика (1 - лучший) или None, если у него еще нет верных ответов."""
+        score = self._scores.get(user_id, 0)
+        if score <= 0:
+            return None
+        return 1 + self.total - self._count_upto(score)
+
+    def top(self, limit=10):
+        """[(место, user_id, счет)] - первые limit учеников."""
+        result = []
+        above = 0  # учеников со счетом выше текущего
+        while len(result) < limit and above < self.total:
+            score = self._find(self.total - above)
+            users = self._buckets[score]
+            for user_id in sorted(users)[:limit - len(result)]:
+                result.append((above + 1, user_id, score))
+            above += len(users)
+        return result
+
+    def clear(self):
+        self.__init__()
+
+
+class Leaderboard:
+    """Общий рейтинг и рейтинги по разделам.
+
+    Строится при старте из user_section_stats - сводки лога, которая пишется
+    в одной транзакции с каждым ответом и потому сама служит сохраненным
+    состоянием рейтинга. Дальше рейтинг обновляется в памяти после записи
+    каждой пачки ответов. Если ответы пишут и другие процессы (многопроцессный
+    режим), рейтинг дополнительно перечитывается раз в reload_interval секунд.
+    """
+
+    def __init__(self, reload_interval=0):
+        self.overall = RankIndex()
+        self.sections = {}  # section_id -> RankIndex
+        self.loaded = False
+        self.loaded_at = 0.0
+        self.reload_interval = reload_interval  # 0 - не перечитывать
+
+    def section(self, section_id):
+        index = self.sections.get(section_id)
+        if index is None:
+            index = self.sections[section_id] = RankIndex()
+        return index
+
+    def stale(self):
+        return bool(self.reload_interval) and time.monotonic() - self.loaded_at >= self.reload_interval
+
+    async def load(self, db):
+        # Новый рейтинг строится рядом со старым: пока идет чтение, запросы видят прежний
+        self.loaded_at = time.monotonic()
+        overall, sections = RankIndex(), {}
+        cursor = await db.execute(
+            """
+            SELECT st.user_id, st.section_id, st.correct
+            FROM user_section_stats st
+            JOIN users u ON u.id = st.user_id
+            WHERE u.role = 'student' AND st.correct > 0
+            """
+        )
+        totals = {}
+        async for user_id, section_id, correct in cursor:
+            totals[user_id] = totals.get(user_id, 0) + correct
+            if section_id:
+                index = sections.get(section_id)
+                if index is None:
+                    index = sections[section_id] = RankIndex()
+                index.set(user_id, correct)
+        for user_id, correct in totals.items():
+            overall.set(user_id, correct)
+        self.overall, self.sections = overall, sections
+        self.loaded = True
+
+    def record(self, user_id, section_id):
+        """Учитывает один верный ответ ученика в задаче раздела section_id (None - раздел неизвестен)."""
+        self.overall.add(user_id)
+        if section_id:
+            self.section(section_id).add(user_id)
+
+
+leaderboard = Leaderboard()
@@ -0,0 +1,274 @@
+# database/migrations.py
+"""Версионные миграции схемы.
+
+Текущая версия схемы хранится в PRAGMA user_version самого файла БД,
+поэтому существующий physics_bot.db обновляется на месте при старте бота.
+
+Проверить, как миграции меняют планы запросов, не трогая рабочую базу:
+    python -m database.migrations --dry-run
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sqlite3
+import tempfile
+
+import aiosqlite
+
+from database.cohort import CREATE_USER_TASK_ATTEMPTS, CREATE_TASK_STATS, CREATE_SECTION_COHORT_STATS
+from database.regrade import ANSWERS_QUERY, CHANGED_QUERY
+from database.reminders import CREATE_REMINDER_STATE, REMINDER_CANDIDATES, REMINDER_RECIPIENTS
+from database.stats import (
+    CREATE_USER_SECTION_STATS, rebuild_user_section_stats,
+    CREATE_USER_ACTIVITY, rebuild_user_activity
+)
+
+
+def name_search_key(full_name):
+    """Ключ для поиска ученика по началу имени: SQLite не умеет приводить кириллицу к нижнему регистру."""
+    return (full_name or "").strip().lower()
+
+
+async def _fill_name_search(db):
+    cursor = await db.execute("SELECT id, full_name FROM users")
+    rows = await cursor.fetchall()
+    await db.executemany(
+        "UPDATE users SET name_search = ? WHERE id = ?",
+        [(name_search_key(full_name), user_id) for user_id, full_name in rows]
+    )
+
+
+# Каждая миграция: (версия, описание, список шагов).
+# Шаг - это SQL-строка или async-функция, принимающая соединение.
+# Версии только растут; уже выпущенные миграции не редактируются.
+MIGRATIONS = [
+    (1, "Индексы для выборки задач и вариантов ответа", [
+        "CREATE INDEX IF NOT EXISTS idx_tasks_section ON tasks (section_id)",
+        "CREATE INDEX IF NOT EXISTS idx_task_choices_task ON task_choices (task_id)",
+        "CREATE INDEX IF NOT EXISTS idx_task_text_answers_task ON task_text_answers (task_id)",
+    ]),
+    (2, "Индексы для лога ответов", [
+        "CREATE INDEX IF NOT EXISTS idx_user_answers_user_action_ts ON user_answers (user_id, action_type, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_user_answers_user_ts ON user_answers (user_id, timestamp)",
+    ]),
+    (3, "Индекс для списка учеников", [
+        "CREATE INDEX IF NOT EXISTS idx_users_role_registration ON users (role, registration_date)",
+    ]),
+    (4, "Сводная статистика по (ученик, раздел) с заполнением из лога", [
+        CREATE_USER_SECTION_STATS,
+        rebuild_user_section_stats,
+    ]),
+    (5, "Хранилище состояний FSM", [
+        """
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states (updated_at)",
+    ]),
+    (6, "Задания рассылки с доставкой по получателям и пометка заблокировавших бота", [
+        "ALTER TABLE users ADD COLUMN is_blocked INTEGER NOT NULL DEFAULT 0",
+        """
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            from_chat_id BIGINT NOT NULL,
+            message_id INTEGER NOT NULL,
+            admin_chat_id BIGINT NOT NULL,
+            status_message_id INTEGER,
+            status VARCHAR(20) NOT NULL DEFAULT 'running',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            job_id INTEGER NOT NULL,
+            telegram_id BIGINT NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            PRIMARY KEY (job_id, telegram_id),
+            FOREIGN KEY (job_id) REFERENCES broadcast_jobs(id)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_status ON broadcast_recipients (job_id, status)",
+    ]),
+    (7, "Поиск учеников по имени и сводка активности для постраничного списка", [
+        "ALTER TABLE users ADD COLUMN name_search TEXT",
+        _fill_name_search,
+        "CREATE INDEX IF NOT EXISTS idx_users_name_search ON users (name_search)",
+        CREATE_USER_ACTIVITY,
+        rebuild_user_activity,
+        "CREATE INDEX IF NOT EXISTS idx_user_activity_last ON user_activity (last_activity)",
+        "CREATE INDEX IF NOT EXISTS idx_user_activity_accuracy ON user_activity (accuracy)",
+    ]),
+    (8, "Версия каталога разделов, которую увеличивают триггеры на sections и tasks", [
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+        "INSERT OR IGNORE INTO meta (key, value) VALUES ('catalog_version', 0)",
+        "CREATE TRIGGER IF NOT EXISTS trg_sections_insert_catalog AFTER INSERT ON sections "
+        "BEGIN UPDATE meta SET value = value + 1 WHERE key = 'catalog_version'; END",
+        "CREATE TRIGGER IF NOT EXISTS trg_sections_update_catalog AFTER UPDATE ON sections "
+        "BEGIN UPDATE meta SET value = value + 1 WHERE key = 'catalog_version'; END",
+        "CREATE TRIGGER IF NOT EXISTS trg_sections_delete_catalog AFTER DELETE ON sections "
+        "BEGIN UPDATE meta SET value = value + 1 WHERE key = 'catalog_version'; END",
+        "CREATE TRIGGER IF NOT EXISTS trg_tasks_insert_catalog AFTER INSERT ON tasks "
+        "BEGIN UPDATE meta SET value = value + 1 WHERE key = 'catalog_version'; END",
+        "CREATE TRIGGER IF NOT EXISTS trg_tasks_update_catalog AFTER UPDATE ON tasks "
+        "BEGIN UPDATE meta SET value = value + 1 WHERE key = 'catalog_version'; END",
+        "CREATE TRIGGER IF NOT EXISTS trg_tasks_delete_catalog AFTER DELETE ON tasks "
+        "BEGIN UPDATE meta SET value = value + 1 WHERE key = 'catalog_version'; END",
+    ]),
+    (9, "Индекс по времени ответа для выгрузки лога за период", [
+        "CREATE INDEX IF NOT EXISTS idx_user_answers_timestamp ON user_answers (timestamp)",
+    ]),
+    (10, "Свертка лога для аналитики по классу (заполняется в фоне)", [
+        CREATE_USER_TASK_ATTEMPTS,
+        CREATE_TASK_STATS,
+        CREATE_SECTION_COHORT_STATS,
+        "CREATE INDEX IF NOT EXISTS idx_task_stats_accuracy ON task_stats (accuracy)",
+    ]),
+    (11, "Индекс ответов по задаче для перепроверки после исправления ключа", [
+        "CREATE INDEX IF NOT EXISTS idx_user_answers_task ON user_answers (task_id)",
+    ]),
+    (12, "Состояние напоминаний ученикам: сколько отправлено после последней активности", [
+        CREATE_REMINDER_STATE,
+    ]),
+    (13, "Версию каталога увеличивают и правки ключей ответов (task_choices, task_text_answers)", [
+        "CREATE TRIGGER IF NOT EXISTS trg_task_choices_insert_catalog AFTER INSERT ON task_choices "
+        "BEGIN UPDATE meta SET value = value + 1 WHERE key = 'catalog_version'; END",
+        "CREATE TRIGGER IF NOT EXISTS trg_task_choices_update_catalog AFTER UPDATE ON task_choices "
+        "BEGIN UPDATE meta SET value = value + 1 WHERE key = 'catalog_version'; END",
+        "CREATE TRIGGER IF NOT EXISTS trg_task_choices_delete_catalog AFTER DELETE ON task_choices "
+        "BEGIN UPDATE meta SET value = value + 1 WHERE key = 'catalog_version'; END",
+        "CREATE TRIGGER IF NOT EXISTS trg_task_text_answers_insert_catalog AFTER INSERT ON task_text_answers "
+        "BEGIN UPDATE meta SET value = value + 1 WHERE key = 'catalog_version'; END",
+        "CREATE TRIGGER IF NOT EXISTS trg_task_text_answers_update_catalog AFTER UPDATE ON task_text_answers "
+        "BEGIN UPDATE meta SET value = value + 1 WHERE key = 'catalog_version'; END",
+        "CREATE TRIGGER IF NOT EXISTS trg_task_text_answers_delete_catalog AFTER DELETE ON task_text_answers "
+        "BEGIN UPDATE meta SET value = value + 1 WHERE key = 'catalog_version'; END",
+    ]),
+]
+
+def query_plans():
+    """Запросы бота, планы которых показывает --dry-run: [(название, SQL, параметры)].
+
+    Берутся те же константы, что выполняет бот, поэтому отчет не расходится с
+    кодом. Параметры подставлены только для того, чтобы SQLite смог построить
+    план. database.py сам импортирует этот модуль, отсюда импорт внутри функции.
+    """
+    from database import database as db
+    from database.catalog import SECTIONS_QUERY
+    from database.task_cache import TASK_QUERY
+    from services.answer_export import EXPORT_QUERY
+
+    return [
+        ("get_identity", db.IDENTITY_QUERY, (1,)),
+        ("get_sections_catalog", SECTIONS_QUERY, ()),
+        ("get_random_task_by_section (индекс не загружен)", db.RANDOM_TASK_QUERY, (1,)),
+        ("get_task (задача с вариантами и ответом)", TASK_QUERY, (1,)),
+        ("get_user_progress", db.PROGRESS_QUERY, (1,)),
+        ("get_user_statistics", db.USER_STATISTICS_QUERY, (1,)),
+        ("get_students_page (новые)", *db.students_page_query('new', cursor_id=1)),
+        ("get_students_page (по активности)", *db.students_page_query('active', cursor_id=1)),
+        ("get_students_page (по точности)", *db.students_page_query('accuracy', cursor_id=1)),
+        ("get_students_page (поиск по имени)", *db.students_page_query('name', query="ив")),
+        ("get_student_last_answers", db.LAST_ANSWERS_QUERY, (1, 10)),
+        ("get_all_user_ids", db.STUDENT_IDS_QUERY, ()),
+        ("export_answers (за период)", EXPORT_QUERY, ("2024-01-01", "2024-02-01")),
+        ("get_cohort_tasks (самые трудные)",
+         db.COHORT_TASKS_QUERY.format(section_filter="", order="ASC"), (3, 5)),
+        ("regrade_answers (ответы задачи)", ANSWERS_QUERY, (1, 1000000)),
+        ("regrade_answers (кусок изменившихся ответов)", CHANGED_QUERY, ('["1"]', '["2"]', 1, 0, 1000000, 50000)),
+        ("sync_reminders", REMINDER_CANDIDATES.format(condition="a.last_activity >= ?"), ("2024-01-01 00:00:00",)),
+        ("get_reminder_recipients", REMINDER_RECIPIENTS.format(placeholders="?"), (1,)),
+    ]
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+async def get_schema_version(db):
+    cursor = await db.execute("PRAGMA user_version")
+    return (await cursor.fetchone())[0]
+
+
+async def apply_migrations(db):
+    """Применяет к соединению все миграции новее текущей user_version. Возвращает новую версию."""
+    version = await get_schema_version(db)
+    for migration_version, description, steps in MIGRATIONS:
+        if migration_version <= version:
+            continue
+        logging.info("Миграция схемы %d: %s", migration_version, description)
+        await db.execute("BEGIN")
+        try:
+            for step in steps:
+                if callable(step):
+                    await step(db)
+                else:
+                    await db.execute(step)
+            # PRAGMA не принимает параметры, версия - всегда целое число из списка выше
+            await db.execute(f"PRAGMA user_version = {int(migration_version)}")
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        version = migration_version
+    return version
+
+
+# --- Режим dry-run ---
+
+def _print_plans(conn, title):
+    print(f"\n===== {title} =====")
+    for name, query, params in query_plans():
+        print(f"\n[{name}]")
+        try:
+            for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params):
+                print(f"  {row[-1]}")
+        except sqlite3.Error as e:
+            print(f"  (план недоступен: {e})")
+
+
+async def _migrate_file(db_name):
+    async with aiosqlite.connect(db_name) as db:
+        return await apply_migrations(db)
+
+
+def dry_run(db_name):
+    """Копирует базу во временный файл, мигрирует копию и печатает планы до и после."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        copy_name = os.path.join(tmp_dir, "dry_run.db")
+        source = sqlite3.connect(db_name)
+        copy = sqlite3.connect(copy_name)
+        source.backup(copy)  # оригинал не меняется
+        version = source.execute("PRAGMA user_version").fetchone()[0]
+        source.close()
+        print(f"Версия схемы {db_name}: {version}, последняя доступная: {latest_version()}")
+
+        _print_plans(copy, "ДО миграций")
+        copy.close()
+
+        asyncio.run(_migrate_file(copy_name))
+
+        copy = sqlite3.connect(copy_name)
+        _print_plans(copy, "ПОСЛЕ миграций")
+        copy.close()
+
+
+if __name__ == "__main__":
+    from database.database import DB_NAME
+
+    parser = argparse.ArgumentParser(description="Миграции схемы physics_bot")
+    parser.add_argument("--db", default=DB_NAME, help="путь к файлу БД")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="не менять базу, а показать EXPLAIN QUERY PLAN до и после миграций")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.dry_run:
+        dry_run(args.db)
+    else:
+        print(f"Схема обновлена до версии {asyncio.run(_migrate_file(args.db))}")
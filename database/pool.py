@@ -0,0 +1,62 @@
+# database/pool.py
+import asyncio
+from contextlib import asynccontextmanager
+
+import aiosqlite
+
+from config import DB_POOL_SIZE, DB_CACHE_SIZE_KB, DB_STATEMENT_CACHE, DB_BUSY_TIMEOUT_MS
+
+# Эти PRAGMA применяются к каждому соединению пула сразу после открытия.
+# WAL позволяет читателям не ждать писателя, а synchronous=NORMAL в режиме WAL
+# делает fsync только на чекпоинтах, а не на каждом коммите.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}",
+    "PRAGMA temp_store = MEMORY",
+    f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}",
+)
+
+
+class ConnectionPool:
+    """Пул долгоживущих соединений aiosqlite.
+
+    Соединения открываются один раз в open() и переиспользуются всеми запросами,
+    поэтому на каждый запрос больше не создается новый поток и новый дескриптор SQLite.
+    """
+
+    def __init__(self, db_name, size=DB_POOL_SIZE, statement_cache=DB_STATEMENT_CACHE):
+        self.db_name = db_name
+        self.size = max(1, size)
+        self.statement_cache = statement_cache
+        self._queue = asyncio.Queue()
+        self._connections = []
+
+    async def _connect(self):
+        db = await aiosqlite.connect(self.db_name, cached_statements=self.statement_cache)
+        for pragma in CONNECTION_PRAGMAS:
+            await db.execute(pragma)
+        return db
+
+    async def open(self):
+        for _ in range(self.size):
+            db = await self._connect()
+            self._connections.append(db)
+            self._queue.put_nowait(db)
+
+    @asynccontextmanager
+    async def acquire(self):
+        db = await self._queue.get()
+        try:
+            yield db
+        finally:
+            # Незакоммиченная транзакция не должна "протечь" к следующему пользователю соединения
+            if db.in_transaction:
+                await db.rollback()
+            self._queue.put_nowait(db)
+
+    async def close(self):
+        for db in self._connections:
+            await db.close()
+        self._connections.clear()
+        self._queue = asyncio.Queue()
@@ -0,0 +1,87 @@
+# database/prefetch.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from config import PREFETCH_SLOTS, PREFETCH_TTL
+
+
+class TaskPrefetcher:
+    """Заранее выбранная следующая задача ученика - по одному слоту на ученика.
+
+    Пока ученик решает показанную задачу, следующая для того же раздела
+    выбирается и загружается целиком в фоне, и кнопка "Следующая задача"
+    отвечает без обращения к БД. Слот привязан к разделу: при смене раздела
+    или по истечении ttl он сбрасывается. Если фоновая загрузка еще идет,
+    take() дожидается ее, а не запускает вторую.
+    """
+
+    def __init__(self, max_size=PREFETCH_SLOTS, ttl=PREFETCH_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._slots = OrderedDict()  # telegram_id -> (section_id, asyncio.Task, created_at)
+        self.hits = 0
+        self.misses = 0
+
+    def schedule(self, telegram_id, section_id, load):
+        """Запускает load() в фоне и кладет результат в слот ученика (вытесняя прежний)."""
+        self.invalidate(telegram_id)
+        task = asyncio.create_task(load())
+        task.add_done_callback(self._log_error)
+        self._slots[telegram_id] = (section_id, task, time.monotonic())
+        while len(self._slots) > self.max_size:
+            _, (_, oldest, _) = self._slots.popitem(last=False)
+            oldest.cancel()
+
+    @staticmethod
+    def _log_error(task):
+        if not task.cancelled() and task.exception() is not None:
+            logging.warning("Не удалось заранее загрузить задачу: %r", task.exception())
+
+    async def take(self, telegram_id, section_id):
+        """Забирает заранее загруженную задачу или None, если ее нет, она устарела или из другого раздела."""
+        slot = self._slots.pop(telegram_id, None)
+        if slot is None:
+            self.misses += 1
+            return None
+        slot_section_id, task, created_at = slot
+        if slot_section_id != section_id or time.monotonic() - created_at > self.ttl:
+            task.cancel()
+            self.misses += 1
+            return None
+        # Ждем через wait, а не await task: слот может отменить clear() из чужой (или этой же)
+        # загрузки, и такая отмена - просто промах, а не CancelledError в обработчике
+        await asyncio.wait({task})
+        result = None if task.cancelled() or task.exception() is not None else task.result()
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def invalidate(self, telegram_id):
+        slot = self._slots.pop(telegram_id, None)
+        if slot is not None:
+            slot[1].cancel()
+
+    def clear(self):
+        # Загрузка, сама сбросившая каталог (load_task_index), не отменяет себя - ее результат актуален
+        current = asyncio.current_task()
+        for _, task, _ in self._slots.values():
+            if task is not current:
+                task.cancel()
+        self._slots.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._slots),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+task_prefetcher = TaskPrefetcher()
@@ -0,0 +1,181 @@
+# database/profiler.py
+import logging
+import re
+import time
+
+from config import DB_PROFILE, DB_SLOW_QUERY_MS
+
+_WHITESPACE = re.compile(r"\s+")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+def normalize_sql(sql):
+    """Текст запроса без литералов и лишних пробелов: IN (?, ?, ?) и IN (?, ?) - один и тот же запрос."""
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    sql = _LITERALS.sub("?", sql)
+    return _PLACEHOLDER_LIST.sub("(...)", sql)
+
+
+class QueryStats:
+    __slots__ = ("calls", "total", "max", "rows", "slow", "plan")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.slow = 0
+        self.plan = None
+
+
+class QueryProfiler:
+    """Профилировщик запросов к SQLite, включается DB_PROFILE=1.
+
+    Для каждого нормализованного запроса копит число вызовов, суммарное
+    и максимальное время и число возвращенных строк. Время запроса - это
+    execute плюс все чтения из его курсора: SQLite выполняет запрос по мере
+    выборки строк. Запросы дольше slow_ms пишутся в лог вместе с
+    EXPLAIN QUERY PLAN (план снимается один раз на запрос).
+    """
+
+    def __init__(self, enabled=DB_PROFILE, slow_ms=DB_SLOW_QUERY_MS):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.started = time.time()
+        self._stats = {}
+
+    def wrap(self, db):
+        return ProfiledConnection(db, self) if self.enabled else db
+
+    def reset(self):
+        self._stats.clear()
+        self.started = time.time()
+
+    def _entry(self, sql):
+        key = normalize_sql(sql)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = QueryStats()
+        return key, stats
+
+    async def _check_slow(self, db, cursor):
+        """Вызывается, когда время курсора впервые перешло порог slow_ms."""
+        key, stats = cursor._key, cursor._stats
+        stats.slow += 1
+        if stats.plan is None:
+            try:
+                plan_cursor = await db.execute(f"EXPLAIN QUERY PLAN {cursor._sql}", cursor._params)
+                stats.plan = [row[-1] for row in await plan_cursor.fetchall()]
+            except Exception as e:
+                stats.plan = [f"(план недоступен: {e})"]
+        logging.warning(
+            "Медленный запрос: %.1f мс к моменту превышения порога, прочитано строк %d\n  %s\n  план: %s",
+            cursor._elapsed * 1000, cursor._rows, key, "; ".join(stats.plan) or "-"
+        )
+
+    def top(self, limit=10, order="total"):
+        """[(sql, QueryStats)] - самые тяжелые запросы: по total, max, calls или rows."""
+        return sorted(self._stats.items(), key=lambda item: getattr(item[1], order), reverse=True)[:limit]
+
+    def report(self, limit=10, order="total"):
+        if not self.enabled:
+            return "Профилирование выключено (DB_PROFILE=0)."
+        lines = [f"Запросов: {len(self._stats)}, сбор с {time.strftime('%H:%M:%S', time.localtime(self.started))}, "
+                 f"порог медленных {self.slow_ms} мс"]
+        for i, (sql, stats) in enumerate(self.top(limit, order), 1):
+            lines.append(
+                f"\n{i}. всего {stats.total * 1000:.0f} мс, вызовов {stats.calls}, "
+                f"сред. {stats.total / stats.calls * 1000:.2f} мс, макс. {stats.max * 1000:.1f} мс, "
+                f"строк {stats.rows}, медленных {stats.slow}\n{sql[:300]}"
+            )
+            if stats.plan:
+                lines.append("план: " + "; ".join(stats.plan))
+        return "\n".join(lines)
+
+
+class ProfiledCursor:
+    """Курсор, который досчитывает к запросу время и число строк выборки."""
+
+    def __init__(self, profiler, db, cursor, sql, params):
+        self._profiler = profiler
+        self._db = db
+        self._cursor = cursor
+        self._sql = sql
+        self._params = params
+        self._key, self._stats = profiler._entry(sql)
+        self._elapsed = 0.0
+        self._rows = 0
+        self._reported = False
+
+    async def _account(self, seconds, rows=0):
+        self._elapsed += seconds
+        self._rows += rows
+        stats = self._stats
+        stats.total += seconds
+        stats.rows += rows
+        stats.max = max(stats.max, self._elapsed)
+        if not self._reported and self._elapsed * 1000 >= self._profiler.slow_ms:
+            self._reported = True
+            await self._profiler._check_slow(self._db, self)
+
+    async def fetchone(self):
+        started = time.perf_counter()
+        row = await self._cursor.fetchone()
+        await self._account(time.perf_counter() - started, row is not None)
+        return row
+
+    async def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = await (self._cursor.fetchmany() if size is None else self._cursor.fetchmany(size))
+        await self._account(time.perf_counter() - started, len(rows))
+        return rows
+
+    async def fetchall(self):
+        started = time.perf_counter()
+        rows = await self._cursor.fetchall()
+        await self._account(time.perf_counter() - started, len(rows))
+        return rows
+
+    async def __aiter__(self):
+        while True:
+            rows = await self.fetchmany(self._cursor.arraysize or 64)
+            if not rows:
+                return
+            for row in rows:
+                yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class ProfiledConnection:
+    """Обертка над соединением aiosqlite: execute/executemany идут через профилировщик,
+    остальное (commit, rollback, in_transaction) - напрямую."""
+
+    def __init__(self, db, profiler):
+        self._db = db
+        self._profiler = profiler
+
+    async def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        cursor = await self._db.execute(sql, parameters)
+        profiled = ProfiledCursor(self._profiler, self._db, cursor, sql, parameters)
+        profiled._stats.calls += 1
+        await profiled._account(time.perf_counter() - started)
+        return profiled
+
+    async def executemany(self, sql, parameters):
+        parameters = list(parameters)
+        started = time.perf_counter()
+        cursor = await self._db.executemany(sql, parameters)
+        profiled = ProfiledCursor(self._profiler, self._db, cursor, sql, parameters[0] if parameters else ())
+        profiled._stats.calls += 1
+        await profiled._account(time.perf_counter() - started)
+        return cursor
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+
+profiler = QueryProfiler()
@@ -0,0 +1,116 @@
+# database/progress.py
+import random
+import time
+from collections import OrderedDict
+
+from config import PROGRESS_CACHE_SIZE, PROGRESS_IDLE_TTL
+
+
+def random_set_bit(mask, size):
+    """Номер случайного единичного бита mask среди первых size бит или None."""
+    count = mask.bit_count()
+    if count == 0:
+        return None
+    if count * 8 >= size:
+        # Единиц много - быстрее угадать случайную позицию, чем перебирать биты
+        while True:
+            position = random.randrange(size)
+            if mask >> position & 1:
+                return position
+    # Единиц мало - снимаем k младших единиц и берем следующую
+    for _ in range(random.randrange(count)):
+        mask &= mask - 1
+    return (mask & -mask).bit_length() - 1
+
+
+class ProgressTracker:
+    """Прогресс учеников по задачам в виде битовых масок, по две на раздел:
+    seen - задачи, на которые ученик отвечал, solved - решенные верно.
+    Номер бита - номер задачи в списке раздела из TaskIndex.
+
+    Маски ученика загружаются из user_answers при первом обращении, обновляются
+    при каждом записанном ответе и вытесняются после idle_ttl секунд простоя или
+    когда учеников больше max_users (самые давние), поэтому выбор следующей
+    задачи не зависит от длины истории ученика, а память - от числа всех учеников.
+    """
+
+    def __init__(self, max_users=PROGRESS_CACHE_SIZE, idle_ttl=PROGRESS_IDLE_TTL):
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self._users = OrderedDict()  # telegram_id -> (sections, last_access); sections: section_id -> [seen, solved]
+        self.hits = 0
+        self.misses = 0
+
+    def _evict(self, now):
+        # Порядок OrderedDict - по последнему обращению, так что простаивающие всегда в начале
+        while self._users:
+            oldest_id, (_, last_access) = next(iter(self._users.items()))
+            if len(self._users) <= self.max_users and now - last_access < self.idle_ttl:
+                break
+            del self._users[oldest_id]
+
+    def get(self, telegram_id):
+        now = time.monotonic()
+        # Вытесняем и на чтении: иначе без новых учеников простаивающие маски жили бы вечно
+        self._evict(now)
+        item = self._users.get(telegram_id)
+        if item is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._users[telegram_id] = (item[0], now)
+        self._users.move_to_end(telegram_id)
+        return item[0]
+
+    def put(self, telegram_id, sections):
+        now = time.monotonic()
+        self._users[telegram_id] = (sections, now)
+        self._users.move_to_end(telegram_id)
+        self._evict(now)
+
+    def clear(self):
+        self._users.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._users),
+            "max_size": self.max_users,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    @staticmethod
+    def mark(sections, position, is_correct):
+        section_id, bit = position
+        masks = sections.setdefault(section_id, [0, 0])
+        masks[0] |= 1 << bit
+        if is_correct:
+            masks[1] |= 1 << bit
+
+    def record(self, telegram_id, position, is_correct):
+        """Отмечает ответ, если прогресс ученика сейчас загружен."""
+        item = self._users.get(telegram_id)
+        if item is not None:
+            self.mark(item[0], position, is_correct)
+
+    @staticmethod
+    def pick(sections, section_id, size, exclude=None):
+        """Номер задачи в разделе: сначала непросмотренные, затем нерешенные, затем любая.
+
+        exclude - номер задачи, которую выбирать не нужно (например, уже показанной),
+        если в разделе есть другие.
+        """
+        seen, solved = sections.get(section_id, (0, 0))
+        everything = (1 << size) - 1
+        if exclude is not None and size > 1:
+            everything &= ~(1 << exclude)
+        for candidates in (everything & ~seen, everything & ~solved, everything):
+            position = random_set_bit(candidates, size)
+            if position is not None:
+                return position
+        return random.randrange(size)
+
+
+progress_tracker = ProgressTracker()
@@ -0,0 +1,232 @@
+# database/regrade.py
+"""Перепроверка лога ответов после исправления ключа задачи.
+
+Когда исправлен task_text_answers.correct_answer или task_choices.is_correct,
+старые строки user_answers так и хранят оценку по прежнему ключу. Перепроверка
+идет по задачам: одним запросом берет различные ответы на задачу, оценивает
+каждый из них один раз по текущему ключу - с тем же допуском, что и бот при
+ответе, - и отдает SQLite списки ставших верными и неверными ответов. Строки,
+чья оценка разошлась с ключом, выбирает сама база, кусками, и пишутся только
+они. Кусок - одна транзакция вместе с поправками сводок user_section_stats,
+user_activity и свертки аналитики по классу, поэтому после каждого коммита
+сводки сходятся с логом.
+
+    python -m database.regrade --task 12 14
+    python -m database.regrade --section 3
+    python -m database.regrade --all --check
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import aiosqlite
+
+from database.cohort import WATERMARK_KEY, REFRESH_TASKS, REFRESH_SECTIONS
+
+# Допуск для числового ответа: 0.5% от правильного
+TEXT_ANSWER_TOLERANCE = 0.005
+CHUNK_SIZE = 50000
+
+# Различные ответы на задачу и сколько раз каждый дан; идут по индексу (task_id)
+ANSWERS_QUERY = """
+    SELECT answer_given, COUNT(*)
+    FROM user_answers
+    WHERE task_id = ? AND id <= ? AND action_type = 'answered'
+    GROUP BY answer_given
+"""
+
+# Следующие после id ответы задачи, чья оценка разошлась с ключом: ?1 - JSON-список ставших
+# верными ответов, ?2 - ставших неверными. Идут по индексу (task_id), уже упорядоченному по id
+CHANGED_QUERY = """
+    SELECT id, user_id, task_id, answer_given IN (SELECT value FROM json_each(?1))
+    FROM user_answers
+    WHERE task_id = ?3 AND id > ?4 AND id <= ?5 AND action_type = 'answered'
+      AND CASE WHEN COALESCE(is_correct, 0)
+               THEN answer_given IN (SELECT value FROM json_each(?2))
+               ELSE answer_given IN (SELECT value FROM json_each(?1)) END
+    ORDER BY id
+    LIMIT ?6
+"""
+
+
+def text_answer_is_correct(value, correct_answer):
+    return abs(value - correct_answer) <= abs(correct_answer * TEXT_ANSWER_TOLERANCE)
+
+
+async def load_answer_keys(db, task_ids=None, section_id=None):
+    """Ключи выбранных задач: task_id -> (section_id, 'choice', {id варианта: верен ли})
+    или (section_id, 'text', правильный ответ). Без фильтров - все задачи."""
+    if task_ids is not None:
+        task_ids = list(task_ids)
+        condition, params = f"t.id IN ({', '.join('?' * len(task_ids))})", task_ids
+    elif section_id is not None:
+        condition, params = "t.section_id = ?", [section_id]
+    else:
+        condition, params = "1", []
+    keys = {}
+    cursor = await db.execute(
+        f"SELECT t.id, t.section_id, c.id, c.is_correct FROM tasks t "
+        f"JOIN task_choices c ON c.task_id = t.id WHERE {condition}", params
+    )
+    for task_id, task_section_id, choice_id, is_correct in await cursor.fetchall():
+        keys.setdefault(task_id, (task_section_id or 0, 'choice', {}))[2][str(choice_id)] = bool(is_correct)
+    cursor = await db.execute(
+        f"SELECT t.id, t.section_id, a.correct_answer FROM tasks t "
+        f"JOIN task_text_answers a ON a.task_id = t.id WHERE {condition}", params
+    )
+    for task_id, task_section_id, correct_answer in await cursor.fetchall():
+        keys[task_id] = (task_section_id or 0, 'text', correct_answer)
+    return keys
+
+
+def grade(key, answers):
+    """Оценивает различные ответы на задачу по ее ключу (значение из load_answer_keys).
+    Возвращает (ставшие верными, ставшие неверными). Ответы, которые нельзя оценить
+    (вариант удален, в числовом ответе не число), не попадают ни в один список."""
+    _, kind, correct = key
+    now_correct, now_incorrect = [], []
+    for given in answers:
+        if kind == 'choice':
+            is_correct = correct.get(str(given))
+        else:
+            try:
+                is_correct = text_answer_is_correct(float(str(given).replace(',', '.')), correct)
+            except ValueError:
+                is_correct = None
+        if is_correct is not None:
+            (now_correct if is_correct else now_incorrect).append(given)
+    return now_correct, now_incorrect
+
+
+async def _apply(db, changed, keys):
+    """Пишет новые оценки и поправляет сводки. Вызывается внутри транзакции."""
+    await db.executemany(
+        "UPDATE user_answers SET is_correct = ? WHERE id = ?",
+        [(new, answer_id) for answer_id, _, _, new in changed]
+    )
+    section_deltas, user_deltas, attempt_deltas = {}, {}, {}
+    cursor = await db.execute("SELECT value FROM meta WHERE key = ?", (WATERMARK_KEY,))
+    row = await cursor.fetchone()
+    watermark = row[0] if row else 0
+    for answer_id, user_id, task_id, new in changed:
+        delta = 1 if new else -1
+        section_key = (user_id, keys[task_id][0])
+        section_deltas[section_key] = section_deltas.get(section_key, 0) + delta
+        user_deltas[user_id] = user_deltas.get(user_id, 0) + delta
+        # Строки после отметки свертка еще не учла - она прочитает их уже с новой оценкой
+        if answer_id <= watermark:
+            attempt_deltas[(task_id, user_id)] = attempt_deltas.get((task_id, user_id), 0) + delta
+
+    await db.executemany(
+        "UPDATE user_section_stats SET correct = correct + ? WHERE user_id = ? AND section_id = ?",
+        [(delta, user_id, section_id) for (user_id, section_id), delta in section_deltas.items() if delta]
+    )
+    await db.executemany(
+        "UPDATE user_activity SET correct = correct + ?1, "
+        "accuracy = CASE WHEN answered > 0 THEN CAST(correct + ?1 AS REAL) / answered ELSE 0 END "
+        "WHERE user_id = ?2",
+        [(delta, user_id) for user_id, delta in user_deltas.items() if delta]
+    )
+    if attempt_deltas:
+        await db.executemany(
+            "UPDATE user_task_attempts SET correct = correct + ? WHERE task_id = ? AND user_id = ?",
+            [(delta, task_id, user_id) for (task_id, user_id), delta in attempt_deltas.items() if delta]
+        )
+        await db.execute("CREATE TEMP TABLE IF NOT EXISTS cohort_touched (task_id INTEGER PRIMARY KEY)")
+        await db.execute("DELETE FROM cohort_touched")
+        await db.executemany(
+            "INSERT INTO cohort_touched (task_id) VALUES (?)", [(task_id,) for task_id in {key[0] for key in attempt_deltas}]
+        )
+        await db.execute(REFRESH_TASKS)
+        await db.execute(REFRESH_SECTIONS)
+
+
+async def regrade_answers(db, task_ids=None, section_id=None, chunk_size=CHUNK_SIZE, check_only=False):
+    """Перепроверяет ответы на задачи (task_ids, раздел section_id или все задачи).
+    check_only - только посчитать, что изменится. Возвращает отчет-словарь."""
+    started = time.perf_counter()
+    keys = await load_answer_keys(db, task_ids, section_id)
+    report = {'tasks': len(keys), 'checked': 0, 'changed': 0, 'now_correct': 0, 'now_incorrect': 0,
+              'check_only': check_only}
+    # Ответы, записанные во время перепроверки, уже оценены по новому ключу
+    cursor = await db.execute("SELECT MAX(id) FROM user_answers")
+    max_id = (await cursor.fetchone())[0] or 0
+    tasks = sorted(keys)
+    position, last_id, grades = 0, 0, None
+    while position < len(tasks):
+        if not check_only:
+            # IMMEDIATE: оценка строки и поправка сводок не должны разойтись с другим писателем
+            await db.execute("BEGIN IMMEDIATE")
+        try:
+            changed = []
+            while position < len(tasks) and len(changed) < chunk_size:
+                task_id = tasks[position]
+                if last_id == 0:
+                    cursor = await db.execute(ANSWERS_QUERY, (task_id, max_id))
+                    answers = await cursor.fetchall()
+                    report['checked'] += sum(count for _, count in answers)
+                    grades = grade(keys[task_id], [given for given, _ in answers])
+                if not any(grades):
+                    position += 1
+                    continue
+                limit = chunk_size - len(changed)
+                cursor = await db.execute(
+                    CHANGED_QUERY, (json.dumps(grades[0]), json.dumps(grades[1]), task_id, last_id, max_id, limit)
+                )
+                part = await cursor.fetchall()
+                changed.extend((answer_id, user_id, task_id, bool(new)) for answer_id, user_id, _, new in part)
+                if len(part) < limit:
+                    position, last_id = position + 1, 0
+                else:
+                    last_id = part[-1][0]
+            if changed and not check_only:
+                await _apply(db, changed, keys)
+            if not check_only:
+                await db.commit()
+        except Exception:
+            if not check_only:
+                await db.rollback()
+            raise
+        report['changed'] += len(changed)
+        report['now_correct'] += sum(1 for *_, new in changed if new)
+    if report['changed'] and not check_only:
+        # Другие процессы бота сверяют версию каталога и сбросят кэши задач и прогресса
+        await db.execute("UPDATE meta SET value = value + 1 WHERE key = 'catalog_version'")
+        await db.commit()
+    report['now_incorrect'] = report['changed'] - report['now_correct']
+    report['seconds'] = time.perf_counter() - started
+    return report
+
+
+def format_report(report):
+    title = "Проверка без записи" if report['check_only'] else "Перепроверка завершена"
+    return (f"{title}\n"
+            f"Задач: {report['tasks']}\n"
+            f"Ответов проверено: {report['checked']}\n"
+            f"Оценка изменилась: {report['changed']} "
+            f"(стали верными {report['now_correct']}, неверными {report['now_incorrect']})\n"
+            f"Время: {report['seconds']:.2f} с")
+
+
+async def _main(db_name, task_ids, section_id, check_only):
+    async with aiosqlite.connect(db_name) as db:
+        report = await regrade_answers(db, task_ids, section_id, check_only=check_only)
+    print(format_report(report))
+    if not check_only and report['changed']:
+        print("Задачи и прогресс учеников запущенный бот перечитает в течение CATALOG_CHECK_INTERVAL, "
+              "рейтинг - в течение LEADERBOARD_RELOAD_INTERVAL (или после перезапуска, если он выключен).")
+
+
+if __name__ == "__main__":
+    from database.database import DB_NAME
+
+    parser = argparse.ArgumentParser(description="Перепроверка ответов по текущим ключам задач")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--task", type=int, nargs="+", help="id задач")
+    target.add_argument("--section", type=int, help="id раздела")
+    target.add_argument("--all", action="store_true", help="все задачи")
+    parser.add_argument("--db", default=DB_NAME, help="путь к файлу БД")
+    parser.add_argument("--check", action="store_true", help="только посчитать изменения, ничего не записывая")
+    args = parser.parse_args()
+    asyncio.run(_main(args.db, args.task, args.section, args.check))
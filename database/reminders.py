@@ -0,0 +1,146 @@
+# database/reminders.py
+import heapq
+import time
+
+from config import REMINDER_INACTIVE_DAYS, REMINDER_DAILY, REMINDER_REPEAT_DAYS, REMINDER_MAX_INACTIVE
+
+DAY = 86400
+# Напоминание, просроченное больше чем на сутки (бот был выключен), не отправляется, а пропускается
+STALE_AFTER = DAY
+# Действия ученика чаще раза в час не переставляют его в куче: время все равно сверяется с БД перед отправкой
+TOUCH_GRANULARITY = 3600
+
+CREATE_REMINDER_STATE = """
+    CREATE TABLE IF NOT EXISTS reminder_state (
+        user_id INTEGER PRIMARY KEY,
+        activity_at TIMESTAMP NOT NULL,   -- last_activity, к которому относится счетчик
+        sent INTEGER NOT NULL,            -- напоминаний отправлено после этой активности
+        last_sent TIMESTAMP NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )
+"""
+
+# Ученики, которым могут быть нужны напоминания, с их активностью и числом уже отправленных напоминаний.
+# CROSS JOIN и унарный плюс фиксируют план: идем от user_activity (по индексу на last_activity
+# при сверке), а не перебираем всех учеников по индексу на role
+REMINDER_CANDIDATES = """
+    SELECT u.telegram_id, u.id, a.last_activity, CAST(strftime('%s', a.last_activity) AS INTEGER),
+           CASE WHEN r.activity_at = a.last_activity THEN r.sent ELSE 0 END
+    FROM user_activity a
+    CROSS JOIN users u ON u.id = a.user_id
+    LEFT JOIN reminder_state r ON r.user_id = a.user_id
+    WHERE +u.role = 'student' AND u.is_blocked = 0 AND {condition}
+"""
+# Те же ученики по списку telegram_id. Через id: запрос идет от user_activity,
+# и так ему достается поиск по первичному ключу
+REMINDER_RECIPIENTS = REMINDER_CANDIDATES.format(
+    condition="a.user_id IN (SELECT id FROM users WHERE telegram_id IN ({placeholders}))"
+)
+
+
+def reminder_plan(inactive_days, daily=True, repeat_days=7, max_inactive=3):
+    """Расписание напоминаний после последней активности: [(через сколько дней, вид)].
+
+    Сначала ежедневные приглашения порешать (в то же время суток, когда ученик
+    занимался), затем на inactive_days день - "вы не решали задачи N дней" и
+    повторы раз в repeat_days, всего max_inactive таких напоминаний.
+    """
+    if inactive_days <= 0:
+        return []
+    plan = [(day, 'daily') for day in range(1, inactive_days)] if daily else []
+    plan += [(inactive_days + i * repeat_days, 'inactive') for i in range(max_inactive)]
+    return plan
+
+
+class ReminderScheduler:
+    """Куча ближайших напоминаний учеников.
+
+    Состояние ученика - время последней активности и число уже отправленных
+    после нее напоминаний; следующее напоминание однозначно вычисляется из
+    них по плану. Куча заполняется при старте из user_activity (по индексу на
+    last_activity), дальше каждое действие ученика переносит его напоминание
+    (touch), а отправитель забирает из кучи только наступившие. Старые записи
+    кучи не удаляются сразу, а пропускаются при выборке (сверка с _entries).
+    """
+
+    def __init__(self, plan):
+        self.plan = plan
+        self._heap = []      # (время, telegram_id)
+        self._entries = {}   # telegram_id -> (время, последняя активность, отправлено)
+        self.loaded = False
+        self.synced_until = None  # когда (epoch) расписание последний раз сверялось с user_activity
+
+    def __len__(self):
+        return len(self._entries)
+
+    def horizon(self):
+        """Сколько секунд после активности еще может прийти напоминание."""
+        return (self.plan[-1][0] * DAY + STALE_AFTER) if self.plan else 0
+
+    def schedule(self, telegram_id, last_activity, sent=0, now=None):
+        """Ставит следующее напоминание ученика по времени его активности (epoch) и числу отправленных."""
+        now = time.time() if now is None else now
+        current = self._entries.get(telegram_id)
+        if current is not None and current[1:] == (last_activity, sent):
+            return
+        # Из нескольких наступивших напоминаний отправляется только последнее, и то если оно не устарело
+        while sent < len(self.plan) and (
+            last_activity + self.plan[sent][0] * DAY < now - STALE_AFTER
+            or sent + 1 < len(self.plan) and last_activity + self.plan[sent + 1][0] * DAY <= now
+        ):
+            sent += 1
+        if sent >= len(self.plan):
+            self._entries.pop(telegram_id, None)
+            return
+        due = last_activity + self.plan[sent][0] * DAY
+        self._entries[telegram_id] = (due, last_activity, sent)
+        heapq.heappush(self._heap, (due, telegram_id))
+        if len(self._heap) > 2 * len(self._entries) + 1024:
+            self._compact()
+
+    def touch(self, telegram_id, now=None):
+        """Ученик что-то сделал: план напоминаний начинается заново."""
+        if not self.loaded or not self.plan:
+            return
+        now = time.time() if now is None else now
+        current = self._entries.get(telegram_id)
+        if current is not None and current[2] == 0 and now - current[1] < TOUCH_GRANULARITY:
+            return
+        self.schedule(telegram_id, now, 0, now)
+
+    def _compact(self):
+        self._heap = [(due, telegram_id) for telegram_id, (due, _, _) in self._entries.items()]
+        heapq.heapify(self._heap)
+
+    def _clean_top(self):
+        while self._heap:
+            due, telegram_id = self._heap[0]
+            entry = self._entries.get(telegram_id)
+            if entry is not None and entry[0] == due:
+                return
+            heapq.heappop(self._heap)
+
+    def next_due(self):
+        self._clean_top()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now, limit):
+        """Забирает до limit наступивших напоминаний: [(telegram_id, последняя активность, отправлено)]."""
+        due_items = []
+        while len(due_items) < limit:
+            self._clean_top()
+            if not self._heap or self._heap[0][0] > now:
+                break
+            _, telegram_id = heapq.heappop(self._heap)
+            _, last_activity, sent = self._entries.pop(telegram_id)
+            due_items.append((telegram_id, last_activity, sent))
+        return due_items
+
+    def step(self, sent):
+        """(дней после активности, вид) напоминания с номером sent или None, если план исчерпан."""
+        return self.plan[sent] if sent < len(self.plan) else None
+
+
+reminder_scheduler = ReminderScheduler(
+    reminder_plan(REMINDER_INACTIVE_DAYS, REMINDER_DAILY, REMINDER_REPEAT_DAYS, REMINDER_MAX_INACTIVE)
+)
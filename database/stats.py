@@ -0,0 +1,187 @@
+# database/stats.py
+"""Сводная статистика ответов по (ученик, раздел) и по ученику в целом.
+
+Таблицы user_section_stats и user_activity обновляются в той же транзакции,
+что и запись ответа в user_answers, поэтому чтение статистики стоит
+O(число разделов), а не O(длина истории ученика).
+
+Пересобрать таблицы из лога или сверить статистику по разделам с логом:
+    python -m database.stats --rebuild
+    python -m database.stats --check
+"""
+import argparse
+import asyncio
+
+import aiosqlite
+
+CREATE_USER_SECTION_STATS = """
+    CREATE TABLE IF NOT EXISTS user_section_stats (
+        user_id INTEGER NOT NULL,
+        section_id INTEGER NOT NULL,  -- 0 для задач без раздела
+        answered INTEGER NOT NULL DEFAULT 0,
+        correct INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, section_id),
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    ) WITHOUT ROWID
+"""
+
+# Агрегат, который таблица должна повторять
+AGGREGATE_FROM_LOG = """
+    SELECT ua.user_id, COALESCE(t.section_id, 0),
+           COUNT(*), SUM(CASE WHEN ua.is_correct = 1 THEN 1 ELSE 0 END)
+    FROM user_answers ua
+    LEFT JOIN tasks t ON ua.task_id = t.id
+    WHERE ua.action_type = 'answered' {user_filter}
+    GROUP BY ua.user_id, COALESCE(t.section_id, 0)
+"""
+
+# Прибавляет к сводке ответы на одну задачу: параметры (user_id, task_id, answered, correct)
+INCREMENT = """
+    INSERT INTO user_section_stats (user_id, section_id, answered, correct)
+    SELECT ?, COALESCE((SELECT section_id FROM tasks WHERE id = ?), 0), ?, ?
+    WHERE 1
+    ON CONFLICT (user_id, section_id) DO UPDATE SET
+        answered = answered + excluded.answered,
+        correct = correct + excluded.correct
+"""
+
+
+async def increment_user_section_stats(db, rows):
+    """Прибавляет к сводке пачку записанных ответов. rows - строки, вставленные в user_answers:
+    (user_id, task_id, answer_given, is_correct, timestamp, action_type). Коммит - на вызывающем."""
+    deltas = {}
+    for user_id, task_id, _, is_correct, _, action_type in rows:
+        if action_type != 'answered':
+            continue
+        answered, correct = deltas.get((user_id, task_id), (0, 0))
+        deltas[(user_id, task_id)] = (answered + 1, correct + (1 if is_correct else 0))
+    if deltas:
+        await db.executemany(INCREMENT, [
+            (user_id, task_id, answered, correct)
+            for (user_id, task_id), (answered, correct) in deltas.items()
+        ])
+
+
+async def rebuild_user_section_stats(db, user_ids=None):
+    """Пересчитывает сводку из user_answers - целиком или только для указанных учеников.
+    Коммит - на вызывающем."""
+    if user_ids is None:
+        await db.execute("DELETE FROM user_section_stats")
+        await db.execute(
+            "INSERT INTO user_section_stats (user_id, section_id, answered, correct) "
+            + AGGREGATE_FROM_LOG.format(user_filter="")
+        )
+        return
+    user_ids = list(user_ids)
+    for i in range(0, len(user_ids), 500):
+        chunk = user_ids[i:i + 500]
+        placeholders = ", ".join("?" * len(chunk))
+        await db.execute(f"DELETE FROM user_section_stats WHERE user_id IN ({placeholders})", chunk)
+        await db.execute(
+            "INSERT INTO user_section_stats (user_id, section_id, answered, correct) "
+            + AGGREGATE_FROM_LOG.format(user_filter=f"AND ua.user_id IN ({placeholders})"),
+            chunk
+        )
+
+
+CREATE_USER_ACTIVITY = """
+    CREATE TABLE IF NOT EXISTS user_activity (
+        user_id INTEGER PRIMARY KEY,
+        last_activity TIMESTAMP NOT NULL,  -- время последнего действия или регистрации
+        answered INTEGER NOT NULL DEFAULT 0,
+        correct INTEGER NOT NULL DEFAULT 0,
+        accuracy REAL NOT NULL DEFAULT 0,  -- correct / answered, хранится ради индекса для сортировки
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    )
+"""
+
+# Сводка по ученику: параметры (user_id, last_activity, answered, correct)
+INCREMENT_ACTIVITY = """
+    INSERT INTO user_activity (user_id, last_activity, answered, correct, accuracy)
+    VALUES (?1, ?2, ?3, ?4, CASE WHEN ?3 > 0 THEN CAST(?4 AS REAL) / ?3 ELSE 0 END)
+    ON CONFLICT (user_id) DO UPDATE SET
+        last_activity = MAX(last_activity, excluded.last_activity),
+        answered = answered + excluded.answered,
+        correct = correct + excluded.correct,
+        accuracy = CASE WHEN answered + excluded.answered > 0
+                        THEN CAST(correct + excluded.correct AS REAL) / (answered + excluded.answered)
+                        ELSE 0 END
+"""
+
+
+async def increment_user_activity(db, rows):
+    """Обновляет сводку по ученикам для пачки строк user_answers (формат как в
+    increment_user_section_stats). Коммит - на вызывающем."""
+    deltas = {}
+    for user_id, _, _, is_correct, timestamp, action_type in rows:
+        last_activity, answered, correct = deltas.get(user_id, (timestamp, 0, 0))
+        if action_type == 'answered':
+            answered += 1
+            correct += 1 if is_correct else 0
+        deltas[user_id] = (max(last_activity, timestamp), answered, correct)
+    if deltas:
+        await db.executemany(INCREMENT_ACTIVITY, [
+            (user_id, last_activity, answered, correct)
+            for user_id, (last_activity, answered, correct) in deltas.items()
+        ])
+
+
+async def rebuild_user_activity(db):
+    """Пересчитывает сводку по всем ученикам из users и user_answers. Коммит - на вызывающем."""
+    await db.execute("DELETE FROM user_activity")
+    await db.execute("""
+        INSERT INTO user_activity (user_id, last_activity, answered, correct, accuracy)
+        SELECT u.id,
+               COALESCE(MAX(ua.timestamp), u.registration_date),
+               COUNT(CASE WHEN ua.action_type = 'answered' THEN 1 END),
+               COUNT(CASE WHEN ua.action_type = 'answered' AND ua.is_correct = 1 THEN 1 END),
+               COALESCE(CAST(COUNT(CASE WHEN ua.action_type = 'answered' AND ua.is_correct = 1 THEN 1 END) AS REAL)
+                        / NULLIF(COUNT(CASE WHEN ua.action_type = 'answered' THEN 1 END), 0), 0)
+        FROM users u
+        LEFT JOIN user_answers ua ON ua.user_id = u.id
+        GROUP BY u.id
+    """)
+
+
+async def check_user_section_stats(db):
+    """Сверяет сводку с логом. Возвращает список расхождений
+    (user_id, section_id, (answered, correct) в сводке, (answered, correct) по логу)."""
+    cursor = await db.execute("SELECT user_id, section_id, answered, correct FROM user_section_stats WHERE answered > 0")
+    stored = {(row[0], row[1]): (row[2], row[3]) for row in await cursor.fetchall()}
+    cursor = await db.execute(AGGREGATE_FROM_LOG.format(user_filter=""))
+    expected = {(row[0], row[1]): (row[2], row[3]) for row in await cursor.fetchall()}
+    return [
+        (user_id, section_id, stored.get((user_id, section_id)), expected.get((user_id, section_id)))
+        for user_id, section_id in sorted(stored.keys() | expected.keys())
+        if stored.get((user_id, section_id)) != expected.get((user_id, section_id))
+    ]
+
+
+async def _main(db_name, rebuild, check):
+    async with aiosqlite.connect(db_name) as db:
+        if rebuild:
+            await rebuild_user_section_stats(db)
+            await rebuild_user_activity(db)
+            await db.commit()
+            print("Сводная статистика пересобрана из user_answers.")
+        if check:
+            mismatches = await check_user_section_stats(db)
+            if not mismatches:
+                print("Сводная статистика совпадает с логом ответов.")
+            for user_id, section_id, stored, expected in mismatches:
+                print(f"user_id={user_id} section_id={section_id}: в сводке {stored}, по логу {expected}")
+            return 1 if mismatches else 0
+    return 0
+
+
+if __name__ == "__main__":
+    from database.database import DB_NAME
+
+    parser = argparse.ArgumentParser(description="Сводная статистика учеников по разделам")
+    parser.add_argument("--db", default=DB_NAME, help="путь к файлу БД")
+    parser.add_argument("--rebuild", action="store_true", help="пересобрать сводки из user_answers")
+    parser.add_argument("--check", action="store_true", help="сверить сводку с user_answers")
+    args = parser.parse_args()
+    if not (args.rebuild or args.check):
+        parser.error("укажите --rebuild и/или --check")
+    raise SystemExit(asyncio.run(_main(args.db, args.rebuild, args.check)))
@@ -0,0 +1,85 @@
+# database/task_cache.py
+from collections import OrderedDict, namedtuple
+
+from config import TASK_CACHE_SIZE
+from keyboards.user_keyboards import get_task_keyboard
+
+# Полная задача со всем, что нужно для показа и проверки ответа
+CachedTask = namedtuple("CachedTask", [
+    "id", "section_id", "task_type", "photo_file_id",
+    "choices",        # [(choice_id, choice_text, is_correct), ...] для multiple_choice
+    "text_answer",    # правильный числовой ответ для text_input
+    "hint_text", "solution_data", "solution_type",
+    "keyboard",       # готовая клавиатура get_task_keyboard
+])
+
+# Одна выборка на промах: строка задачи + варианты ответа + числовой ответ
+TASK_QUERY = """
+    SELECT t.id, t.section_id, t.task_type, t.photo_file_id, t.hint_text, t.solution_data, t.solution_type,
+           c.id, c.choice_text, c.is_correct, a.correct_answer
+    FROM tasks t
+    LEFT JOIN task_choices c ON c.task_id = t.id
+    LEFT JOIN task_text_answers a ON a.task_id = t.id
+    WHERE t.id = ?
+    ORDER BY c.id
+"""
+
+
+def build_task(rows):
+    """Собирает CachedTask из строк TASK_QUERY (одна строка на вариант ответа)."""
+    task_id, section_id, task_type, photo_file_id, hint_text, solution_data, solution_type = rows[0][:7]
+    choices = [(row[7], row[8], row[9]) for row in rows if row[7] is not None]
+    text_answer = rows[0][10]
+    if task_type == 'multiple_choice':
+        keyboard = get_task_keyboard(task_type, task_id, choices)
+    else:
+        keyboard = get_task_keyboard(task_type, task_id)
+    return CachedTask(task_id, section_id, task_type, photo_file_id, choices, text_answer,
+                      hint_text, solution_data, solution_type, keyboard)
+
+
+class TaskCache:
+    """Ограниченный LRU-кэш задач. Сбрасывается при записи задач этим процессом и
+    целиком - при смене версии каталога (правка задачи или ключа ответа руками,
+    перепроверка или запись другого процесса)."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, task_id):
+        task = self._items.get(task_id)
+        if task is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(task_id)
+        self.hits += 1
+        return task
+
+    def put(self, task):
+        self._items[task.id] = task
+        self._items.move_to_end(task.id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, task_id=None):
+        """Сбрасывает одну задачу или, без аргумента, весь кэш."""
+        if task_id is None:
+            self._items.clear()
+        else:
+            self._items.pop(task_id, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+task_cache = TaskCache(TASK_CACHE_SIZE)
@@ -0,0 +1,82 @@
+# database/task_index.py
+import random
+
+
+class TaskIndex:
+    """Индекс задач в памяти: раздел -> список (id, task_type, photo_file_id).
+
+    Заменяет ORDER BY RANDOM(): случайная задача выбирается за O(1) без обращения к БД.
+    Строки задач после добавления не меняются, поэтому индекс достаточно
+    загрузить при старте и дополнять после каждого успешного add_new_task.
+    Задачи, добавленные другим процессом (например, импортом), подхватываются
+    перезагрузкой при смене версии каталога; свою запись процесс учитывает в
+    version сам (advance), чтобы она не вызывала перезагрузку.
+    """
+
+    def __init__(self):
+        self._by_section = {}
+        self._positions = {}  # task_id -> (section_id, номер задачи в списке раздела)
+        self._attempts = {}  # task_id -> число ответов, нужно только для взвешенного выбора
+        self.loaded = False
+        self.version = None  # meta.catalog_version, при которой индекс загружен
+
+    async def load(self, db):
+        cursor = await db.execute("SELECT value FROM meta WHERE key = 'catalog_version'")
+        row = await cursor.fetchone()
+        self.version = row[0] if row else 0
+        by_section = {}
+        positions = {}
+        # Порядок по id: новые задачи дописываются в конец, и номера старых не меняются
+        cursor = await db.execute("SELECT id, section_id, task_type, photo_file_id FROM tasks ORDER BY id")
+        async for task_id, section_id, task_type, photo_file_id in cursor:
+            tasks = by_section.setdefault(section_id, [])
+            positions[task_id] = (section_id, len(tasks))
+            tasks.append((task_id, task_type, photo_file_id))
+        self._by_section = by_section
+        self._positions = positions
+        self.loaded = True
+
+    async def load_attempts(self, db):
+        cursor = await db.execute(
+            "SELECT task_id, COUNT(*) FROM user_answers WHERE action_type = 'answered' GROUP BY task_id"
+        )
+        self._attempts = dict(await cursor.fetchall())
+
+    def add(self, section_id, task_id, task_type, photo_file_id):
+        tasks = self._by_section.setdefault(section_id, [])
+        self._positions[task_id] = (section_id, len(tasks))
+        tasks.append((task_id, task_type, photo_file_id))
+
+    def advance(self, before, after):
+        """Запись этого процесса подняла catalog_version с before до after. Если до нее
+        индекс был актуален, он актуален и сейчас: задачи уже добавлены через add()."""
+        if self.version == before:
+            self.version = after
+
+    def position(self, task_id):
+        """(section_id, номер в разделе) - номер бита задачи в битовых масках прогресса."""
+        return self._positions.get(task_id)
+
+    def record_attempt(self, task_id):
+        self._attempts[task_id] = self._attempts.get(task_id, 0) + 1
+
+    def section_tasks(self, section_id):
+        return self._by_section.get(section_id, [])
+
+    def pick(self, section_id, weighted=False):
+        """Возвращает (id, task_type, photo_file_id) или None, если в разделе нет задач.
+
+        При weighted=True чаще выпадают задачи, на которые отвечали реже:
+        вес задачи 1 / (1 + число ответов). Такой выбор линеен по размеру раздела,
+        но по-прежнему не трогает БД.
+        """
+        tasks = self._by_section.get(section_id)
+        if not tasks:
+            return None
+        if not weighted:
+            return random.choice(tasks)
+        weights = [1 / (1 + self._attempts.get(task[0], 0)) for task in tasks]
+        return random.choices(tasks, weights=weights)[0]
+
+
+task_index = TaskIndex()
@@ -1,22 +1,32 @@
 # handlers/admin_handlers.py
-import asyncio
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+
 from aiogram import Router, F, Bot
-from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
-from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, FSInputFile
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
-from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 
 from config import ADMIN_ID
 from database import database as db
+from database.regrade import format_report as format_regrade_report
 from keyboards.admin_keyboards import (
     admin_main_keyboard,
     task_type_keyboard,
-    get_sections_keyboard_admin,
     confirm_keyboard,
+    export_period_keyboard,
+    get_cohort_keyboard,
     get_students_keyboard,  # Нужно будет добавить
     confirm_broadcast_keyboard  # Нужно будет добавить
 )
-from states.admin_states import AddTask, Broadcast  # Нужно будет добавить Broadcast
+from services import broadcast
+from services.answer_export import (
+    export_answers, format_report as format_export_report, TELEGRAM_DOCUMENT_LIMIT, TELEGRAM_PART_BYTES
+)
+from services.metrics import metrics
+from services.task_import import import_tasks, format_report, parse_numeric_answer
+from states.admin_states import AddTask, Broadcast, StudentSearch, TaskImport
 
 router = Router()
 
@@ -33,6 +43,53 @@ async def admin_panel(message: Message):
         reply_markup=admin_main_keyboard
     )
 
+@router.message(Command("cache_stats"))
+async def cache_stats(message: Message):
+    report = "🗄 *Кэши*\n"
+    for name, stats in db.get_cache_stats().items():
+        report += (f"\n*{name}*: {stats['size']}/{stats['max_size']}, "
+                   f"попаданий {stats['hits']}, промахов {stats['misses']} ({stats['hit_rate']:.1%})")
+    await message.answer(report, parse_mode="Markdown")
+
+@router.message(Command("metrics"))
+async def show_metrics(message: Message):
+    await message.answer(("📈 Метрики\n\n" + metrics.summary())[:4000])
+
+@router.message(Command("db_profile"))
+async def show_db_profile(message: Message, command: CommandObject):
+    # /db_profile [N] [total|max|calls|rows] или /db_profile reset
+    args = (command.args or "").split()
+    if args[:1] == ["reset"]:
+        db.profiler.reset()
+        await message.answer("Статистика запросов сброшена.")
+        return
+    limit = int(args[0]) if args and args[0].isdigit() else 10
+    order = next((arg for arg in args if arg in ("total", "max", "calls", "rows")), "total")
+    report = db.profiler.report(limit, order)
+    await message.answer(report[:4000])
+
+@router.message(Command("regrade"))
+async def regrade(message: Message, command: CommandObject):
+    # /regrade <id задачи> [id ...] или /regrade section <id раздела>; check в конце - без записи
+    args = (command.args or "").split()
+    check_only = args[-1:] == ["check"]
+    if check_only:
+        args = args[:-1]
+    try:
+        if args[:1] == ["section"] and len(args) == 2:
+            task_ids, section_id = None, int(args[1])
+        elif args:
+            task_ids, section_id = [int(arg) for arg in args], None
+        else:
+            raise ValueError
+    except ValueError:
+        await message.answer("Использование: /regrade <id задачи> [id ...] или /regrade section <id раздела>; "
+                             "check в конце - только посчитать изменения.")
+        return
+    await message.answer("⏳ Перепроверяю ответы по текущим ключам...")
+    report = await db.regrade_answers(task_ids, section_id, check_only)
+    await message.answer(format_regrade_report(report))
+
 # Обработчик для возврата в главное меню админа
 @router.callback_query(F.data == "admin_main_menu")
 async def back_to_admin_main(callback: CallbackQuery):
@@ -56,10 +113,10 @@ async def process_task_type(callback: CallbackQuery, state: FSMContext):
     task_type = '_'.join(callback.data.split('_')[1:])
     await state.update_data(type=task_type)
 
-    sections = await db.get_sections()
+    catalog = await db.get_sections_catalog()
     await callback.message.edit_text(
         "Шаг 2: Выберите раздел для задачи.",
-        reply_markup=get_sections_keyboard_admin(sections)
+        reply_markup=catalog.admin_keyboard
     )
     await state.set_state(AddTask.waiting_for_section)
     await callback.answer()
@@ -123,7 +180,7 @@ async def process_incorrect_choice_3(message: Message, state: FSMContext):
 @router.message(AddTask.waiting_for_text_answer)
 async def process_text_answer_admin(message: Message, state: FSMContext):
     try:
-        answer = float(message.text.replace(',', '.'))
+        answer = parse_numeric_answer(message.text)
         await state.update_data(text_answer=answer)
         await message.answer("Шаг 5: Введите *текст подсказки* к задаче.")
         await state.set_state(AddTask.waiting_for_hint)
@@ -154,7 +211,8 @@ async def show_confirmation(message: Message, state: FSMContext):
     # Формируем красивое превью
     preview_text = f"Подтвердите создание задачи:\n\n"
     preview_text += f"Тип: {data['type']}\n"
-    preview_text += f"Раздел: {data['section_id']} (позже заменим на имя)\n\n"
+    catalog = await db.get_sections_catalog()
+    preview_text += f"Раздел: {catalog.name(data['section_id']) or data['section_id']}\n\n"
     if data['type'] == 'multiple_choice':
         preview_text += f"✅ {data['correct_choice']}\n"
         for choice in data['incorrect_choices']:
@@ -177,7 +235,14 @@ async def confirm_task(callback: CallbackQuery, state: FSMContext):
     # Печать для отладки
     print("--- ДАННЫЕ ДЛЯ СОХРАНЕНИЯ ---", task_data)
 
-    await db.add_new_task(task_data)
+    try:
+        await db.add_new_task(task_data)
+    except Exception as e:
+        await callback.message.edit_caption(caption=f"❌ Задача не сохранена: {e}", reply_markup=None)
+        await state.clear()
+        await callback.answer()
+        await admin_panel(callback.message)
+        return
 
     # Исправлено: используем edit_caption
     await callback.message.edit_caption(
@@ -196,24 +261,146 @@ async def cancel_task(callback: CallbackQuery, state: FSMContext):
     await admin_panel(callback.message) # Возвращаем в меню
 
 
+# --- Импорт задач из файла ---
+
+@router.callback_query(F.data == "import_tasks")
+async def start_import_tasks(callback: CallbackQuery, state: FSMContext):
+    await callback.message.edit_text(
+        "Отправьте файл .jsonl или .csv с задачами.\n\n"
+        "Поля: section, type (multiple_choice / text_input), photo, hint, solution, solution_type; "
+        "для теста - correct_choice и 3 неправильных варианта, для ввода числа - text_answer."
+    )
+    await state.set_state(TaskImport.waiting_for_file)
+    await callback.answer()
+
+@router.message(TaskImport.waiting_for_file, F.document)
+async def process_import_file(message: Message, state: FSMContext, bot: Bot):
+    file_name = (message.document.file_name or "").lower()
+    if not file_name.endswith(('.jsonl', '.csv')):
+        await message.answer("Нужен файл с расширением .jsonl или .csv. Попробуйте еще раз.")
+        return
+    await state.clear()
+    status = await message.answer("⏳ Импортирую задачи...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, file_name)
+        await bot.download(message.document, destination=path)
+        try:
+            report = await import_tasks(path)
+        except Exception as e:
+            # Уже записанные пачки остаются в БД, упавшая откатывается целиком
+            await status.edit_text(f"❌ Импорт прерван: {e}", reply_markup=admin_main_keyboard)
+            return
+    await status.edit_text(
+        "✅ Импорт завершен\n\n" + format_report(report, max_errors=20),
+        reply_markup=admin_main_keyboard
+    )
+
+
+# --- Выгрузка лога ответов ---
+
+@router.callback_query(F.data == "export_answers")
+async def choose_export_period(callback: CallbackQuery):
+    await callback.message.edit_text("За какой период выгрузить ответы учеников?", reply_markup=export_period_keyboard)
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("export_answers_"))
+async def process_export_answers(callback: CallbackQuery):
+    period = callback.data.split("_")[-1]
+    since = None
+    if period != "all":
+        since = (datetime.now(timezone.utc) - timedelta(days=int(period))).strftime('%Y-%m-%d %H:%M:%S')
+    await callback.message.edit_text("⏳ Готовлю выгрузку...")
+    await callback.answer()
+    file_name = f"answers_{datetime.now(timezone.utc):%Y%m%d_%H%M%S}.csv.gz"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, file_name)
+        try:
+            # Большой лог делится на части, каждая помещается в предел Telegram на документ
+            report = await export_answers(path, compress=True, since=since, max_bytes=TELEGRAM_PART_BYTES)
+            paths = report['paths']
+            oversized = [part for part in paths if os.path.getsize(part) > TELEGRAM_DOCUMENT_LIMIT]
+            if oversized:
+                raise ValueError(f"часть выгрузки больше {TELEGRAM_DOCUMENT_LIMIT // (1024 * 1024)} МБ")
+            for number, part in enumerate(paths, 1):
+                caption = "📊 Лог ответов\n\n" + format_export_report(report) if number == 1 else None
+                if len(paths) > 1:
+                    caption = f"Часть {number} из {len(paths)}" + (f"\n\n{caption}" if caption else "")
+                await callback.message.answer_document(
+                    FSInputFile(part, filename=os.path.basename(part)), caption=caption
+                )
+        except Exception as e:
+            await callback.message.edit_text(f"❌ Выгрузка не удалась: {e}", reply_markup=admin_main_keyboard)
+            return
+    await callback.message.answer("Добро пожаловать в панель администратора!", reply_markup=admin_main_keyboard)
+
+
 # --- Блок просмотра статистики учеников (НОВЫЙ) ---
 
+async def show_students_page(message: Message, sort='new', after_id=None, before_id=None, query=None, edit=True):
+    students, has_prev, has_next = await db.get_students_page(sort, after_id, before_id, query)
+    if query:
+        text = f"Ученики, чье имя начинается на «{query}»:" if students else f"Нет учеников с именем на «{query}»."
+    else:
+        text = "Выберите ученика для просмотра статистики:"
+    keyboard = get_students_keyboard(students, sort, has_prev, has_next)
+    if edit:
+        await message.edit_text(text, reply_markup=keyboard)
+    else:
+        await message.answer(text, reply_markup=keyboard)
+
 @router.callback_query(F.data.startswith("view_students"))
-async def show_students_list(callback: CallbackQuery):
-    page = int(callback.data.split('_')[-1]) if '_' in callback.data else 1
-    students = await db.get_all_students(page)
+async def show_students_list(callback: CallbackQuery, state: FSMContext):
+    await state.update_data(students_query=None)
+    students, has_prev, has_next = await db.get_students_page()
 
     if not students:
         await callback.answer("Пока нет ни одного зарегистрированного ученика.", show_alert=True)
         return
 
-    keyboard = get_students_keyboard(students, page)
+    keyboard = get_students_keyboard(students, 'new', has_prev, has_next)
     await callback.message.edit_text(
         "Выберите ученика для просмотра статистики:",
         reply_markup=keyboard
     )
     await callback.answer()
 
+@router.callback_query(F.data == "students_search")
+async def start_students_search(callback: CallbackQuery, state: FSMContext):
+    await callback.message.edit_text("Введите начало имени ученика:")
+    await state.set_state(StudentSearch.waiting_for_query)
+    await callback.answer()
+
+@router.message(StudentSearch.waiting_for_query, F.text)
+async def process_students_search(message: Message, state: FSMContext):
+    query = message.text.strip()
+    await state.set_state(None)
+    await state.update_data(students_query=query)
+    await show_students_page(message, 'name', query=query, edit=False)
+
+@router.callback_query(F.data.startswith("students_"))
+async def navigate_students(callback: CallbackQuery, state: FSMContext):
+    # students_{sort} или students_{sort}_{prev|next}_{id}
+    parts = callback.data.split("_")
+    sort = parts[1]
+    if sort not in db.STUDENT_SORTS:
+        await callback.answer()
+        return
+    after_id = before_id = None
+    if len(parts) == 4:
+        if parts[2] == "next":
+            after_id = int(parts[3])
+        else:
+            before_id = int(parts[3])
+
+    query = None
+    if sort == 'name':
+        query = (await state.get_data()).get('students_query')
+    else:
+        await state.update_data(students_query=None)
+
+    await show_students_page(callback.message, sort, after_id, before_id, query)
+    await callback.answer()
+
 @router.callback_query(F.data.startswith("student_"))
 async def show_student_stats(callback: CallbackQuery):
     student_telegram_id = int(callback.data.split("_")[1])
@@ -257,13 +444,75 @@ async def show_student_stats(callback: CallbackQuery):
 
     # Клавиатура для возврата
     back_kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="⬅️ Назад к списку", callback_data="view_students_1")],
+        [InlineKeyboardButton(text="⬅️ Назад к списку", callback_data="view_students")],
         [InlineKeyboardButton(text="🏠 В админ-меню", callback_data="admin_main_menu")]
     ])
 
     await callback.message.edit_text(report, parse_mode="Markdown", reply_markup=back_kb)
     await callback.answer()
 
+# --- Аналитика по классу ---
+
+def _percent(value):
+    return f"{value * 100:.0f}%" if value is not None else "-"
+
+def _cohort_line(accuracy, hint_rate, solution_rate, median_attempts):
+    median = f"{median_attempts:g}" if median_attempts is not None else "-"
+    return (f"точность {_percent(accuracy)}, подсказка {_percent(hint_rate)}, "
+            f"решение {_percent(solution_rate)}, попыток (медиана) {median}")
+
+def _cohort_tasks_report(title, tasks, catalog):
+    if not tasks:
+        return ""
+    report = f"\n{title}\n"
+    for task_id, section_id, students, accuracy, hint_rate, solution_rate, median_attempts in tasks:
+        section = catalog.name(section_id) or section_id
+        report += (f"  Задача {task_id} ({section}, учеников {students}): "
+                   f"{_cohort_line(accuracy, hint_rate, solution_rate, median_attempts)}\n")
+    return report
+
+@router.callback_query(F.data == "cohort")
+async def show_cohort(callback: CallbackQuery):
+    # Все цифры читаются из свертки, которую фоном обновляет cohort_refresher
+    sections = await db.get_cohort_sections()
+    if not sections:
+        await callback.message.edit_text(
+            "Аналитики пока нет: ученики еще не отвечали или свертка лога еще не построена.",
+            reply_markup=get_cohort_keyboard([])
+        )
+        await callback.answer()
+        return
+
+    catalog = await db.get_sections_catalog()
+    report = "📈 Аналитика по классу\n\n"
+    for section_id, name, tasks, students, answered, accuracy, hint_rate, solution_rate, median_attempts in sections:
+        report += (f"{name or section_id}: задач {tasks}, учеников {students}, ответов {answered}\n"
+                   f"  {_cohort_line(accuracy, hint_rate, solution_rate, median_attempts)}\n")
+    report += _cohort_tasks_report("🔥 Самые трудные задачи:", await db.get_cohort_tasks(hardest=True), catalog)
+    report += _cohort_tasks_report("🌱 Самые легкие задачи:", await db.get_cohort_tasks(hardest=False), catalog)
+
+    await callback.message.edit_text(
+        report[:4000],
+        reply_markup=get_cohort_keyboard([(section[0], section[1] or str(section[0])) for section in sections])
+    )
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("cohort_section_"))
+async def show_cohort_section(callback: CallbackQuery):
+    section_id = int(callback.data.split("_")[-1])
+    catalog = await db.get_sections_catalog()
+    hardest = await db.get_cohort_tasks(section_id, hardest=True, limit=10)
+    easiest = await db.get_cohort_tasks(section_id, hardest=False, limit=5)
+
+    report = f"📈 Раздел «{catalog.name(section_id) or section_id}»\n"
+    report += _cohort_tasks_report("🔥 Самые трудные задачи:", hardest, catalog)
+    report += _cohort_tasks_report("🌱 Самые легкие задачи:", easiest, catalog)
+    if not hardest:
+        report += "\nПока мало ответов, чтобы оценить задачи раздела."
+
+    await callback.message.edit_text(report[:4000], reply_markup=get_cohort_keyboard([], back="cohort"))
+    await callback.answer()
+
 # --- Блок рассылки (НОВЫЙ) ---
 
 @router.callback_query(F.data == "create_broadcast")
@@ -275,7 +524,8 @@ async def start_broadcast(callback: CallbackQuery, state: FSMContext):
 
 @router.message(Broadcast.waiting_for_message, F.content_type.in_({'text', 'photo', 'video', 'document'}))
 async def get_broadcast_message(message: Message, state: FSMContext):
-    await state.update_data(message_to_send=message)
+    # В FSM храним только координаты сообщения: состояние сериализуется в БД
+    await state.update_data(broadcast_chat_id=message.chat.id, broadcast_message_id=message.message_id)
     user_count = await db.get_all_user_ids()
 
     await message.answer(
@@ -287,38 +537,19 @@ async def get_broadcast_message(message: Message, state: FSMContext):
 @router.callback_query(Broadcast.confirming, F.data == "confirm_broadcast")
 async def process_broadcast(callback: CallbackQuery, state: FSMContext, bot: Bot):
     data = await state.get_data()
-    message_to_send = data.get('message_to_send')
+    from_chat_id = data.get('broadcast_chat_id')
+    message_id = data.get('broadcast_message_id')
 
     await state.clear()
     await callback.message.edit_text("Начинаю рассылку...")
 
-    user_ids = await db.get_all_user_ids()
-    sent_count = 0
-    failed_count = 0
-
-    for user_id_tuple in user_ids:
-        user_id = user_id_tuple[0]
-        try:
-            # Используем copy_message для пересылки любого типа контента
-            await bot.copy_message(
-                chat_id=user_id,
-                from_chat_id=message_to_send.chat.id,
-                message_id=message_to_send.message_id,
-                reply_markup=message_to_send.reply_markup
-            )
-            sent_count += 1
-            await asyncio.sleep(0.1) # Небольшая задержка во избежание флуда
-        except (TelegramForbiddenError, TelegramBadRequest):
-            # Пользователь заблокировал бота или неверный ID
-            failed_count += 1
-        except Exception as e:
-            failed_count += 1
-            print(f"Ошибка при рассылке пользователю {user_id}: {e}")
-
-    await callback.message.answer(
-        f"Рассылка завершена!\n\n✅ Отправлено: {sent_count}\n❌ Ошибок: {failed_count}",
-        reply_markup=admin_main_keyboard
+    # Задание и список получателей сохраняются в БД: после перезапуска рассылка продолжится
+    job_id, total = await db.create_broadcast_job(
+        from_chat_id, message_id, callback.message.chat.id, callback.message.message_id
     )
+    # Отправка идет в фоне, прогресс обновляется в этом же сообщении
+    broadcast.start_job(bot, job_id)
+    await callback.answer(f"Рассылка #{job_id} запущена: {total} получателей.")
 
 @router.callback_query(Broadcast.confirming, F.data == "cancel_broadcast")
 async def cancel_broadcast(callback: CallbackQuery, state: FSMContext):
@@ -5,12 +5,12 @@ from aiogram.filters import CommandStart
 from aiogram.fsm.context import FSMContext
 
 from database import database as db
+from database.regrade import text_answer_is_correct
 from keyboards.user_keyboards import (
     main_menu_keyboard,
     back_to_menu_keyboard,
-    get_sections_keyboard,
-    get_task_keyboard,
-    next_task_keyboard
+    next_task_keyboard,
+    get_leaderboard_keyboard
 )
 # Убедитесь, что в файле states/admin_states.py класс называется именно SolveTask
 from states.admin_states import Registration, SolveTasks
@@ -21,9 +21,11 @@ router = Router()
 
 @router.message(CommandStart())
 async def cmd_start(message: Message, state: FSMContext):
-    user = await db.get_user(message.from_user.id)
+    user = await db.get_identity(message.from_user.id)
     if user:
-        await message.answer(f"С возвращением, {user[2]}!", reply_markup=main_menu_keyboard)
+        # Раз пишет нам - значит, не блокирует бота, снова включаем его в рассылки
+        await db.unblock_user(message.from_user.id)
+        await message.answer(f"С возвращением, {user.full_name}!", reply_markup=main_menu_keyboard)
     else:
         await message.answer("Добро пожаловать в 'Физика-Ассистент'! 👋\n\n"
                              "Для начала, пожалуйста, введите ваше имя и фамилию.")
@@ -44,56 +46,60 @@ async def contact_tutor(callback: CallbackQuery):
 
 @router.callback_query(F.data == "main_menu")
 async def back_to_main_menu(callback: CallbackQuery):
-    user = await db.get_user(callback.from_user.id)
-    await callback.message.edit_text(f"С возвращением, {user[2]}!", reply_markup=main_menu_keyboard)
+    user = await db.get_identity(callback.from_user.id)
+    await callback.message.edit_text(f"С возвращением, {user.full_name}!", reply_markup=main_menu_keyboard)
     await callback.answer()
 
 # --- Блок решения задач ---
 
 async def send_new_task(callback: CallbackQuery, state: FSMContext, section_id: int):
     """Универсальная функция для отправки новой задачи."""
-    task = await db.get_random_task_by_section(section_id)
+    # Сначала задачи, которые ученик еще не видел, затем нерешенные. Обычно задача
+    # уже выбрана и загружена целиком (варианты, ответ, клавиатура), пока решалась предыдущая
+    task = await db.take_next_task(section_id, callback.from_user.id)
 
     if not task:
         await callback.message.edit_text("В этом разделе пока нет задач. Выберите другой.")
         await callback.answer()
         return
 
-    task_id, task_type, photo_file_id = task
+    task_id, task_type, photo_file_id = task.id, task.task_type, task.photo_file_id
 
     if task_type == 'multiple_choice':
-        choices = await db.get_task_choices(task_id)
-        keyboard = get_task_keyboard(task_type, task_id, choices)
-        await callback.message.answer_photo(photo=photo_file_id, reply_markup=keyboard)
+        await callback.message.answer_photo(photo=photo_file_id, reply_markup=task.keyboard)
 
     elif task_type == 'text_input':
-        keyboard = get_task_keyboard(task_type, task_id)
         await callback.message.answer_photo(
             photo=photo_file_id,
             caption="Введите ваш числовой ответ в сообщении.",
-            reply_markup=keyboard
+            reply_markup=task.keyboard
         )
         await state.set_state(SolveTasks.waiting_for_text_answer)
         await state.update_data(current_task_id=task_id)
 
+    # Пока ученик решает эту задачу, готовим следующую
+    db.prefetch_next_task(section_id, callback.from_user.id, task_id)
+
     await callback.message.delete()
     await callback.answer()
 
 @router.callback_query(F.data == "solve_tasks")
 async def solve_tasks(callback: CallbackQuery):
-    sections = await db.get_sections()
-    if not sections:
+    catalog = await db.get_sections_catalog()
+    if not catalog.has_tasks():
         await callback.message.answer("Извините, пока нет доступных разделов с задачами.")
         await callback.answer()
         return
 
-    keyboard = get_sections_keyboard(sections)
-    await callback.message.edit_text("Выберите раздел физики:", reply_markup=keyboard)
+    # Клавиатура разделов собрана заранее и пересобирается только при изменении каталога
+    await callback.message.edit_text("Выберите раздел физики:", reply_markup=catalog.user_keyboard)
     await callback.answer()
 
 @router.callback_query(F.data.startswith("section_"))
 async def process_section_choice(callback: CallbackQuery, state: FSMContext):
     section_id = int(callback.data.split("_")[1])
+    # Задача, заготовленная для прежнего раздела, больше не нужна
+    db.drop_prefetched_task(callback.from_user.id)
     await state.update_data(current_section_id=section_id)
     await send_new_task(callback, state, section_id)
 
@@ -112,7 +118,10 @@ async def give_next_task(callback: CallbackQuery, state: FSMContext):
 async def process_choice_answer(callback: CallbackQuery):
     _, task_id, choice_id, is_correct_str = callback.data.split("_")
     task_id, choice_id = int(task_id), int(choice_id)
-    is_correct = is_correct_str == '1'
+    # Оцениваем по текущему ключу: кнопки могли быть отправлены до исправления ключа
+    is_correct = await db.get_choice_is_correct(task_id, choice_id)
+    if is_correct is None:
+        is_correct = is_correct_str == '1'
 
     await db.log_user_action(callback.from_user.id, task_id, 'answered', answer_given=choice_id, is_correct=is_correct)
 
@@ -159,7 +168,7 @@ async def process_text_answer(message: Message, state: FSMContext):
     task_id = user_data.get('current_task_id')
     correct_answer_tuple = await db.get_task_text_answer(task_id)
     correct_answer = correct_answer_tuple[0]
-    is_correct = abs(user_answer_float - correct_answer) <= abs(correct_answer * 0.005)
+    is_correct = text_answer_is_correct(user_answer_float, correct_answer)
 
     await db.log_user_action(message.from_user.id, task_id, 'answered', answer_given=user_answer_str, is_correct=is_correct)
 
@@ -207,6 +216,43 @@ async def process_solution_request(callback: CallbackQuery, state: FSMContext):
 
 # --- Блок статистики ---
 
+def _leaderboard_text(title, top, me):
+    medals = {1: "🥇", 2: "🥈", 3: "🥉"}
+    text = f"{title}\n\n"
+    if not top:
+        text += "Пока никто не решил ни одной задачи. Станьте первым!\n"
+    for rank, name, score in top:
+        text += f"{medals.get(rank, f'{rank}.')} {name} - {score}\n"
+    rank, score, total = me
+    if rank:
+        text += f"\nВаше место: {rank} из {total} (верных ответов: {score})"
+    else:
+        text += "\nВас пока нет в рейтинге - решите хотя бы одну задачу."
+    return text
+
+@router.callback_query(F.data == "leaderboard")
+async def show_leaderboard(callback: CallbackQuery):
+    # Места считаются в памяти за O(log n), без GROUP BY по логу
+    top, me = await db.get_leaderboard(callback.from_user.id)
+    catalog = await db.get_sections_catalog()
+    sections = [(section_id, name) for section_id, name, count in catalog.sections if count > 0]
+    await callback.message.edit_text(
+        _leaderboard_text("🏆 Общий рейтинг (верные ответы)", top, me),
+        reply_markup=get_leaderboard_keyboard(sections)
+    )
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("leaderboard_"))
+async def show_section_leaderboard(callback: CallbackQuery):
+    section_id = int(callback.data.split("_")[1])
+    top, me = await db.get_leaderboard(callback.from_user.id, section_id)
+    catalog = await db.get_sections_catalog()
+    await callback.message.edit_text(
+        _leaderboard_text(f"🏆 Рейтинг: {catalog.name(section_id) or section_id}", top, me),
+        reply_markup=get_leaderboard_keyboard([])
+    )
+    await callback.answer()
+
 @router.callback_query(F.data == "my_stats")
 async def my_statistics(callback: CallbackQuery):
     stats = await db.get_user_statistics(callback.from_user.id)
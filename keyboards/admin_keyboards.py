@@ -4,6 +4,9 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 admin_main_keyboard = InlineKeyboardMarkup(inline_keyboard=[
     [InlineKeyboardButton(text="👥 Мои ученики и их статистика", callback_data="view_students")],
     [InlineKeyboardButton(text="➕ Добавить задачу", callback_data="add_task")],
+    [InlineKeyboardButton(text="📥 Импорт задач из файла", callback_data="import_tasks")],
+    [InlineKeyboardButton(text="📈 Аналитика по классу", callback_data="cohort")],
+    [InlineKeyboardButton(text="📊 Выгрузить лог ответов", callback_data="export_answers")],
     [InlineKeyboardButton(text="📤 Создать рассылку", callback_data="create_broadcast")]
 ])
 
@@ -22,6 +25,25 @@ def get_sections_keyboard_admin(sections):
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+export_period_keyboard = InlineKeyboardMarkup(inline_keyboard=[
+    [
+        InlineKeyboardButton(text="7 дней", callback_data="export_answers_7"),
+        InlineKeyboardButton(text="30 дней", callback_data="export_answers_30"),
+        InlineKeyboardButton(text="Все время", callback_data="export_answers_all")
+    ],
+    [InlineKeyboardButton(text="🏠 В админ-меню", callback_data="admin_main_menu")]
+])
+
+def get_cohort_keyboard(sections, back="admin_main_menu"):
+    buttons = [
+        [InlineKeyboardButton(text=name, callback_data=f"cohort_section_{section_id}")]
+        for section_id, name in sections
+    ]
+    buttons.append([InlineKeyboardButton(
+        text="⬅️ Ко всем разделам" if back == "cohort" else "🏠 В админ-меню", callback_data=back
+    )])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
 confirm_keyboard = InlineKeyboardMarkup(inline_keyboard=[
     [
         InlineKeyboardButton(text="✅ Подтвердить и сохранить", callback_data="confirm_add_task"),
@@ -31,31 +53,43 @@ confirm_keyboard = InlineKeyboardMarkup(inline_keyboard=[
 
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-STUDENTS_PER_PAGE = 10
+STUDENT_SORT_TITLES = {
+    'new': "🆕 Новые",
+    'active': "🕒 Активные",
+    'accuracy': "🎯 Точность",
+}
 
-def get_students_keyboard(students, page=1):
+def get_students_keyboard(students, sort='new', has_prev=False, has_next=False):
     buttons = []
     # Кнопки с учениками
-    for student in students:
-        # student[0] - telegram_id, student[1] - full_name
+    for user_id, telegram_id, full_name, answered, accuracy, last_activity in students:
         buttons.append([
-            InlineKeyboardButton(text=student[1], callback_data=f"student_{student[0]}")
+            InlineKeyboardButton(
+                text=f"{full_name} · {answered} отв. · {accuracy:.0%} · {last_activity[:10]}",
+                callback_data=f"student_{telegram_id}"
+            )
         ])
 
-    # Кнопки пагинации
+    # Кнопки пагинации: в callback_data - id крайнего ученика страницы (курсор)
     pagination_buttons = []
-    if page > 1:
+    if has_prev:
         pagination_buttons.append(
-            InlineKeyboardButton(text="⬅️ Назад", callback_data=f"view_students_{page - 1}")
+            InlineKeyboardButton(text="⬅️ Назад", callback_data=f"students_{sort}_prev_{students[0][0]}")
         )
-    if len(students) == STUDENTS_PER_PAGE:
+    if has_next:
         pagination_buttons.append(
-            InlineKeyboardButton(text="Вперед ➡️", callback_data=f"view_students_{page + 1}")
+            InlineKeyboardButton(text="Вперед ➡️", callback_data=f"students_{sort}_next_{students[-1][0]}")
         )
 
     if pagination_buttons:
         buttons.append(pagination_buttons)
 
+    # Сортировка и поиск
+    buttons.append([
+        InlineKeyboardButton(text=f"• {title}" if key == sort else title, callback_data=f"students_{key}")
+        for key, title in STUDENT_SORT_TITLES.items()
+    ])
+    buttons.append([InlineKeyboardButton(text="🔎 Поиск по имени", callback_data="students_search")])
     buttons.append([InlineKeyboardButton(text="🏠 В админ-меню", callback_data="admin_main_menu")])
 
     return InlineKeyboardMarkup(inline_keyboard=buttons)
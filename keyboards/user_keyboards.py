@@ -4,6 +4,7 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 main_menu_keyboard = InlineKeyboardMarkup(inline_keyboard=[
     [InlineKeyboardButton(text="🚀 Решать задачи", callback_data="solve_tasks")],
     [InlineKeyboardButton(text="📊 Моя статистика", callback_data="my_stats")],
+    [InlineKeyboardButton(text="🏆 Рейтинг", callback_data="leaderboard")],
     [InlineKeyboardButton(text="💬 Связаться с репетитором", callback_data="contact_tutor")]
 ])
 
@@ -14,6 +15,17 @@ def get_sections_keyboard(sections):
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+def get_leaderboard_keyboard(sections):
+    # Общий рейтинг - кнопки разделов, рейтинг раздела - возврат к общему
+    buttons = [
+        [InlineKeyboardButton(text=f"🏆 {name}", callback_data=f"leaderboard_{section_id}")]
+        for section_id, name in sections
+    ]
+    if not sections:
+        buttons.append([InlineKeyboardButton(text="⬅️ Общий рейтинг", callback_data="leaderboard")])
+    buttons.append([InlineKeyboardButton(text="🏠 В меню", callback_data="main_menu")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
 def get_task_keyboard(task_type, task_id, choices=None):
     buttons = []
     if task_type == 'multiple_choice':
@@ -36,7 +48,7 @@ def get_task_keyboard(task_type, task_id, choices=None):
 # Клавиатура после правильного ответа
 next_task_keyboard = InlineKeyboardMarkup(inline_keyboard=[
     [
-        InlineKeyboardButton(text="➡️ Следующая задача", callback_data="next_tasks"),
+        InlineKeyboardButton(text="➡️ Следующая задача", callback_data="next_task"),
         InlineKeyboardButton(text="🏠 В меню", callback_data="main_menu")
     ]
 ])
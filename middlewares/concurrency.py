@@ -0,0 +1,19 @@
+# middlewares/concurrency.py
+import asyncio
+
+from aiogram import BaseMiddleware
+
+
+class ConcurrencyLimitMiddleware(BaseMiddleware):
+    """Ограничивает число апдейтов, обрабатываемых одновременно.
+
+    В режиме webhook каждый апдейт обрабатывается в отдельной задаче, и при
+    всплеске их могут быть сотни разом - все они конкурируют за пул соединений с БД.
+    """
+
+    def __init__(self, limit):
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __call__(self, handler, event, data):
+        async with self._semaphore:
+            return await handler(event, data)
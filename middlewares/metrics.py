@@ -0,0 +1,60 @@
+# middlewares/metrics.py
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+from services.metrics import metrics
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Замеряет обработку апдейта целиком и считает, сколько за него было
+    обращений к БД и к Telegram API. Вешается на dp.update как внешний middleware."""
+
+    async def __call__(self, handler, event, data):
+        calls = metrics.start_update()
+        started = time.perf_counter()
+        error = False
+        try:
+            return await handler(event, data)
+        except Exception:
+            error = True
+            raise
+        finally:
+            metrics.finish_update(event.event_type, calls, time.perf_counter() - started, error)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Число вызовов, ошибок и длительность по каждому обработчику.
+
+    Регистрируется как внутренний middleware роутера: только там известно,
+    какой обработчик выбран (data["handler"]), а внешний видит апдейт до фильтров.
+    """
+
+    async def __call__(self, handler, event, data):
+        callback = data["handler"].callback
+        name = f"{callback.__module__.rsplit('.', 1)[-1]}.{callback.__name__}"
+        started = time.perf_counter()
+        error = False
+        try:
+            return await handler(event, data)
+        except Exception:
+            error = True
+            raise
+        finally:
+            metrics.observe_handler(name, time.perf_counter() - started, error)
+
+
+class TelegramApiMetricsMiddleware(BaseRequestMiddleware):
+    """Длительность и ошибки запросов к Telegram API по методам. Вешается на bot.session."""
+
+    async def __call__(self, make_request, bot, method):
+        started = time.perf_counter()
+        error = False
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            error = True
+            raise
+        finally:
+            metrics.observe_api(type(method).__name__, time.perf_counter() - started, error)
@@ -0,0 +1,65 @@
+# middlewares/throttling.py
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery
+
+from services.metrics import metrics
+from services.rate_limit import RateLimitTable
+
+
+def callback_kind(data):
+    """Тип кнопки - callback data до первого числового параметра: choice_12_3_1 -> choice."""
+    kind = []
+    for part in (data or "").split("_"):
+        if part.lstrip("-").isdigit():
+            break
+        kind.append(part)
+    return "_".join(kind) or "-"
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Ограничивает частоту сообщений и нажатий кнопок каждого пользователя.
+
+    Предел считается на пару (пользователь, тип кнопки) - так частые ответы на
+    задачу не мешают открыть меню. Повтор той же кнопки, пока прежнее нажатие
+    еще обрабатывается, отбрасывается сразу. Отброшенное нажатие получает только
+    answerCallbackQuery (иначе на кнопке крутятся "часики"), до обработчиков и БД
+    оно не доходит; счетчики отброшенного - в метриках (bot_throttled_total).
+    Вешается внешним middleware на dp.message и dp.callback_query.
+    """
+
+    def __init__(self, rate, burst, limits=None, exempt=(), notice="Не так быстро, подождите секунду"):
+        self.default = RateLimitTable(rate, burst)
+        # Тип кнопки -> своя таблица с (rate, burst)
+        self.tables = {kind: RateLimitTable(*limit) for kind, limit in (limits or {}).items()}
+        self.exempt = set(exempt)
+        self.notice = notice
+        self._in_flight = set()  # (пользователь, callback data)
+
+    async def __call__(self, handler, event, data):
+        user = event.from_user
+        if user is None or user.id in self.exempt:
+            return await handler(event, data)
+        in_flight_key = None
+        if isinstance(event, CallbackQuery):
+            kind = callback_kind(event.data)
+            in_flight_key = (user.id, event.data)
+            if in_flight_key in self._in_flight:
+                return await self._drop(event, kind, "duplicate")
+        else:
+            kind = "message"
+        if not self.tables.get(kind, self.default).allow((user.id, kind)):
+            return await self._drop(event, kind, "rate")
+        if in_flight_key is None:
+            return await handler(event, data)
+        self._in_flight.add(in_flight_key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(in_flight_key)
+
+    async def _drop(self, event, kind, reason):
+        metrics.observe_throttled(kind, reason)
+        if isinstance(event, CallbackQuery):
+            await event.answer(self.notice if reason == "rate" else None)
+        return None
+
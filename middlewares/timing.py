@@ -0,0 +1,53 @@
+# middlewares/timing.py
+import logging
+import time
+
+from aiogram import BaseMiddleware
+
+
+class UpdateTimingMiddleware(BaseMiddleware):
+    """Замеряет время обработки каждого апдейта и раз в report_interval секунд
+    пишет в лог пропускную способность и перцентили задержки.
+
+    Одинаково работает в режимах polling и webhook, поэтому их можно сравнить
+    по строкам лога. Если задан record_file, каждый апдейт дописывается в него
+    строкой JSON - такой файл потом можно "проиграть" на webhook-эндпоинт
+    скриптом benchmarks/webhook_replay.py.
+    """
+
+    def __init__(self, mode, report_interval=60, record_file=None):
+        self.mode = mode
+        self.report_interval = report_interval
+        self.record_file = record_file
+        self._durations = []
+        self._window_start = time.monotonic()
+
+    async def __call__(self, handler, event, data):
+        if self.record_file:
+            with open(self.record_file, "a", encoding="utf-8") as f:
+                f.write(event.model_dump_json(exclude_none=True) + "\n")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self._durations.append(time.perf_counter() - started)
+            if time.monotonic() - self._window_start >= self.report_interval:
+                self._report()
+
+    def _report(self):
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        durations = sorted(self._durations)
+        self._durations = []
+        self._window_start = now
+        if not durations:
+            return
+
+        def percentile(p):
+            return durations[min(len(durations) - 1, int(len(durations) * p))] * 1000
+
+        logging.info(
+            "[%s] апдейтов: %d за %.0f с (%.1f/с), задержка обработки p50=%.1f мс p95=%.1f мс p99=%.1f мс",
+            self.mode, len(durations), elapsed, len(durations) / elapsed,
+            percentile(0.50), percentile(0.95), percentile(0.99)
+        )
@@ -0,0 +1,203 @@
+# services/answer_export.py
+"""Потоковая выгрузка лога ответов для офлайн-анализа.
+
+Строки user_answers вместе с учеником, задачей и разделом читаются пачками
+через отдельное соединение только для чтения и сразу пишутся в файл,
+поэтому память не растет с размером лога, а бот продолжает писать ответы.
+Запись и сжатие пачки идут в отдельном потоке и не останавливают event loop.
+Выгрузку можно разбить на части не больше заданного размера - например,
+чтобы каждая уложилась в предел Telegram на размер документа.
+
+    python -m services.answer_export answers.csv.gz
+    python -m services.answer_export answers.jsonl --since 2024-09-01 --until 2024-10-01
+    python -m services.answer_export answers.csv.gz --part-mb 45
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+
+from database import database as db
+
+CHUNK_SIZE = 5000
+FORMATS = ('csv', 'jsonl')
+# Бот может отправить документ до 50 МБ; части берем с запасом на недописанный буфер сжатия
+TELEGRAM_DOCUMENT_LIMIT = 50 * 1024 * 1024
+TELEGRAM_PART_BYTES = 45 * 1024 * 1024
+
+COLUMNS = (
+    'answer_id', 'timestamp', 'action_type', 'telegram_id', 'full_name',
+    'task_id', 'task_type', 'section_id', 'section', 'answer_given', 'is_correct',
+)
+
+EXPORT_QUERY = """
+    SELECT a.id, a.timestamp, a.action_type, u.telegram_id, u.full_name,
+           a.task_id, t.task_type, t.section_id, s.name, a.answer_given, a.is_correct
+    FROM user_answers a
+    LEFT JOIN users u ON u.id = a.user_id
+    LEFT JOIN tasks t ON t.id = a.task_id
+    LEFT JOIN sections s ON s.id = t.section_id
+    WHERE a.timestamp >= ? AND a.timestamp < ?
+    ORDER BY a.timestamp, a.id
+"""
+
+# Границы по умолчанию. Они должны быть полными датами: у колонки timestamp числовое
+# сродство, и строку вида '9999' SQLite при сравнении превратил бы в число
+MIN_TIMESTAMP = '0000-01-01 00:00:00'
+MAX_TIMESTAMP = '9999-12-31 23:59:59'
+
+
+def parse_timestamp(value):
+    """Дата или дата со временем (ISO) в формате timestamp лога ответов."""
+    return datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S')
+
+
+async def iter_answer_chunks(since=None, until=None, chunk_size=CHUNK_SIZE):
+    """Пачки строк лога в порядке времени; since включительно, until - нет. В памяти не больше chunk_size строк."""
+    async with db.connect_readonly() as conn:
+        cursor = await conn.execute(EXPORT_QUERY, (since or MIN_TIMESTAMP, until or MAX_TIMESTAMP))
+        while True:
+            rows = await cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+
+
+async def iter_answer_rows(since=None, until=None, chunk_size=CHUNK_SIZE):
+    """Строки лога по одной (см. iter_answer_chunks)."""
+    async for rows in iter_answer_chunks(since, until, chunk_size):
+        for row in rows:
+            yield row
+
+
+def _csv_writer(f):
+    writer = csv.writer(f)
+    writer.writerow(COLUMNS)
+    return writer.writerow
+
+
+def _jsonl_writer(f):
+    def write(row):
+        f.write(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False))
+        f.write("\n")
+    return write
+
+
+WRITERS = {'csv': _csv_writer, 'jsonl': _jsonl_writer}
+
+
+def detect_format(path):
+    """Формат и сжатие по имени файла: answers.csv, answers.jsonl.gz и т.п."""
+    name = path.lower()
+    compress = name.endswith('.gz')
+    if compress:
+        name = name[:-3]
+    return ('jsonl' if name.endswith(('.jsonl', '.ndjson')) else 'csv'), compress
+
+
+def part_path(path, number):
+    """Имя части выгрузки: answers.csv.gz -> answers.part2.csv.gz; первая часть - сам path."""
+    if number == 1:
+        return path
+    directory, name = os.path.split(path)
+    stem, dot, extension = name.partition('.')
+    return os.path.join(directory, f"{stem}.part{number}{dot}{extension}")
+
+
+class _PartWriter:
+    """Файл выгрузки, который при max_bytes переходит к следующей части. Работает в потоке."""
+
+    def __init__(self, path, fmt, compress, max_bytes):
+        self.path = path
+        self.fmt = fmt
+        self.opener = gzip.open if compress else open
+        self.max_bytes = max_bytes
+        self.paths = []
+        self._file = None
+        self._write = None
+
+    def _open_next(self):
+        self.close()
+        self.paths.append(part_path(self.path, len(self.paths) + 1))
+        self._file = self.opener(self.paths[-1], 'wt', encoding='utf-8', newline='')
+        self._write = WRITERS[self.fmt](self._file)  # у каждой части CSV свой заголовок
+
+    def write_chunk(self, rows):
+        if self._file is None:
+            self._open_next()
+        for row in rows:
+            self._write(row)
+        if self.max_bytes:
+            # Сброс буферов, чтобы размер файла на диске был точным; сжатие от этого почти не теряет
+            self._file.flush()
+            if os.path.getsize(self.paths[-1]) >= self.max_bytes:
+                self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+async def export_answers(path, fmt='csv', compress=False, since=None, until=None, chunk_size=CHUNK_SIZE,
+                         max_bytes=None):
+    """Пишет лог ответов в файл и возвращает {'rows', 'bytes', 'seconds', 'rate', 'paths'}.
+
+    max_bytes - начинать новую часть (answers.part2.csv.gz, ...), как только текущая
+    достигла этого размера; часть может превысить его не больше чем на одну пачку строк.
+    """
+    started = time.perf_counter()
+    writer = _PartWriter(path, fmt, compress, max_bytes)
+    rows = 0
+    try:
+        async for chunk in iter_answer_chunks(since, until, chunk_size):
+            await asyncio.to_thread(writer.write_chunk, chunk)
+            rows += len(chunk)
+        if not writer.paths:
+            await asyncio.to_thread(writer.write_chunk, [])  # пустой лог - файл с одним заголовком
+    finally:
+        await asyncio.to_thread(writer.close)
+    seconds = time.perf_counter() - started
+    return {
+        'rows': rows,
+        'bytes': sum(os.path.getsize(part) for part in writer.paths),
+        'seconds': seconds,
+        'rate': rows / seconds if seconds else 0.0,
+        'paths': writer.paths,
+    }
+
+
+def format_report(report):
+    parts = f"Частей: {len(report['paths'])}\n" if len(report['paths']) > 1 else ""
+    return (f"Строк: {report['rows']}\n"
+            f"{parts}"
+            f"Размер: {report['bytes'] / 1024:.1f} КБ\n"
+            f"Время: {report['seconds']:.2f} с ({report['rate']:.0f} строк/с)")
+
+
+async def _main(args):
+    fmt, compress = detect_format(args.path)
+    report = await export_answers(
+        args.path,
+        fmt=args.format or fmt,
+        compress=args.gzip or compress,
+        since=args.since,
+        until=args.until,
+        max_bytes=int(args.part_mb * 1024 * 1024) if args.part_mb else None,
+    )
+    print(format_report(report))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Выгрузка лога ответов в CSV или JSONL")
+    parser.add_argument("path", help="файл выгрузки; формат и сжатие определяются по расширению (.csv, .jsonl, .gz)")
+    parser.add_argument("--format", choices=FORMATS, help="формат, если не подходит расширение файла")
+    parser.add_argument("--gzip", action="store_true", help="сжать выгрузку gzip")
+    parser.add_argument("--since", type=parse_timestamp, help="начало периода включительно, например 2024-09-01")
+    parser.add_argument("--until", type=parse_timestamp, help="конец периода не включительно")
+    parser.add_argument("--part-mb", type=float, help="разбить выгрузку на части не больше стольких МБ")
+    asyncio.run(_main(parser.parse_args()))
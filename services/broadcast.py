@@ -0,0 +1,131 @@
+# services/broadcast.py
+import asyncio
+import logging
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from config import BROADCAST_RATE, BROADCAST_CONCURRENCY, BROADCAST_PROGRESS_INTERVAL
+from database import database as db
+from keyboards.admin_keyboards import admin_main_keyboard
+from services.rate_limit import TokenBucket
+
+# Общий для всех рассылок ограничитель: предел Telegram - на бота, а не на задание
+rate_limiter = TokenBucket(BROADCAST_RATE)
+
+# Ссылки на запущенные задания, чтобы asyncio не собрал их сборщиком мусора
+_running_jobs = {}
+
+
+def start_job(bot: Bot, job_id):
+    """Запускает задание в фоне и сразу возвращает управление обработчику."""
+    if job_id not in _running_jobs:
+        task = asyncio.create_task(run_job(bot, job_id))
+        _running_jobs[job_id] = task
+        task.add_done_callback(lambda _: _running_jobs.pop(job_id, None))
+
+
+async def resume_jobs(bot: Bot):
+    """Продолжает рассылки, прерванные перезапуском. Вызывается при старте диспетчера."""
+    for job_id in await db.get_unfinished_broadcast_jobs():
+        logging.info("Продолжаю рассылку #%s после перезапуска", job_id)
+        start_job(bot, job_id)
+
+
+async def stop_jobs():
+    """Останавливает рассылки при остановке диспетчера, сохранив уже отправленное."""
+    tasks = list(_running_jobs.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _progress_text(job_id, progress, finished=False):
+    sent = progress.get('sent', 0)
+    failed = progress.get('failed', 0)
+    blocked = progress.get('blocked', 0)
+    pending = progress.get('pending', 0)
+    total = sent + failed + blocked + pending
+    title = "Рассылка завершена!" if finished else "Идет рассылка..."
+    return (f"{title} (#{job_id})\n\n"
+            f"✅ Отправлено: {sent} из {total}\n"
+            f"🚫 Заблокировали бота: {blocked}\n"
+            f"❌ Ошибок: {failed}")
+
+
+async def _show_progress(bot: Bot, admin_chat_id, status_message_id, text, finished=False):
+    if not status_message_id:
+        return
+    try:
+        await bot.edit_message_text(
+            text=text,
+            chat_id=admin_chat_id,
+            message_id=status_message_id,
+            reply_markup=admin_main_keyboard if finished else None
+        )
+    except TelegramBadRequest:
+        # "message is not modified" или сообщение удалено - на рассылку не влияет
+        pass
+
+
+async def _send_one(bot: Bot, telegram_id, from_chat_id, message_id):
+    """Доставляет сообщение одному получателю, повторяя попытку после RetryAfter. Возвращает статус."""
+    while True:
+        await rate_limiter.acquire()
+        try:
+            await bot.copy_message(chat_id=telegram_id, from_chat_id=from_chat_id, message_id=message_id)
+            return 'sent'
+        except TelegramRetryAfter as e:
+            # Telegram просит подождать - останавливаем всех отправителей, а не только этого
+            rate_limiter.pause(e.retry_after)
+        except TelegramForbiddenError:
+            return 'blocked'
+        except TelegramBadRequest:
+            return 'failed'
+        except Exception as e:
+            logging.warning("Ошибка при рассылке пользователю %s: %r", telegram_id, e)
+            return 'failed'
+
+
+async def run_job(bot: Bot, job_id):
+    job = await db.get_broadcast_job(job_id)
+    if job is None or job[5] != 'running':
+        return
+    _, from_chat_id, message_id, admin_chat_id, status_message_id, _ = job
+
+    queue = asyncio.Queue()
+    for telegram_id in await db.get_broadcast_pending_recipients(job_id):
+        queue.put_nowait(telegram_id)
+
+    results = []  # результаты копятся и пишутся пачками, а не по одной строке
+
+    async def sender():
+        while True:
+            try:
+                telegram_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            results.append((telegram_id, await _send_one(bot, telegram_id, from_chat_id, message_id)))
+
+    async def save_results():
+        if results:
+            batch = results[:]
+            del results[:len(batch)]
+            await db.save_broadcast_results(job_id, batch)
+
+    senders = [asyncio.create_task(sender()) for _ in range(BROADCAST_CONCURRENCY)]
+    try:
+        while not all(task.done() for task in senders):
+            await asyncio.wait(senders, timeout=BROADCAST_PROGRESS_INTERVAL)
+            await save_results()
+            progress = await db.get_broadcast_progress(job_id)
+            await _show_progress(bot, admin_chat_id, status_message_id, _progress_text(job_id, progress))
+    finally:
+        # Даже при отмене сохраняем то, что успели отправить, - после перезапуска они не повторятся
+        for task in senders:
+            task.cancel()
+        await save_results()
+
+    await db.finish_broadcast_job(job_id)
+    progress = await db.get_broadcast_progress(job_id)
+    await _show_progress(bot, admin_chat_id, status_message_id, _progress_text(job_id, progress, finished=True), finished=True)
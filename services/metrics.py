@@ -0,0 +1,240 @@
+# services/metrics.py
+"""Метрики бота: обработчики, обращения к БД и к Telegram API.
+
+Счетчики и гистограммы хранятся в памяти процесса и отдаются в текстовом
+формате Prometheus на локальном HTTP-эндпоинте (METRICS_HOST:METRICS_PORT/metrics)
+и командой /metrics в админке. Вызовы БД и Telegram API дополнительно
+считаются на каждый апдейт: счетчик апдейта живет в contextvar, который
+выставляет UpdateMetricsMiddleware.
+"""
+import logging
+import time
+from contextvars import ContextVar
+
+from aiohttp import web
+
+# Границы корзин гистограмм: задержки в секундах и число вызовов на апдейт
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+# [вызовов БД, секунд в БД, вызовов API, секунд в API] текущего апдейта
+_update_calls = ContextVar("update_calls", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # не накопительно; накопление - при выводе
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q):
+        """Оценка квантиля по корзинам (верхняя граница корзины, в которую он попал)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def lines(self, name, labels=""):
+        prefix = labels + "," if labels else ""
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{prefix}le="+Inf"}} {self.count}'
+        suffix = f"{{{labels}}}" if labels else ""
+        yield f"{name}_sum{suffix} {self.sum:.6f}"
+        yield f"{name}_count{suffix} {self.count}"
+
+
+class CallStats:
+    """Число вызовов, ошибок и гистограмма длительности для одного имени."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+
+    def observe(self, seconds, error=False):
+        self.calls += 1
+        if error:
+            self.errors += 1
+        self.latency.observe(seconds)
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self.handlers = {}      # имя обработчика -> CallStats
+        self.updates = {}       # тип апдейта -> CallStats
+        self.db = CallStats()
+        self.api = {}           # метод Telegram API -> CallStats
+        self.db_calls_per_update = Histogram(COUNT_BUCKETS)
+        self.db_seconds_per_update = Histogram()
+        self.api_calls_per_update = Histogram(COUNT_BUCKETS)
+        self.api_seconds_per_update = Histogram()
+        self.throttled = {}     # (тип события, причина) -> отброшено
+
+    @staticmethod
+    def _stats(table, name):
+        stats = table.get(name)
+        if stats is None:
+            stats = table[name] = CallStats()
+        return stats
+
+    def observe_handler(self, name, seconds, error=False):
+        self._stats(self.handlers, name).observe(seconds, error)
+
+    def observe_db(self, seconds, error=False):
+        self.db.observe(seconds, error)
+        calls = _update_calls.get()
+        if calls is not None:
+            calls[0] += 1
+            calls[1] += seconds
+
+    def observe_api(self, method, seconds, error=False):
+        self._stats(self.api, method).observe(seconds, error)
+        calls = _update_calls.get()
+        if calls is not None:
+            calls[2] += 1
+            calls[3] += seconds
+
+    def observe_throttled(self, kind, reason):
+        key = (kind, reason)
+        self.throttled[key] = self.throttled.get(key, 0) + 1
+
+    def start_update(self):
+        """Заводит счетчик вызовов для текущего апдейта; возвращает его для finish_update."""
+        calls = [0, 0.0, 0, 0.0]
+        _update_calls.set(calls)
+        return calls
+
+    def finish_update(self, update_type, calls, seconds, error=False):
+        self._stats(self.updates, update_type).observe(seconds, error)
+        self.db_calls_per_update.observe(calls[0])
+        self.db_seconds_per_update.observe(calls[1])
+        self.api_calls_per_update.observe(calls[2])
+        self.api_seconds_per_update.observe(calls[3])
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus."""
+        out = []
+
+        def counters(name, help_text, table, label, attr):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} counter")
+            for key, stats in sorted(table.items()):
+                out.append(f'{name}{{{label}="{_label(key)}"}} {getattr(stats, attr)}')
+
+        def histograms(name, help_text, table, label):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} histogram")
+            for key, stats in sorted(table.items()):
+                out.extend(stats.latency.lines(name, f'{label}="{_label(key)}"'))
+
+        for prefix, what, table, label in (
+            ("bot_update", "Апдейты", self.updates, "type"),
+            ("bot_handler", "Обработчики", self.handlers, "handler"),
+            ("bot_telegram_api", "Запросы к Telegram API", self.api, "method"),
+        ):
+            counters(f"{prefix}_calls_total", f"{what}: число вызовов", table, label, "calls")
+            counters(f"{prefix}_errors_total", f"{what}: число исключений", table, label, "errors")
+            histograms(f"{prefix}_duration_seconds", f"{what}: длительность", table, label)
+
+        out.append("# HELP bot_db_calls_total Обращения к БД: соединение от выдачи до возврата в пул")
+        out.append("# TYPE bot_db_calls_total counter")
+        out.append(f"bot_db_calls_total {self.db.calls}")
+        out.append("# TYPE bot_db_errors_total counter")
+        out.append(f"bot_db_errors_total {self.db.errors}")
+        out.append("# TYPE bot_db_duration_seconds histogram")
+        out.extend(self.db.latency.lines("bot_db_duration_seconds"))
+        for name, help_text, histogram in (
+            ("bot_update_db_calls", "Обращений к БД за апдейт", self.db_calls_per_update),
+            ("bot_update_db_seconds", "Время в БД за апдейт", self.db_seconds_per_update),
+            ("bot_update_api_calls", "Запросов к Telegram API за апдейт", self.api_calls_per_update),
+            ("bot_update_api_seconds", "Время в Telegram API за апдейт", self.api_seconds_per_update),
+        ):
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} histogram")
+            out.extend(histogram.lines(name))
+        out.append("# HELP bot_throttled_total Отброшено троттлингом: rate - сверх предела, duplicate - повтор кнопки")
+        out.append("# TYPE bot_throttled_total counter")
+        for (kind, reason), count in sorted(self.throttled.items()):
+            out.append(f'bot_throttled_total{{kind="{_label(kind)}",reason="{_label(reason)}"}} {count}')
+        out.append("# TYPE bot_start_time_seconds gauge")
+        out.append(f"bot_start_time_seconds {self.started:.0f}")
+        return "\n".join(out) + "\n"
+
+    def summary(self, limit=10):
+        """Короткая сводка для команды /metrics: самые частые обработчики и методы API."""
+        def row(name, stats):
+            average = stats.latency.sum / stats.calls * 1000 if stats.calls else 0.0
+            return (f"{name}: {stats.calls} выз., ошибок {stats.errors}, "
+                    f"сред. {average:.1f} мс, p95 ≤ {stats.latency.quantile(0.95) * 1000:.0f} мс")
+
+        updates = sum(stats.calls for stats in self.updates.values())
+        lines = [f"Апдейтов: {updates} за {(time.time() - self.started) / 60:.0f} мин"]
+        if updates:
+            lines.append(f"На апдейт: БД {self.db_calls_per_update.sum / updates:.1f} выз. "
+                         f"({self.db_seconds_per_update.sum / updates * 1000:.1f} мс), "
+                         f"API {self.api_calls_per_update.sum / updates:.1f} выз. "
+                         f"({self.api_seconds_per_update.sum / updates * 1000:.1f} мс)")
+        lines.append(row("БД", self.db))
+        if self.throttled:
+            by_reason = {}
+            for (_, reason), count in self.throttled.items():
+                by_reason[reason] = by_reason.get(reason, 0) + count
+            lines.append("Отброшено троттлингом: " + ", ".join(f"{reason} {count}" for reason, count in sorted(by_reason.items())))
+        for title, table in (("Обработчики", self.handlers), ("Telegram API", self.api)):
+            top = sorted(table.items(), key=lambda item: item[1].calls, reverse=True)[:limit]
+            if top:
+                lines.append(f"\n{title}:")
+                lines.extend(row(name, stats) for name, stats in top)
+        return "\n".join(lines)
+
+
+metrics = Metrics()
+
+
+async def _metrics_view(request):
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+
+_runner = None
+
+
+async def start_metrics_server(host, port):
+    """Поднимает эндпоинт /metrics для Prometheus. Порт 0 - не поднимать."""
+    global _runner
+    if not port or _runner is not None:
+        return
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_view)
+    _runner = web.AppRunner(app)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+    logging.info("Метрики доступны на http://%s:%s/metrics", host, port)
+
+
+async def stop_metrics_server():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
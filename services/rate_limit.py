@@ -0,0 +1,86 @@
+# services/rate_limit.py
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class TokenBucket:
+    """Общий ограничитель скорости: не больше rate операций в секунду, всплеск до capacity.
+
+    Все отправители ждут в acquire(), поэтому предел соблюдается при любом их числе.
+    pause() останавливает всех разом - так обрабатывается TelegramRetryAfter,
+    который Telegram присылает на весь бот, а не на один чат.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        # После паузы начинаем с пустого ведра, чтобы не отправить всплеск сразу
+        self._tokens = 0
+        self._updated = self._paused_until
+
+
+class RateLimitTable:
+    """Ведра токенов по ключу (например, пользователь + тип кнопки) без ожидания.
+
+    Ведро - это пара [токены, время обновления] в OrderedDict, без блокировок и
+    задач, так что таблица на десятки тысяч пользователей занимает мегабайты.
+    allow() не ждет токен, а сразу отвечает, можно ли выполнить действие.
+    Ведро, которое не трогали дольше capacity / rate секунд, снова полное и
+    ничем не отличается от нового, поэтому такие ведра вытесняются из таблицы;
+    max_size ограничивает ее и при всплеске новых ключей.
+    """
+
+    def __init__(self, rate, capacity=None, max_size=100000):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.max_size = max_size
+        self.idle = self.capacity / rate
+        self._buckets = OrderedDict()  # ключ -> [токены, время обновления]
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def allow(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.capacity, now]
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        self._evict(now)
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return True
+        return False
+
+    def _evict(self, now):
+        # Порядок OrderedDict - порядок последнего обращения, так что простаивающие ведра в начале
+        while self._buckets:
+            key, (_, updated) = next(iter(self._buckets.items()))
+            if now - updated < self.idle and len(self._buckets) <= self.max_size:
+                break
+            del self._buckets[key]
@@ -0,0 +1,134 @@
+# services/reminders.py
+"""Напоминания ученикам: ежедневные приглашения порешать и "вы не решали задачи N дней".
+
+Расписание - куча ближайших напоминаний в памяти (database/reminders.py): при
+старте она заполняется одним запросом по индексу на последнюю активность,
+дальше ее обновляет каждое действие ученика, а раз в REMINDER_SYNC_INTERVAL
+секунд она сверяется с user_activity - так в нее попадают ученики, которых
+обслуживают другие процессы. Отправитель просыпается к ближайшему напоминанию,
+забирает наступившие пачкой до REMINDER_BATCH, перепроверяет их по БД одним
+запросом и отправляет с ограничением REMINDER_RATE сообщений в секунду.
+Число отправленных напоминаний хранится в reminder_state, поэтому после
+перезапуска они не повторяются.
+"""
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from config import REMINDER_RATE, REMINDER_BATCH, REMINDER_SYNC_INTERVAL
+from database import database as db
+from database.reminders import reminder_scheduler
+from keyboards.user_keyboards import main_menu_keyboard
+from services.rate_limit import TokenBucket
+
+# Отдельный от рассылок ограничитель: напоминания не должны съедать их долю лимита Telegram
+rate_limiter = TokenBucket(REMINDER_RATE)
+
+_task = None
+
+
+def reminder_text(days, kind):
+    if kind == 'daily':
+        return "Привет! Самое время решить пару задач по физике - хватит и десяти минут 💪"
+    return f"Вы не решали задачи уже {days} дн. Возвращайтесь - задачи ждут! 📚"
+
+
+async def _send_one(bot: Bot, telegram_id, text):
+    """Отправляет одно напоминание, повторяя попытку после RetryAfter. Возвращает статус."""
+    while True:
+        await rate_limiter.acquire()
+        try:
+            await bot.send_message(telegram_id, text, reply_markup=main_menu_keyboard)
+            return 'sent'
+        except TelegramRetryAfter as e:
+            rate_limiter.pause(e.retry_after)
+        except TelegramForbiddenError:
+            return 'blocked'
+        except TelegramBadRequest:
+            return 'failed'
+        except Exception as e:
+            logging.warning("Ошибка при отправке напоминания пользователю %s: %r", telegram_id, e)
+            return 'failed'
+
+
+async def dispatch_due(bot: Bot, now=None):
+    """Отправляет одну пачку наступивших напоминаний. Возвращает, сколько напоминаний было в пачке."""
+    now = time.time() if now is None else now
+    due = reminder_scheduler.pop_due(now, REMINDER_BATCH)
+    if not due:
+        return 0
+    try:
+        recipients = await db.get_reminder_recipients([telegram_id for telegram_id, _, _ in due])
+    except Exception:
+        # Вернем пачку в расписание, чтобы не потерять ее до следующей сверки
+        for telegram_id, last_activity, sent in due:
+            reminder_scheduler.schedule(telegram_id, last_activity, sent, now)
+        raise
+
+    to_send = []
+    for telegram_id, scheduled_activity, scheduled_sent in due:
+        recipient = recipients.get(telegram_id)
+        if recipient is None:
+            continue  # не ученик или заблокировал бота
+        user_id, activity_at, last_activity, sent = recipient
+        # Ученик занимался после постановки в кучу или напоминание уже отправил другой процесс - переносим
+        if last_activity > scheduled_activity or sent > scheduled_sent:
+            reminder_scheduler.schedule(telegram_id, last_activity, sent, now)
+            continue
+        step = reminder_scheduler.step(scheduled_sent)
+        to_send.append((telegram_id, user_id, activity_at, scheduled_activity, scheduled_sent, step))
+
+    statuses = await asyncio.gather(*(
+        _send_one(bot, telegram_id, reminder_text(*step)) for telegram_id, _, _, _, _, step in to_send
+    ))
+    delivered, blocked = [], []
+    for (telegram_id, user_id, activity_at, last_activity, sent, _), status in zip(to_send, statuses):
+        if status == 'blocked':
+            blocked.append(telegram_id)
+            continue
+        # Неудачная отправка тоже считается: иначе одно и то же напоминание повторялось бы без конца
+        delivered.append((user_id, activity_at, sent + 1))
+        reminder_scheduler.schedule(telegram_id, last_activity, sent + 1, now)
+    await db.save_reminder_results(delivered, blocked)
+    logging.info("Напоминаний в пачке: %d, отправлено: %d, заблокировали бота: %d",
+                 len(due), statuses.count('sent'), len(blocked))
+    return len(due)
+
+
+async def _run(bot: Bot):
+    synced = time.monotonic()
+    while True:
+        try:
+            if time.monotonic() - synced >= REMINDER_SYNC_INTERVAL:
+                await db.sync_reminders()
+                synced = time.monotonic()
+            if await dispatch_due(bot):
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning("Не удалось отправить напоминания: %r", e)
+        next_due = reminder_scheduler.next_due()
+        delay = REMINDER_SYNC_INTERVAL if next_due is None else next_due - time.time()
+        await asyncio.sleep(min(max(delay, 1), REMINDER_SYNC_INTERVAL))
+
+
+async def start_reminders(bot: Bot):
+    """Загружает расписание и запускает отправителя. Вызывается при старте диспетчера."""
+    global _task
+    if not reminder_scheduler.plan or _task is not None:
+        return
+    count = await db.sync_reminders()
+    logging.info("Расписание напоминаний загружено: учеников %d, в очереди %d", count, len(reminder_scheduler))
+    _task = asyncio.create_task(_run(bot))
+
+
+async def stop_reminders():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
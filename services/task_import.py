@@ -0,0 +1,165 @@
+# services/task_import.py
+"""Массовый импорт задач из JSONL или CSV.
+
+Каждая запись проверяется по тем же правилам, что и в FSM добавления задачи,
+недостающие разделы создаются по названию, а задачи пишутся пачками -
+одна транзакция и один executemany на таблицу для каждой пачки.
+
+Поля записи: section, type (multiple_choice | text_input), photo (file_id),
+hint, solution, solution_type (text | photo, по умолчанию text);
+для multiple_choice - correct_choice и incorrect_choices (в CSV - колонки
+incorrect_choice_1..3), для text_input - text_answer.
+
+    python -m services.task_import tasks.jsonl
+    python -m services.task_import tasks.csv --check
+"""
+import argparse
+import asyncio
+import csv
+import json
+import time
+
+from database import database as db
+
+BATCH_SIZE = 1000
+INCORRECT_CHOICES = 3
+TASK_TYPES = ('multiple_choice', 'text_input')
+SOLUTION_TYPES = ('text', 'photo')
+
+
+def parse_numeric_answer(text):
+    """Числовой ответ как в FSM: допускается запятая вместо точки. ValueError, если это не число."""
+    return float(str(text).strip().replace(',', '.'))
+
+
+def read_records(path):
+    """Построчно читает файл, отдавая (номер строки, запись или текст ошибки разбора)."""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if path.lower().endswith('.csv'):
+            reader = csv.DictReader(f)
+            for record in reader:
+                choices = [record.pop(f'incorrect_choice_{i}', None) for i in range(1, INCORRECT_CHOICES + 1)]
+                record['incorrect_choices'] = [choice for choice in choices if choice]
+                yield reader.line_num, record
+        else:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_no, f"некорректный JSON: {e.msg}"
+                    continue
+                if not isinstance(record, dict):
+                    yield line_no, "ожидался JSON-объект"
+                    continue
+                yield line_no, record
+
+
+def _text(record, field):
+    value = record.get(field)
+    if value is None or not str(value).strip():
+        raise ValueError(f"не заполнено поле {field}")
+    return str(value).strip()
+
+
+def validate_record(record):
+    """Проверяет запись и возвращает задачу в формате db.add_tasks_bulk или бросает ValueError."""
+    task_type = _text(record, 'type')
+    if task_type not in TASK_TYPES:
+        raise ValueError(f"неизвестный тип задачи {task_type!r}")
+    solution_type = str(record.get('solution_type') or 'text').strip()
+    if solution_type not in SOLUTION_TYPES:
+        raise ValueError(f"неизвестный тип решения {solution_type!r}")
+    task = {
+        'section': _text(record, 'section'),
+        'type': task_type,
+        'photo': _text(record, 'photo'),
+        'hint': _text(record, 'hint'),
+        'solution_data': _text(record, 'solution'),
+        'solution_type': solution_type,
+    }
+    if task_type == 'multiple_choice':
+        task['correct_choice'] = _text(record, 'correct_choice')
+        incorrect = record.get('incorrect_choices') or []
+        if not isinstance(incorrect, list):
+            raise ValueError("incorrect_choices должно быть списком")
+        incorrect = [str(choice).strip() for choice in incorrect if str(choice).strip()]
+        if len(incorrect) != INCORRECT_CHOICES:
+            raise ValueError(f"нужно {INCORRECT_CHOICES} неправильных варианта, указано {len(incorrect)}")
+        task['incorrect_choices'] = incorrect
+    else:
+        answer = _text(record, 'text_answer')
+        try:
+            task['text_answer'] = parse_numeric_answer(answer)
+        except ValueError:
+            raise ValueError(f"ответ должен быть числом: {answer!r}") from None
+    return task
+
+
+async def import_tasks(path, batch_size=BATCH_SIZE, check_only=False):
+    """Импортирует файл и возвращает отчет: сколько прочитано и добавлено, ошибки по строкам, скорость.
+
+    Ошибки валидации не останавливают импорт - такие строки пропускаются и попадают в отчет.
+    При check_only=True файл только проверяется, в БД ничего не пишется.
+    """
+    started = time.perf_counter()
+    report = {'total': 0, 'imported': 0, 'errors': [], 'sections': set()}
+    batch = []
+
+    async def write_batch():
+        if batch and not check_only:
+            await db.add_tasks_bulk(batch)
+            report['imported'] += len(batch)
+        batch.clear()
+
+    for line_no, record in read_records(path):
+        report['total'] += 1
+        if isinstance(record, str):
+            report['errors'].append((line_no, record))
+            continue
+        try:
+            task = validate_record(record)
+        except ValueError as e:
+            report['errors'].append((line_no, str(e)))
+            continue
+        report['sections'].add(task['section'])
+        batch.append(task)
+        if len(batch) >= batch_size:
+            await write_batch()
+    await write_batch()
+
+    report['seconds'] = time.perf_counter() - started
+    report['rate'] = report['total'] / report['seconds'] if report['seconds'] else 0.0
+    return report
+
+
+def format_report(report, max_errors=None):
+    errors = report['errors']
+    text = (f"Прочитано записей: {report['total']}\n"
+            f"Добавлено задач: {report['imported']}\n"
+            f"Разделов в файле: {len(report['sections'])}\n"
+            f"Ошибок: {len(errors)}\n"
+            f"Время: {report['seconds']:.2f} с ({report['rate']:.0f} записей/с)")
+    shown = errors if max_errors is None else errors[:max_errors]
+    if shown:
+        text += "\n\n" + "\n".join(f"строка {line_no}: {message}" for line_no, message in shown)
+    if len(shown) < len(errors):
+        text += f"\n... и еще {len(errors) - len(shown)}"
+    return text
+
+
+async def _main(path, batch_size, check_only):
+    await db.create_tables()
+    report = await import_tasks(path, batch_size, check_only)
+    print(format_report(report))
+    return 1 if report['errors'] else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Импорт задач из JSONL или CSV")
+    parser.add_argument("path", help="файл .jsonl или .csv")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="задач в одной транзакции")
+    parser.add_argument("--check", action="store_true", help="только проверить файл, ничего не записывая")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(_main(args.path, args.batch, args.check)))
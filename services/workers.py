@@ -0,0 +1,217 @@
+# services/workers.py
+"""Многопроцессный режим: фронт принимает апдейты, воркеры их обрабатывают.
+
+Фронт-процесс получает апдейты long polling'ом или через webhook и, не разбирая
+их в объекты aiogram, отправляет каждый в один из BOT_WORKERS процессов по id
+пользователя. Все апдейты одного пользователя попадают в один воркер и
+обрабатываются им строго по очереди, поэтому порядок сообщений и состояние FSM
+пользователя не расходятся между процессами.
+
+Общее состояние живет в БД (WAL, запись через BEGIN IMMEDIATE), а кэши воркеров
+сверяются с ней: каталог и индекс задач - по версии каталога, рейтинг -
+перечитыванием раз в LEADERBOARD_RELOAD_INTERVAL секунд. Фоновые задачи
+(продолжение рассылок, аналитика по классу, напоминания) запускает только
+воркер 0. Упавший воркер фронт перезапускает; апдейты, которые он обрабатывал
+в момент падения, теряются.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+
+import aiohttp
+from aiohttp import web
+
+TELEGRAM_API = "https://api.telegram.org"
+
+
+def update_user_id(update):
+    """id пользователя из сырого апдейта (dict), а если его нет - id чата; None, если нет и чата."""
+    for key, event in update.items():
+        if key == "update_id" or not isinstance(event, dict):
+            continue
+        user = event.get("from") or event.get("user")
+        if user:
+            return user["id"]
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+    return None
+
+
+def worker_index(update, workers):
+    """Номер воркера для апдейта: один и тот же для всех апдейтов пользователя."""
+    key = update_user_id(update)
+    if key is None:
+        key = update.get("update_id", 0)
+    return key % workers
+
+
+class WorkerPool:
+    """Процессы-воркеры и по одной очереди апдейтов на каждый.
+
+    target(index, queue) - точка входа процесса; она должна быть функцией
+    уровня модуля, так как процессы запускаются через spawn. Если очередь
+    воркера заполнена, route() ждет места - в режиме polling это притормаживает
+    getUpdates, в режиме webhook - ответ Telegram.
+    """
+
+    def __init__(self, workers, target, queue_size=10000):
+        self.target = target
+        self._context = multiprocessing.get_context("spawn")
+        self.queues = [self._context.Queue(queue_size) for _ in range(workers)]
+        self.processes = [None] * workers
+        self.routed = [0] * workers
+        self._watchdog = None
+
+    def _spawn(self, index):
+        process = self._context.Process(
+            target=self.target, args=(index, self.queues[index]), name=f"bot-worker-{index}", daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        for index in range(len(self.queues)):
+            self._spawn(index)
+        self._watchdog = asyncio.create_task(self._watch())
+        logging.info("Запущено воркеров: %d", len(self.processes))
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(1)
+            for index, process in enumerate(self.processes):
+                if not process.is_alive():
+                    logging.error("Воркер %d завершился с кодом %s, перезапускаем", index, process.exitcode)
+                    self._spawn(index)
+
+    async def route(self, update):
+        index = worker_index(update, len(self.queues))
+        target = self.queues[index]
+        try:
+            target.put_nowait(update)
+        except queue.Full:
+            await asyncio.get_running_loop().run_in_executor(None, target.put, update)
+        self.routed[index] += 1
+
+    async def stop(self, timeout=30):
+        """Просит воркеры дообработать очередь и завершиться; не успевшие за timeout секунд - снимает."""
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+            await asyncio.gather(self._watchdog, return_exceptions=True)
+            self._watchdog = None
+        loop = asyncio.get_running_loop()
+        for target in self.queues:
+            await loop.run_in_executor(None, target.put, None)
+        for index, process in enumerate(self.processes):
+            if process is None:
+                continue
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                logging.warning("Воркер %d не завершился за %s с, останавливаем принудительно", index, timeout)
+                process.terminate()
+        logging.info("Воркеры остановлены, распределено апдейтов: %s", self.routed)
+
+
+async def serve_worker(dp, bot, updates, concurrency=64, backlog=None):
+    """Цикл процесса-воркера: читает апдейты из очереди фронта и передает их диспетчеру.
+
+    Апдейты разных пользователей обрабатываются параллельно (не больше
+    concurrency сразу), апдейты одного пользователя - по одному, в порядке
+    поступления. Слот обработки апдейт занимает, только дождавшись предыдущего
+    апдейта того же пользователя, поэтому один пользователь, присылающий апдейты
+    пачками, не занимает все слоты. Принятых, но еще не обработанных апдейтов - не
+    больше backlog (по умолчанию 16 * concurrency), дальше ждут в очереди фронта.
+    None в очереди - сигнал дообработать начатое и выйти.
+    """
+    loop = asyncio.get_running_loop()
+    parent = os.getppid()
+    slots = asyncio.Semaphore(concurrency)
+    accepted = asyncio.Semaphore(backlog or 16 * concurrency)
+    chains = {}  # пользователь -> задача его последнего апдейта
+
+    async def process(key, update, previous):
+        try:
+            if previous is not None:
+                await asyncio.wait([previous])
+            async with slots:
+                await dp.feed_raw_update(bot, update)
+        except Exception:
+            pass  # диспетчер уже записал ошибку в лог
+        finally:
+            accepted.release()
+
+    def forget(key, task):
+        if chains.get(key) is task:
+            del chains[key]
+
+    await dp.emit_startup(bot=bot, bots=[bot], dispatcher=dp)
+    try:
+        while True:
+            await accepted.acquire()
+            try:
+                # Пока очередь не пуста, читаем без перехода в поток
+                update = updates.get_nowait()
+            except queue.Empty:
+                try:
+                    update = await loop.run_in_executor(None, updates.get, True, 1)
+                except queue.Empty:
+                    accepted.release()
+                    if os.getppid() != parent:
+                        logging.error("Фронт-процесс завершился, воркер останавливается")
+                        break
+                    continue
+            if update is None:
+                accepted.release()
+                break
+            key = update_user_id(update)
+            if key is None:
+                key = ("update", update.get("update_id"))
+            task = asyncio.create_task(process(key, update, chains.get(key)))
+            chains[key] = task
+            task.add_done_callback(lambda done, key=key: forget(key, done))
+        if chains:
+            await asyncio.wait(list(chains.values()))
+    finally:
+        await dp.emit_shutdown(bot=bot, bots=[bot], dispatcher=dp)
+
+
+async def poll_updates(token, route, allowed_updates=None, api_url="", timeout=30):
+    """Long polling без разбора апдейтов в объекты aiogram: каждый апдейт как dict уходит в route()."""
+    url = f"{api_url or TELEGRAM_API}/bot{token}/getUpdates"
+    offset = None
+    async with aiohttp.ClientSession() as session:
+        while True:
+            params = {"timeout": timeout, "allowed_updates": allowed_updates or []}
+            if offset is not None:
+                params["offset"] = offset
+            try:
+                async with session.post(url, json=params, timeout=aiohttp.ClientTimeout(total=timeout + 10)) as response:
+                    data = await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logging.warning("Ошибка getUpdates: %r", e)
+                await asyncio.sleep(1)
+                continue
+            if not data.get("ok"):
+                retry_after = (data.get("parameters") or {}).get("retry_after", 1)
+                logging.warning("getUpdates вернул ошибку: %s", data.get("description"))
+                await asyncio.sleep(retry_after)
+                continue
+            for update in data["result"]:
+                offset = update["update_id"] + 1
+                await route(update)
+
+
+def create_front_app(route, path, secret):
+    """aiohttp-приложение фронта для режима webhook: проверяет секрет и передает апдейт в route()."""
+
+    async def receive(request):
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+            return web.Response(status=401)
+        await route(await request.json())
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(path, receive)
+    return app
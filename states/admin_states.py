@@ -22,4 +22,10 @@ class AddTask(StatesGroup):
 
 class Broadcast(StatesGroup):
     waiting_for_message = State()
-    confirming = State()
\ No newline at end of file
+    confirming = State()
+
+class StudentSearch(StatesGroup):
+    waiting_for_query = State()
+
+class TaskImport(StatesGroup):
+    waiting_for_file = State()
\ No newline at end of file